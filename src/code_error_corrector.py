@@ -1,3 +1,4 @@
+import asyncio
 import os
 from textwrap import dedent
 from typing import List
@@ -5,7 +6,10 @@ from typing import List
 import config
 import utils
 from data_accessors.base_data_accessor import BaseDataAccessor
+from data_profilers.column_ranker import describe_for_question
+from data_profilers.value_index import describe_value_mentions
 from llms.base_llm import BaseLLM
+from llms.usage import llm_caller
 from schema.execution_error_history import ExecutionErrorHistoryItem
 
 logger = utils.get_logger(__name__)
@@ -42,31 +46,65 @@ class CodeErrorCorrector:
 ```
 """
 
-    def correct(self, data_accessor: BaseDataAccessor, query: str, error_history: List[ExecutionErrorHistoryItem]):
-        data_summary = data_accessor.get_data_summary()
-        prompt_tmpl = self._load_err_correction_propmt_tmpl(data_accessor)
-
+    def _get_lang(self, data_accessor: BaseDataAccessor):
         if data_accessor.get_type() == 'mysql':
-            lang = 'sql'
+            return 'sql'
         elif data_accessor.get_type() == 'python':
-            lang = 'python'
+            return 'python'
         else:
             raise ValueError(f"暂时不支持{data_accessor.get_type()}类型的数据")
 
+    def build_prompt(self, data_accessor: BaseDataAccessor, query: str, error_history: List[ExecutionErrorHistoryItem]):
+        data_summary = data_accessor.get_data_summary()
+        prompt_tmpl = self._load_err_correction_propmt_tmpl(data_accessor)
+
+        lang = self._get_lang(data_accessor)
+
         error_history_part = ''
         for hist in error_history:
             error_history_part += self._build_error_history_prompt(hist, lang)
 
+        data_info = describe_for_question(data_summary, query)
+        value_mentions = describe_value_mentions(data_accessor.get_value_index(), query)
+        if value_mentions:
+            data_info += '\n\n' + value_mentions
+
         prompt = prompt_tmpl.replace(
-            '{{data_info}}', data_summary.description
+            '{{data_info}}', data_info
         ).replace(
             '{{question}}', query
         ).replace(
             '{{error_history}}', error_history_part
         )
         logger.info(f"prompt: {prompt}")
+        return prompt
+
+    def _parse_response(self, resp: str, lang: str):
+        code = utils.find_code_block(resp, lang)
+        if code is None:
+            code = utils.extract_code(resp, lang)
+        return code
 
-        raw_rewritten_code = self._llm.chat_with_retry(prompt)
-        rewritten_code = utils.extract_code(raw_rewritten_code, lang)
+    def correct(self, data_accessor: BaseDataAccessor, query: str, error_history: List[ExecutionErrorHistoryItem]):
+        prompt = self.build_prompt(data_accessor, query, error_history)
+        lang = self._get_lang(data_accessor)
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                # 代码块闭合后即停止接收，不等待其后的说明文字
+                raw_rewritten_code = self._llm.stream_until(prompt, lambda resp: utils.find_code_block(resp, lang) is not None)
+            else:
+                raw_rewritten_code = self._llm.chat_with_retry(prompt)
+        return self._parse_response(raw_rewritten_code, lang)
 
-        return rewritten_code
+    async def acorrect(self, data_accessor: BaseDataAccessor, query: str, error_history: List[ExecutionErrorHistoryItem]):
+        """
+        correct 的异步版本，等待LLM时不阻塞事件循环
+        """
+        prompt = await asyncio.to_thread(self.build_prompt, data_accessor, query, error_history)
+        lang = self._get_lang(data_accessor)
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                raw_rewritten_code = await self._llm.astream_until(prompt, lambda resp: utils.find_code_block(resp, lang) is not None)
+            else:
+                raw_rewritten_code = await self._llm.achat_with_retry(prompt)
+        return self._parse_response(raw_rewritten_code, lang)
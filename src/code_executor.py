@@ -1,3 +1,4 @@
+import asyncio
 import traceback
 from typing import Optional
 
@@ -16,6 +17,40 @@ class CodeExecutor:
         self.llm = llm
         self.data_accessor = data_accessor
         self.logger = utils.get_logger(self.__class__.__name__)
+        # 最近一次执行的结果：是否成功、纠错次数、最终执行成功的代码
+        self.succeeded = False
+        self.correction_count = 0
+        self.final_code = None
+
+    def _begin(self) -> int:
+        """
+        开始一次执行：重置执行结果
+        :return: 最大纠错次数
+        """
+        max_retry_count = config.get_config()['max_retry_execution_count']
+        self.logger.info(f"max_retry_execution_count: {max_retry_count}")
+        self.succeeded = False
+        self.final_code = None
+        return max_retry_count
+
+    def _on_success(self, code):
+        self.succeeded = True
+        self.final_code = code
+
+    def _on_failure(self, code, e: Exception, error_history_list: list, max_retry_count: int) -> bool:
+        """
+        记录执行失败
+        :return: 是否还需要纠错，纠错次数用完时为 False
+        """
+        self.logger.warning(f"retry_count: {len(error_history_list)}\ncode: {code}\nexception:\n: {traceback.format_exc()}")
+        if len(error_history_list) + 1 > max_retry_count:
+            return False
+        error_history_list.append(ExecutionErrorHistoryItem(code=code, e=e))
+        return True
+
+    def _on_rewritten(self, rewritten_code: str) -> str:
+        self.logger.error(f"rewritten_code:\n {rewritten_code}")
+        return rewritten_code
 
     def execute(self, question, code) -> pd.DataFrame:
         """
@@ -28,9 +63,7 @@ class CodeExecutor:
         - pd.DataFrame({'Actual': y_test, 'Predicted': predictions})
         - result_df
         """
-        max_retry_count = config.get_config()['max_retry_execution_count']
-        self.logger.info(f"max_retry_execution_count: {max_retry_count}")
-
+        max_retry_count = self._begin()
         code_err_corrector = CodeErrorCorrector(self.llm)
         error_history_list = []
         ans_df = pd.DataFrame([])
@@ -38,15 +71,36 @@ class CodeExecutor:
         while len(error_history_list) <= max_retry_count:
             try:
                 ans_df = self.data_accessor.execute(code)
+                self._on_success(code)
                 break
             except Exception as e:
-                self.logger.warning(f"retry_count: {len(error_history_list)}\ncode: {code}\nexception:\n: {traceback.format_exc()}")
-
-                if len(error_history_list) + 1 > max_retry_count:
+                if not self._on_failure(code, e, error_history_list, max_retry_count):
                     break
+            code = self._on_rewritten(code_err_corrector.correct(self.data_accessor, question, error_history_list))
+        self.correction_count = len(error_history_list)
+        return ans_df
 
-                error_history_list.append(ExecutionErrorHistoryItem(code=code, e=e))
-                rewritten_code = code_err_corrector.correct(self.data_accessor, question, error_history_list)
-                self.logger.error(f"rewritten_code:\n {rewritten_code}")
-                code = rewritten_code
+    async def aexecute(self, question, code, first_error: Optional[Exception] = None) -> pd.DataFrame:
+        """
+        execute 的异步版本：代码在工作线程中执行，纠错时异步等待LLM，均不阻塞事件循环
+        :param first_error: 已知 code 执行时的异常（如分步执行时某一步已失败），直接进入纠错，不再重复执行
+        """
+        max_retry_count = self._begin()
+        code_err_corrector = CodeErrorCorrector(self.llm)
+        error_history_list = []
+        ans_df = pd.DataFrame([])
+
+        while len(error_history_list) <= max_retry_count:
+            try:
+                if first_error is not None:
+                    error, first_error = first_error, None
+                    raise error
+                ans_df = await asyncio.to_thread(self.data_accessor.execute, code)
+                self._on_success(code)
+                break
+            except Exception as e:
+                if not self._on_failure(code, e, error_history_list, max_retry_count):
+                    break
+            code = self._on_rewritten(await code_err_corrector.acorrect(self.data_accessor, question, error_history_list))
+        self.correction_count = len(error_history_list)
         return ans_df
@@ -1,49 +1,124 @@
+import asyncio
 import os
 from datetime import datetime
+from typing import Optional
 
 import config
 import utils
 from data_accessors.dataframe_accessor import DataFrameAccessor
+from data_profilers.column_ranker import describe_for_question
+from data_profilers.value_index import describe_value_mentions
 from llms.base_llm import BaseLLM
+from llms.usage import llm_caller
+from retrieval.code_store import CodeStore
+from retrieval.few_shot import describe_examples, select_examples
 from schema.data_summary import DataSummary
 
 class PythonGenerator:
-    def __init__(self, data_accessor: DataFrameAccessor, llm: BaseLLM):
+    # 代码生成Prompt模板的版本，对应 data/prompts/code_gen/python/ 下的文件名
+    prompt_version = "v1"
+
+    def __init__(self, data_accessor: DataFrameAccessor, llm: BaseLLM, code_store: Optional[CodeStore] = None):
+        """
+        :param code_store: 已验证代码的存储，提供时检索相似问题的代码作为参考示例
+        """
         self.llm = llm
         self.data_accessor = data_accessor
+        self.code_store = code_store
         self.df = data_accessor.dataframe
         self.logger = utils.get_logger(self.__class__.__name__)
+        # 最近一次生成代码使用的Prompt，缓存的响应被证明有误时用于删除缓存
+        self.last_prompt = None
+        # 最近一次生成代码时Prompt中的参考示例数
+        self.example_count = 0
 
     def _load_prompt_tmpl(self):
-        version = "v1"
+        version = self.prompt_version
         with open(os.path.join(config.proj_root, 'data', 'prompts', 'code_gen', 'python', f"{version}.md"), encoding='utf-8') as f:
             prompt_tmpl = f.read()
         return prompt_tmpl
 
     def _build_prompt(self, question: str, data_summary: DataSummary):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 只精确到日期，同一天内相同的问题生成相同的Prompt，可以命中LLM响应缓存
+        current_time = datetime.now().strftime("%Y-%m-%d")
+
+        data_info = describe_for_question(data_summary, question)
+        value_mentions = describe_value_mentions(self.data_accessor.get_value_index(), question)
+        if value_mentions:
+            data_info += '\n\n' + value_mentions
+
+        examples = select_examples(self.code_store, question, data_summary.columns)
+        self.example_count = len(examples)
 
         prompt = self._load_prompt_tmpl().replace(
             '{{question}}', question
         ).replace(
             '{{current_time}}', current_time
         ).replace(
-            '{{data_info}}', data_summary.description
+            '{{data_info}}', data_info
+        ).replace(
+            '{{examples}}', describe_examples(examples)
         )
 
         return prompt
 
-    def generate_code(self, question: str):
+    def build_prompt(self, question: str):
         data_summary = self.data_accessor.get_data_summary()
-        df = self.df
-
         prompt = self._build_prompt(question, data_summary)
 
         self.logger.info('propmt:\n')
         self.logger.info(prompt)
+        return prompt
 
-        resp = self.llm.chat_with_retry(prompt)
+    @staticmethod
+    def _is_code_complete(resp: str) -> bool:
+        """
+        流式输出中代码块已闭合时停止接收，代码之后的说明文字不影响执行
+        """
+        return utils.find_code_block(resp, lang='python') is not None
+
+    def _parse_response(self, resp: str):
         self.logger.info(f'generated code raw_resp:\n{resp}')
-        code = utils.extract_code(resp, lang='python')
+        code = utils.find_code_block(resp, lang='python')
+        if code is None:
+            code = utils.extract_code(resp, lang='python')
         self.logger.info(f'generated code:\n{code}')
         return code
+
+    def generate_code(self, question: str):
+        prompt = self.build_prompt(question)
+        self.last_prompt = prompt
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                resp = self.llm.stream_until(prompt, self._is_code_complete, use_cache=True)
+            else:
+                resp = self.llm.chat_with_retry(prompt, use_cache=True)
+        return self._parse_response(resp)
+
+    async def agenerate_code(self, question: str):
+        """
+        generate_code 的异步版本：数据探查、构建Prompt在工作线程中进行，等待LLM时不阻塞事件循环
+        """
+        prompt = await asyncio.to_thread(self.build_prompt, question)
+        self.last_prompt = prompt
+        return await self.agenerate_code_from_prompt(prompt)
+
+    async def agenerate_code_from_prompt(self, prompt: str, use_cache: bool = True, **kwargs):
+        """
+        按已构建的Prompt生成代码，同一Prompt生成多份候选代码时使用
+        :param use_cache: 是否使用LLM响应缓存
+        :param kwargs: 本次调用的生成参数，如 temperature
+        """
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                resp = await self.llm.astream_until(prompt, self._is_code_complete, use_cache=use_cache, **kwargs)
+            else:
+                resp = await self.llm.achat_with_retry(prompt, use_cache=use_cache, **kwargs)
+        return self._parse_response(resp)
+
+    def discard_cached_response(self):
+        """
+        生成的代码需要纠错才能执行成功时，删除其缓存的响应，避免后续请求复用有误的代码
+        """
+        if self.last_prompt is not None:
+            self.llm.discard_cached_response(self.last_prompt)
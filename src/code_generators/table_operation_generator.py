@@ -1,11 +1,31 @@
+import asyncio
 import os
 from datetime import datetime
 from typing import List
 
 import config
 import utils
+from data_accessors.base_data_accessor import BaseDataAccessor
 from data_accessors.dataframe_accessor import DataFrameAccessor
+from data_profilers.join_keys import describe_join_key_candidates, find_join_key_candidates
 from llms.base_llm import BaseLLM
+from llms.usage import llm_caller
+
+
+def describe_join_keys(data_accessors: List[BaseDataAccessor]) -> str:
+    """
+    多个输入文件时，估算列之间的取值重合度，给出候选关联键说明
+    """
+    join_config = config.get_config().get('data_profile', {}).get('join_keys', {})
+    if len(data_accessors) < 2 or not join_config.get('enabled', True):
+        return ''
+
+    candidates = find_join_key_candidates(
+        [accessor.get_column_signatures() for accessor in data_accessors],
+        min_overlap=join_config.get('min_overlap', 0.5),
+        top_k=join_config.get('top_k', 5)
+    )
+    return describe_join_key_candidates(candidates)
 
 
 class TableOperationGenerator:
@@ -20,6 +40,8 @@ class TableOperationGenerator:
         self.llm = llm
         self.data_accessors = data_accessors
         self.logger = utils.get_logger(self.__class__.__name__)
+        # 最近一次生成代码使用的Prompt，缓存的响应被证明有误时用于删除缓存
+        self.last_prompt = None
 
     def _load_prompt_tmpl(self):
         version = "v1"
@@ -31,7 +53,8 @@ class TableOperationGenerator:
         return prompt_tmpl
 
     def _build_prompt(self, instruction: str, input_paths: List[str], output_path: str):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 只精确到日期，同一天内相同的问题生成相同的Prompt，可以命中LLM响应缓存
+        current_time = datetime.now().strftime("%Y-%m-%d")
 
         # 构建所有输入数据的描述
         data_info_parts = []
@@ -39,6 +62,10 @@ class TableOperationGenerator:
             data_summary = accessor.get_data_summary()
             data_info_parts.append(f"### 输入文件 {i+1}: {input_paths[i]}\n{data_summary.description}")
         
+        join_keys_info = describe_join_keys(self.data_accessors)
+        if join_keys_info:
+            data_info_parts.append(join_keys_info)
+
         data_info = "\n\n".join(data_info_parts)
         input_paths_str = "\n".join([f"- {p}" for p in input_paths])
 
@@ -68,14 +95,54 @@ class TableOperationGenerator:
         Returns:
             生成的Python代码
         """
+        prompt = self.build_prompt(instruction, input_paths, output_path)
+        self.last_prompt = prompt
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                resp = self.llm.stream_until(prompt, self._is_code_complete, use_cache=True)
+            else:
+                resp = self.llm.chat_with_retry(prompt, use_cache=True)
+        return self._parse_response(resp)
+
+    async def agenerate_code(self, instruction: str, input_paths: List[str], output_path: str):
+        """
+        generate_code 的异步版本：构建Prompt在工作线程中进行，等待LLM时不阻塞事件循环
+        """
+        prompt = await asyncio.to_thread(self.build_prompt, instruction, input_paths, output_path)
+        self.last_prompt = prompt
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                resp = await self.llm.astream_until(prompt, self._is_code_complete, use_cache=True)
+            else:
+                resp = await self.llm.achat_with_retry(prompt, use_cache=True)
+        return self._parse_response(resp)
+
+    def discard_cached_response(self):
+        """
+        生成的代码需要纠错才能执行成功时，删除其缓存的响应，避免后续请求复用有误的代码
+        """
+        if self.last_prompt is not None:
+            self.llm.discard_cached_response(self.last_prompt)
+
+    def build_prompt(self, instruction: str, input_paths: List[str], output_path: str):
         prompt = self._build_prompt(instruction, input_paths, output_path)
 
         self.logger.info('prompt:\n')
         self.logger.info(prompt)
+        return prompt
+
+    @staticmethod
+    def _is_code_complete(resp: str) -> bool:
+        """
+        流式输出中代码块已闭合时停止接收，代码之后的说明文字不影响执行
+        """
+        return utils.find_code_block(resp, lang='python') is not None
 
-        resp = self.llm.chat_with_retry(prompt)
+    def _parse_response(self, resp: str):
         self.logger.info(f'generated code raw_resp:\n{resp}')
-        code = utils.extract_code(resp, lang='python')
+        code = utils.find_code_block(resp, lang='python')
+        if code is None:
+            code = utils.extract_code(resp, lang='python')
         self.logger.info(f'generated code:\n{code}')
         return code
 
@@ -1,6 +1,4 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
-from textwrap import dedent
 
 import utils
 
@@ -29,6 +27,24 @@ class BaseDataAccessor(ABC):
     def get_data_summary(self):
         pass
 
+    def get_schema_summary(self):
+        """
+        获取仅包含列名和字段类型的轻量摘要，子类可以重写此方法以避免完整的数据探查
+        """
+        return self.get_data_summary()
+
+    def get_value_index(self):
+        """
+        获取取值倒排索引，用于定位问题中提及的取值所在的列，子类可以重写此方法
+        """
+        return None
+
+    def get_column_signatures(self):
+        """
+        获取各列取值集合的 MinHash 签名，用于多表关联键发现，子类可以重写此方法
+        """
+        return {}
+
     def get_quality_summary(self):
         """
         获取数据质量摘要，子类可以重写此方法
@@ -49,43 +65,32 @@ class BaseDataAccessor(ABC):
         """
         raise NotImplementedError()
 
+    def has_quality_summary(self) -> bool:
+        """
+        数据质量摘要是否已计算完成（可直接获取，无需等待），子类可以重写此方法
+        """
+        return False
+
+    @property
+    def structure_description(self):
+        """
+        生成数据结构描述（列名、类型、典型取值、取值范围），不包含质量概况
+        """
+        # 结构信息由数据摘要渲染（带缓存和token预算）
+        return self.get_data_summary().description
+
     @property
     def description(self):
         """
         生成完整的数据描述，包含数据结构和质量概况
         """
-        data_summary = self.get_data_summary()
-        data_descriptions = []
-        
-        for col in data_summary.columns:
-            values = data_summary.column_values[col][:15]
-            # 非字符串类型的，只预览5个值
-            value_range_info = ''
-
-            columns_description = data_summary.column_descriptions.get(col, '')
-            if columns_description != '':
-                columns_description = f"列名含义：{columns_description}\n"
-
-            if data_summary.dtypes[col] != 'string' and col in data_summary.column_min_values:
-                values = values[:3]
-                value_range_info = f"最小取值：{data_summary.column_min_values[col]}\n最大取值：{data_summary.column_max_values[col]}"
-
-            data_info = dedent(f"""
-                ------
-                列名：{col}
-                典型取值：{values}
-                字段类型：{data_summary.dtypes[col]}
-                """) + columns_description + value_range_info
-            data_descriptions.append(data_info)
-
-        table_description = data_summary.table_description
-        if table_description is not None and table_description.strip() != '':
-            table_description = f"表格描述：{table_description}\n"
-
-        structure_info = table_description + '\n'.join(data_descriptions).strip()
-
-        quality_description = self.get_quality_description()
-        
+        return self.compose_description(self.structure_description, self.get_quality_description())
+
+    @staticmethod
+    def compose_description(structure_info: str, quality_description: str) -> str:
+        """
+        拼接数据结构描述和质量概况
+        """
         if quality_description:
             final_data_info = f"""## 📋 数据结构信息
 
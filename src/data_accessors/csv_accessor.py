@@ -3,7 +3,10 @@ from typing import Optional
 import pandas as pd
 from pandas import DataFrame
 
+import config
+from data_accessors.csv_format import DEFAULT_ENCODINGS, CsvFormat, remember_csv_format, sniff_csv_format
 from data_accessors.dataframe_accessor import DataFrameAccessor
+from data_accessors.remote_csv import is_remote_path, sniff_remote_csv_format
 
 
 class CSVAccessor(DataFrameAccessor):
@@ -12,9 +15,35 @@ class CSVAccessor(DataFrameAccessor):
 
         self.filepath = filepath
         self._df = df if df is not None else self.load_data(filepath)
-        self._data_summary = self.detect_data()
 
     @DataFrameAccessor.cached_data_loader
     def load_data(self, filepath, n_rows=None) -> DataFrame:
-        df = pd.read_csv(filepath)
-        return df
+        sniff_config = config.get_config().get('data_load', {}).get('csv_sniff', {})
+        encodings = sniff_config.get('encodings', DEFAULT_ENCODINGS)
+        sample_bytes = sniff_config.get('sample_bytes', 65536)
+        if is_remote_path(filepath):
+            csv_format = sniff_remote_csv_format(filepath, sample_bytes=sample_bytes, encodings=encodings)
+        else:
+            csv_format = sniff_csv_format(filepath, sample_bytes=sample_bytes, encodings=encodings)
+        self.logger.info(f"{filepath} csv format: encoding={csv_format.encoding}, sep={csv_format.sep!r}")
+
+        try:
+            return pd.read_csv(filepath, encoding=csv_format.encoding, sep=csv_format.sep)
+        except UnicodeDecodeError as e:
+            # 样本之后出现了不符合识别编码的字节，依次改用排在其后的候选编码
+            encodings = list(encodings)
+            fallback_encodings = encodings[encodings.index(csv_format.encoding) + 1:] if csv_format.encoding in encodings else []
+            for encoding in fallback_encodings:
+                try:
+                    df = pd.read_csv(filepath, encoding=encoding, sep=csv_format.sep)
+                except UnicodeDecodeError:
+                    continue
+                self.logger.warning(f"{filepath} failed to decode as {csv_format.encoding}, loaded as {encoding}")
+                if not is_remote_path(filepath):
+                    remember_csv_format(filepath, CsvFormat(encoding=encoding, sep=csv_format.sep))
+                return df
+            raise ValueError(f"CSV文件编码识别有误：{filepath} 无法按 {csv_format.encoding} 编码读取（{e}），"
+                             f"请转换为 UTF-8 编码后重试") from e
+        except pd.errors.ParserError as e:
+            raise ValueError(f"CSV文件解析失败：{filepath}（识别的编码 {csv_format.encoding}，分隔符 {csv_format.sep!r}），"
+                             f"请检查分隔符及引号是否一致：{e}") from e
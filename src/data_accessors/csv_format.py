@@ -0,0 +1,119 @@
+"""
+CSV 编码与分隔符识别
+
+导出的CSV文件常见 GBK/GB18030 编码、分号或制表符分隔，直接 pd.read_csv(filepath) 会在解析到一半时报错，
+或者整行被读成一列。这里在正式解析前读取文件开头的一段字节，识别编码和分隔符，
+并按文件指纹（路径、大小、修改时间）缓存识别结果，同一文件的后续请求不再重复识别。
+"""
+
+import csv
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+
+# 默认依次尝试的编码，GB18030 兼容 GBK/GB2312
+DEFAULT_ENCODINGS = ('utf-8', 'gb18030')
+# 候选分隔符
+DEFAULT_DELIMITERS = ',;\t|'
+
+_UTF8_BOM = b'\xef\xbb\xbf'
+_UTF16_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+
+@dataclass(frozen=True)
+class CsvFormat:
+    # 文件编码
+    encoding: str
+    # 分隔符
+    sep: str
+
+
+_format_cache: Dict[Tuple[str, int, float], CsvFormat] = {}
+_format_cache_lock = threading.Lock()
+
+
+def decode_sample(sample: bytes, encoding: str, complete: bool) -> str:
+    """
+    按指定编码解码样本，样本不是完整文件时丢弃最后一个换行之后的部分，避免截断的多字节字符导致解码失败
+    """
+    if not complete and b'\n' in sample:
+        sample = sample[:sample.rindex(b'\n') + 1]
+    return sample.decode(encoding)
+
+
+def detect_encoding(sample: bytes, complete: bool = False, encodings: Sequence[str] = DEFAULT_ENCODINGS) -> str:
+    """
+    识别样本的编码：优先根据BOM判断，否则返回第一个能无错解码样本的候选编码
+    :param sample: 文件开头的字节
+    :param complete: 样本是否为完整文件
+    :param encodings: 依次尝试的候选编码
+    :return:
+    """
+    if sample.startswith(_UTF8_BOM):
+        return 'utf-8-sig'
+    if sample.startswith(_UTF16_BOMS):
+        return 'utf-16'
+
+    for encoding in encodings:
+        try:
+            decode_sample(sample, encoding, complete)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"无法识别CSV文件编码，已尝试：{', '.join(encodings)}")
+
+
+def detect_delimiter(text: str, delimiters: str = DEFAULT_DELIMITERS) -> str:
+    """
+    识别分隔符，无法识别（如只有一列）时返回逗号
+    """
+    lines = [line for line in text.splitlines() if line.strip()][:50]
+    if not lines:
+        return ','
+    try:
+        return csv.Sniffer().sniff('\n'.join(lines), delimiters=delimiters).delimiter
+    except csv.Error:
+        pass
+
+    # Sniffer 要求各行分隔符数量一致，遇到带引号的换行等情况会失败，退回按表头中出现次数最多的候选分隔符判断
+    header = lines[0]
+    counts = {delimiter: header.count(delimiter) for delimiter in delimiters}
+    delimiter, count = max(counts.items(), key=lambda item: item[1])
+    return delimiter if count > 0 else ','
+
+
+def sniff_csv_format(filepath: str, sample_bytes: int = 65536, encodings: Sequence[str] = DEFAULT_ENCODINGS) -> CsvFormat:
+    """
+    读取文件开头的一段字节识别编码和分隔符，结果按文件指纹缓存
+    :param filepath:
+    :param sample_bytes: 参与识别的字节数
+    :param encodings: 依次尝试的候选编码
+    :return:
+    """
+    stat = os.stat(filepath)
+    fingerprint = (os.path.abspath(filepath), stat.st_size, stat.st_mtime)
+    with _format_cache_lock:
+        if fingerprint in _format_cache:
+            return _format_cache[fingerprint]
+
+    with open(filepath, 'rb') as f:
+        sample = f.read(sample_bytes)
+    complete = len(sample) >= stat.st_size
+
+    encoding = detect_encoding(sample, complete, encodings)
+    text = decode_sample(sample, encoding, complete)
+    csv_format = CsvFormat(encoding=encoding, sep=detect_delimiter(text))
+
+    with _format_cache_lock:
+        _format_cache[fingerprint] = csv_format
+    return csv_format
+
+
+def remember_csv_format(filepath: str, csv_format: CsvFormat):
+    """
+    更新文件的识别结果缓存（按识别结果解析失败、改用其他编码成功后调用）
+    """
+    stat = os.stat(filepath)
+    with _format_cache_lock:
+        _format_cache[(os.path.abspath(filepath), stat.st_size, stat.st_mtime)] = csv_format
@@ -1,37 +1,154 @@
 import threading
 from abc import abstractmethod
 from functools import wraps
-from typing import Optional, Callable, Dict, List, Any
+from typing import Optional, Callable, Dict, List, Any, Tuple
 
 import pandas as pd
 import numpy as np
 
+import config
 import utils
 from data_accessors.base_data_accessor import BaseDataAccessor
+from data_profilers.compaction import compact_dataframe, convert_string_columns, describe_compaction_report, is_dtype_error, restore_dtypes
+from data_profilers.duplicates import count_duplicate_rows
+from data_profilers.join_keys import compute_signatures
+from data_profilers.semantic_types import convert_semantic_types
+from data_profilers.value_index import ValueIndex
 from schema.data_summary import DataSummary
 
+# 在数据摘要中视为字符串的类型，category、string 为压缩或以 Arrow 存储的文本列
+STRING_DTYPES = ('object', 'category', 'string')
+
 
 class DataFrameAccessor(BaseDataAccessor):
+    # 随缓存数据一起保存的派生结果（取值索引等）：缓存key -> (数据版本, {名称: 结果})
+    _derived_cache: Dict[Any, tuple] = {}
+    _derived_lock = threading.Lock()
+    # 正在构建的派生结果的锁，同一结果同时只构建一次：(缓存key, 名称) -> 锁
+    _derived_build_locks: Dict[tuple, threading.Lock] = {}
+
     def __init__(self, df: pd.DataFrame, column_description: Optional[dict] = None):
         super().__init__()
         self._df = df
         self.column_description = column_description
-        self._data_summary = None
+        self._data_summary = None  # 首次访问时才进行数据探查
+        self._schema_summary = None
         self._quality_summary = None  # 缓存质量检查结果
+        self._summary_lock = threading.Lock()
+        # 记录 (缓存key, 数据版本)，用于关联派生结果；数据版本为本地文件的修改时间或远程文件的 ETag/Last-Modified
+        self._data_fingerprint = None
+        self._local_derived = {}
 
     def get_data_summary(self):
+        if self._data_summary is None:
+            with self._summary_lock:
+                if self._data_summary is None:
+                    self._data_summary = self.detect_data()
         return self._data_summary
 
+    def get_schema_summary(self) -> DataSummary:
+        """
+        仅包含列名和字段类型的轻量摘要，不统计取值，已完成完整探查时直接复用
+        """
+        if self._data_summary is not None:
+            return self._data_summary
+        if self._schema_summary is None:
+            ds_df = self._df
+            dtypes = {col: str(ds_df[col].dtype) for col in ds_df}
+            self._schema_summary = DataSummary(
+                columns=ds_df.columns.tolist(),
+                dtypes={col: 'string' if dtype in STRING_DTYPES else dtype for col, dtype in dtypes.items()},
+                column_values={col: [] for col in ds_df.columns},
+                column_descriptions=self.column_description if self.column_description else {},
+                table_description='',
+                column_min_values={},
+                column_max_values={},
+                semantic_types=dict(ds_df.attrs.get('semantic_types', {})),
+                datetime_formats=dict(ds_df.attrs.get('datetime_formats', {}))
+            )
+        return self._schema_summary
+
+    def _get_derived_store(self) -> Tuple[Any, dict]:
+        """
+        :return: (缓存key, 派生结果存储)
+        """
+        if self._data_fingerprint is None:
+            # 无法确定版本的数据（如直接传入的DataFrame、不返回 ETag/Last-Modified 的远程文件），只在当前实例内复用
+            return ('local', id(self)), self._local_derived
+        cache_key, version = self._data_fingerprint
+        with self._derived_lock:
+            entry = self._derived_cache.get(cache_key)
+            if entry is None or entry[0] != version:
+                entry = (version, {})
+                self._derived_cache[cache_key] = entry
+        return cache_key, entry[1]
+
+    def get_derived_data(self, name: str, builder: Callable[[], Any]) -> Any:
+        """
+        获取随缓存数据一起保存的派生结果，同一文件的多次请求之间复用，文件修改后重新构建；
+        多个线程同时请求同一结果时只构建一次
+        :param name: 派生结果名称
+        :param builder: 缓存未命中时用于构建结果的函数
+        :return:
+        """
+        cache_key, store = self._get_derived_store()
+        if name in store:
+            return store[name]
+
+        build_key = (cache_key, name)
+        with self._derived_lock:
+            build_lock = self._derived_build_locks.setdefault(build_key, threading.Lock())
+        with build_lock:
+            if name not in store:
+                store[name] = builder()
+        with self._derived_lock:
+            self._derived_build_locks.pop(build_key, None)
+        return store[name]
+
+    def peek_derived_data(self, name: str) -> Any:
+        """
+        获取已构建的派生结果，尚未构建时返回 None，不触发构建
+        """
+        return self._get_derived_store()[1].get(name)
+
+    def get_value_index(self) -> Optional[ValueIndex]:
+        index_config = config.get_config().get('data_profile', {}).get('value_index', {})
+        if not index_config.get('enabled', True):
+            return None
+
+        def build():
+            value_index = ValueIndex.build(
+                self._df,
+                max_distinct=index_config.get('max_distinct_per_column', 10000),
+                max_length=index_config.get('max_value_length', 30)
+            )
+            self.logger.info(f"value index built, {len(value_index)} values")
+            return value_index
+
+        return self.get_derived_data('value_index', build)
+
+    def get_column_signatures(self) -> Dict[str, Any]:
+        """
+        获取各列取值集合的 MinHash 签名，用于多表关联键发现
+        """
+        num_perm = config.get_config().get('data_profile', {}).get('join_keys', {}).get('num_perm', 64)
+        return self.get_derived_data(f'column_signatures_{num_perm}', lambda: compute_signatures(self._df, num_perm=num_perm))
+
     def get_quality_summary(self) -> Dict[str, Any]:
         """
-        获取数据质量摘要
+        获取数据质量摘要，结果随缓存数据保存，同一文件的后续请求直接复用
         
         Returns:
             包含质量评级、缺失值、重复行、问题列等信息的字典
         """
-        if self._quality_summary is not None:
-            return self._quality_summary
-        
+        if self._quality_summary is None:
+            self._quality_summary = self.get_derived_data('quality_summary', self._build_quality_summary)
+        return self._quality_summary
+
+    def has_quality_summary(self) -> bool:
+        return self._quality_summary is not None or self.peek_derived_data('quality_summary') is not None
+
+    def _build_quality_summary(self) -> Dict[str, Any]:
         df = self._df
         if df is None or len(df) == 0:
             return {
@@ -61,16 +178,22 @@ class DataFrameAccessor(BaseDataAccessor):
                     "missing_count": int(df[col].isnull().sum())
                 })
         
-        # 重复行检测
-        duplicate_rows = df.duplicated().sum()
+        # 重复行检测（基于行哈希，避免 df.duplicated() 构造大量中间元组）
+        profile_config = config.get_config().get('data_profile', {})
+        duplicate_summary = count_duplicate_rows(
+            df,
+            method=profile_config.get('duplicate_method', 'exact'),
+            sample_rows=profile_config.get('duplicate_sample_rows', 1_000_000)
+        )
+        duplicate_rows = duplicate_summary.duplicate_rows
         duplicate_rate = (duplicate_rows / total_rows * 100) if total_rows > 0 else 0
         
         # 数据类型分析
         dtype_summary = {
             "numeric": len(df.select_dtypes(include=[np.number]).columns),
-            "string": len(df.select_dtypes(include=['object']).columns),
+            "string": len(df.select_dtypes(include=list(STRING_DTYPES)).columns),
             "datetime": len(df.select_dtypes(include=['datetime64']).columns),
-            "other": len(df.columns) - len(df.select_dtypes(include=[np.number, 'object', 'datetime64']).columns)
+            "other": len(df.columns) - len(df.select_dtypes(include=[np.number, 'datetime64', *STRING_DTYPES]).columns)
         }
         
         # 异常值检测（仅数值列，使用 IQR 方法）
@@ -135,7 +258,7 @@ class DataFrameAccessor(BaseDataAccessor):
         else:
             quality_level = "🔴 需关注"
         
-        self._quality_summary = {
+        return {
             "quality_level": quality_level,
             "quality_score": max(0, round(quality_score, 1)),
             "total_rows": total_rows,
@@ -148,7 +271,9 @@ class DataFrameAccessor(BaseDataAccessor):
             },
             "duplicates": {
                 "duplicate_rows": int(duplicate_rows),
-                "duplicate_rate": round(duplicate_rate, 2)
+                "duplicate_rate": round(duplicate_rate, 2),
+                "detection_method": duplicate_summary.method,
+                "estimated": duplicate_summary.estimated
             },
             "dtype_summary": dtype_summary,
             "outliers": {
@@ -159,8 +284,6 @@ class DataFrameAccessor(BaseDataAccessor):
             "issues": issues,
             "recommendations": recommendations
         }
-        
-        return self._quality_summary
 
     def get_quality_description(self) -> str:
         """
@@ -173,7 +296,7 @@ class DataFrameAccessor(BaseDataAccessor):
 - **质量评级**: {quality['quality_level']} (评分: {quality['quality_score']}/100)
 - **数据规模**: {quality['total_rows']:,} 行 × {quality['total_columns']} 列
 - **缺失率**: {quality['missing']['missing_rate']:.2f}% ({quality['missing']['total_missing']:,}/{quality['total_cells']:,})
-- **重复行**: {quality['duplicates']['duplicate_rows']:,} 行 ({quality['duplicates']['duplicate_rate']:.2f}%)
+- **重复行**: {'约 ' if quality['duplicates']['estimated'] else ''}{quality['duplicates']['duplicate_rows']:,} 行 ({quality['duplicates']['duplicate_rate']:.2f}%)
 """
         
         # 数据类型分布
@@ -215,7 +338,7 @@ class DataFrameAccessor(BaseDataAccessor):
                 row[k] = utils.process_df_value(row[k])
 
         dtypes = {col: str(ds_df[col].dtype) for col in ds_df}
-        dtypes = {col: 'string' if dtype == 'object' else dtype for col, dtype in dtypes.items()}
+        dtypes = {col: 'string' if dtype in STRING_DTYPES else dtype for col, dtype in dtypes.items()}
         # 按频率统计
         column_values = {col: [utils.process_df_value(v) for v in ds_df[col].value_counts(dropna=False).index.tolist()[:25]] for col in ds_df.columns}
 
@@ -230,25 +353,41 @@ class DataFrameAccessor(BaseDataAccessor):
             table_description=table_describe,
             column_descriptions=column_describes,
             column_min_values={col: str(ds_df[col].dropna().min()) for col in ds_df.columns if dtypes[col] != 'string'},
-            column_max_values={col: str(ds_df[col].dropna().max()) for col in ds_df.columns if dtypes[col] != 'string'}
+            column_max_values={col: str(ds_df[col].dropna().max()) for col in ds_df.columns if dtypes[col] != 'string'},
+            semantic_types=dict(ds_df.attrs.get('semantic_types', {})),
+            datetime_formats=dict(ds_df.attrs.get('datetime_formats', {}))
         )
         return data_summary
 
-    def execute(self, code, func_name='analyze'):
+    def execute(self, code, func_name='analyze', df: Optional[pd.DataFrame] = None):
         """
         执行代码
         :param code: 代码
         :param func_name: 代码中的入口函数，主要用于获取代码执行结果，与prompt中定义的让LLM完成的代码签名一致
+        :param df: 传入的数据，为空时使用加载的数据；多段代码并行执行时各自传入副本，互不影响
         :return: 代码执行结果，pd.DataFrame类型
         """
         # 在namespace中执行，不指定的话，带import语句的代码，只在exec的局部作用域中，函数调用时，无法使用这些依赖
         namespace = {'pd': pd}
         # namespace['dfs'] = [self._df.copy()]
         exec(code, namespace, namespace)
-        df = self._df
-        res = namespace[func_name](df)
+        df = self._df if df is None else df
+        try:
+            res = namespace[func_name](df)
+        except Exception as e:
+            # 紧凑类型（category、稀疏数组等）与部分写法不兼容，类型相关的报错还原为原始类型后重试一次
+            if not df.attrs.get('compacted_dtypes') or not is_dtype_error(e):
+                raise
+            self.logger.warning("execution failed on compacted dtypes, retry with original dtypes")
+            res = namespace[func_name](restore_dtypes(df))
         # res = namespace[func_name]([df.copy()])
+        return self.convert_result(res)
 
+    @staticmethod
+    def convert_result(res):
+        """
+        将代码的执行结果统一转换为 pd.DataFrame
+        """
         if isinstance(res, pd.DataFrame):
             ret_df = res
         elif isinstance(res, pd.Series):
@@ -278,10 +417,48 @@ class DataFrameAccessor(BaseDataAccessor):
     def load_data(self, filepath, **kwargs):
         pass
 
+    def prepare_loaded_data(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        数据加载后的一次性预处理（语义类型转换、文本列存储方式、紧凑类型），处理结果随数据一起缓存
+        """
+        load_config = config.get_config().get('data_load', {})
+        semantic_config = load_config.get('semantic_types', {})
+        if semantic_config.get('enabled', True):
+            df = convert_semantic_types(df, sample_size=semantic_config.get('sample_size', 1000))
+            if df.attrs['semantic_types']:
+                self.logger.info(f"semantic types converted: {df.attrs['semantic_types']}")
+
+        string_storage = load_config.get('string_storage', 'python')
+        if string_storage == 'pyarrow':
+            df = convert_string_columns(df, storage=string_storage)
+
+        compact_config = load_config.get('compact_dtypes', {})
+        if compact_config.get('enabled', False):
+            df, report = compact_dataframe(
+                df,
+                max_categories=compact_config.get('max_categories', 1000),
+                max_category_ratio=compact_config.get('max_category_ratio', 0.5),
+                sparse_null_ratio=compact_config.get('sparse_null_ratio', 0.9),
+                min_integer_bits=compact_config.get('min_integer_bits', 32),
+                downcast_float=compact_config.get('downcast_float', False)
+            )
+            self.logger.info(describe_compaction_report(report))
+            # 随缓存数据保存压缩报告，可通过 get_compaction_report 查看
+            self.get_derived_data('compaction_report', lambda: report)
+        return df
+
+    def get_compaction_report(self):
+        """
+        获取加载时紧凑类型转换的报告（每列节省的字节数），未开启时返回空列表
+        """
+        return self.get_derived_data('compaction_report', list)
+
     @classmethod
     def cached_data_loader(cls, loader_func: Callable) -> Callable:
         cached = {}
         lock = threading.Lock()
+        # 每个缓存key一把加载锁：同一文件只加载一次，不同文件可以并行加载
+        key_locks = {}
 
         @wraps(loader_func)
         def wrapper(self, filepath, *args, **kwargs):
@@ -292,6 +469,15 @@ class DataFrameAccessor(BaseDataAccessor):
             current_mtime = None
             if os.path.exists(filepath):
                 current_mtime = os.path.getmtime(filepath)
+                self._data_fingerprint = (cache_key, current_mtime)
+            else:
+                # remote_csv 依赖本模块，在此处导入避免循环导入
+                from data_accessors.remote_csv import fetch_remote_version, is_remote_path
+                if is_remote_path(filepath):
+                    # 远程文件按 ETag/Last-Modified 关联派生结果（如后台计算的质量概况），数据本身仍每次下载
+                    version = fetch_remote_version(filepath)
+                    if version is not None:
+                        self._data_fingerprint = (cache_key, version)
             
             if cache_key in cached:
                 cached_mtime, cached_df = cached[cache_key]
@@ -304,6 +490,9 @@ class DataFrameAccessor(BaseDataAccessor):
 
 
             with lock:
+                key_lock = key_locks.setdefault(cache_key, threading.Lock())
+
+            with key_lock:
                 # 双重检查避免竞争条件
                 if cache_key in cached:
                     cached_mtime, cached_df = cached[cache_key]
@@ -313,6 +502,7 @@ class DataFrameAccessor(BaseDataAccessor):
 
                 self.logger.info(f'{cache_key} cache miss, loading file...')
                 df = loader_func(self, filepath, *args, **kwargs)
+                df = self.prepare_loaded_data(df)
                 
                 # 存储修改时间和数据
                 if current_mtime is not None:
@@ -14,7 +14,6 @@ class ExcelAccessor(DataFrameAccessor):
         self.sheet_name = sheet_name
         df = df if df is not None else self.load_data(filepath, sheet_name=sheet_name)
         self._df = df
-        self._data_summary = self.detect_data()
 
     @DataFrameAccessor.cached_data_loader
     def load_data(self, filepath, sheet_name=None, n_rows=None) -> DataFrame:
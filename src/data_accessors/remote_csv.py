@@ -0,0 +1,222 @@
+"""
+远程CSV的分段抽样预览
+
+预览几个GB的远程CSV时，不下载整个文件：通过 HTTP Range 请求只读取文件开头的几MB和若干均匀分布的数据块，
+解析其中的完整行推断数据结构和典型取值，并根据 Content-Length 估算总行数。
+完整数据只在 analyze_data 等确实需要时才下载。
+"""
+
+import io
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import httpx
+import pandas as pd
+
+from data_accessors.csv_format import CsvFormat, DEFAULT_ENCODINGS, decode_sample, detect_delimiter, detect_encoding
+from data_accessors.dataframe_accessor import DataFrameAccessor
+
+_CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+@dataclass
+class RemoteCsvSample:
+    # 抽样得到的数据（文件开头的行 + 各数据块中的完整行）
+    df: pd.DataFrame
+    # 识别的编码和分隔符
+    csv_format: CsvFormat
+    # 文件总字节数，未知时为 None
+    content_length: Optional[int]
+    # 估算的总行数，未知时为 None
+    estimated_rows: Optional[int]
+    # 实际读取的字节数
+    fetched_bytes: int
+    # 是否读取了完整文件（文件较小或服务端不支持 Range 请求时）
+    complete: bool
+    # 文件版本（ETag 或 Last-Modified），服务端未返回时为 None
+    version: Optional[str] = None
+
+
+def is_remote_path(path_or_url: str) -> bool:
+    return path_or_url.lower().startswith(('http://', 'https://'))
+
+
+def remote_version(headers: httpx.Headers) -> Optional[str]:
+    """
+    从响应头中获取文件版本：优先使用 ETag，其次 Last-Modified，都没有时为 None
+    """
+    etag = headers.get('ETag')
+    if etag:
+        return f'etag:{etag}'
+    last_modified = headers.get('Last-Modified')
+    if last_modified:
+        return f'last-modified:{last_modified}'
+    return None
+
+
+def fetch_remote_version(url: str, timeout: float = 5) -> Optional[str]:
+    """
+    通过 HEAD 请求获取远程文件的版本，请求失败或服务端未返回版本信息时为 None
+    """
+    try:
+        response = httpx.head(url, timeout=timeout, follow_redirects=True)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    return remote_version(response.headers)
+
+
+def fetch_range(client: httpx.Client, url: str, start: int, length: int) -> Tuple[bytes, Optional[int], bool, Optional[str]]:
+    """
+    读取 [start, start+length) 范围内的字节
+    :return: (字节, 文件总字节数, 服务端是否按Range返回, 文件版本)；服务端不支持Range时只读取开头 length 个字节
+    """
+    headers = {'Range': f'bytes={start}-{start + length - 1}'}
+    with client.stream('GET', url, headers=headers) as response:
+        response.raise_for_status()
+        version = remote_version(response.headers)
+        if response.status_code == 206:
+            match = _CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+            total = int(match.group(3)) if match and match.group(3) != '*' else None
+            return response.read(), total, True, version
+
+        # 服务端忽略了Range，返回完整内容：只读取需要的部分后断开
+        content_length = response.headers.get('Content-Length')
+        total = int(content_length) if content_length is not None else None
+        data = bytearray()
+        for chunk in response.iter_bytes():
+            data.extend(chunk)
+            if len(data) >= length:
+                break
+        return bytes(data[:length]), total, False, version
+
+
+def sniff_remote_csv_format(url: str, sample_bytes: int = 65536, encodings=DEFAULT_ENCODINGS, timeout: float = 30) -> CsvFormat:
+    """
+    读取远程文件开头的一段字节识别编码和分隔符
+    """
+    with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+        sample, total, _, _ = fetch_range(client, url, 0, sample_bytes)
+    complete = total is not None and len(sample) >= total
+    encoding = detect_encoding(sample, complete, encodings)
+    return CsvFormat(encoding=encoding, sep=detect_delimiter(decode_sample(sample, encoding, complete)))
+
+
+def _complete_lines(block: bytes, drop_first: bool, drop_last: bool) -> bytes:
+    """
+    去掉数据块首尾被截断的行
+    """
+    if drop_first:
+        first_newline = block.find(b'\n')
+        block = block[first_newline + 1:] if first_newline >= 0 else b''
+    if drop_last:
+        last_newline = block.rfind(b'\n')
+        block = block[:last_newline + 1] if last_newline >= 0 else b''
+    return block
+
+
+def _is_parsable_block(block: bytes, encoding: str, sep: str, column_count: int) -> bool:
+    """
+    数据块能否按表头的列数独立解析；数据块从带引号的多行字段中间开始时无法解析，跳过该块
+    """
+    try:
+        block_df = pd.read_csv(io.BytesIO(block), encoding=encoding, sep=sep, header=None, dtype=str)
+    except (pd.errors.ParserError, UnicodeDecodeError, ValueError):
+        return False
+    return block_df.shape[1] == column_count
+
+
+def sample_remote_csv(
+        url: str,
+        head_bytes: int = 4 * 1024 * 1024,
+        sample_blocks: int = 4,
+        block_bytes: int = 256 * 1024,
+        encodings=DEFAULT_ENCODINGS,
+        timeout: float = 30
+) -> RemoteCsvSample:
+    """
+    通过 Range 请求抽样读取远程CSV
+    :param url:
+    :param head_bytes: 读取文件开头的字节数
+    :param sample_blocks: 在文件其余部分均匀抽取的数据块数量
+    :param block_bytes: 每个数据块的字节数
+    :param encodings: 依次尝试的候选编码
+    :param timeout: 请求超时时间（秒）
+    :return:
+    """
+    with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+        head, total, ranged, version = fetch_range(client, url, 0, head_bytes)
+        complete = total is not None and len(head) >= total
+
+        encoding = detect_encoding(head, complete, encodings)
+        head = _complete_lines(head, drop_first=False, drop_last=not complete)
+        csv_format = CsvFormat(encoding=encoding, sep=detect_delimiter(decode_sample(head, encoding, True)))
+        head_df = pd.read_csv(io.BytesIO(head), encoding=encoding, sep=csv_format.sep)
+        fetched_bytes = len(head)
+
+        blocks = [head]
+        if ranged and not complete and total is not None and sample_blocks > 0:
+            # 在开头之后的部分均匀取块，块内首尾不完整的行丢弃
+            step = (total - len(head)) // sample_blocks
+            for i in range(sample_blocks):
+                start = len(head) + i * step + max(0, step - block_bytes) // 2
+                block, _, _, _ = fetch_range(client, url, start, min(block_bytes, total - start))
+                fetched_bytes += len(block)
+                block = _complete_lines(block, drop_first=True, drop_last=start + len(block) < total)
+                if block.strip() and _is_parsable_block(block, encoding, csv_format.sep, len(head_df.columns)):
+                    blocks.append(block if block.endswith(b'\n') else block + b'\n')
+
+    # 开头和各数据块拼接后统一解析，各列类型按全部抽样行推断
+    df = pd.read_csv(io.BytesIO(b''.join(blocks)), encoding=encoding, sep=csv_format.sep) if len(blocks) > 1 else head_df
+
+    estimated_rows = None
+    if complete:
+        estimated_rows = len(head_df)
+    elif total is not None and len(head_df) > 0:
+        # 按文件开头每行的平均字节数估算
+        estimated_rows = int(total / (len(head) / (len(head_df) + 1)))
+
+    return RemoteCsvSample(
+        df=df,
+        csv_format=csv_format,
+        content_length=total,
+        estimated_rows=estimated_rows,
+        fetched_bytes=fetched_bytes,
+        complete=complete,
+        version=version
+    )
+
+
+class RemoteCSVAccessor(DataFrameAccessor):
+    """
+    远程CSV的抽样预览，只用于 get_preview_data；分析、表格操作仍使用 CSVAccessor 读取完整数据
+    """
+
+    def __init__(self, url: str, column_description: Optional[dict] = None, **sample_kwargs):
+        super().__init__(None, column_description)
+        self.url = url
+        self.sample = sample_remote_csv(url, **sample_kwargs)
+        if self.sample.version is not None:
+            # 派生结果（如后台计算的质量概况）按URL、抽样参数和文件版本复用，与完整数据的结果分开保存
+            cache_key = (url, self.__class__.__name__) + tuple(f"{k}={v}" for k, v in sorted(sample_kwargs.items()) if k != 'timeout')
+            self._data_fingerprint = (cache_key, self.sample.version)
+        self._df = self.prepare_loaded_data(self.sample.df)
+        self.logger.info(f"{url} sampled {len(self.sample.df):,} rows, fetched {self.sample.fetched_bytes:,} bytes"
+                         f" of {self.sample.content_length}")
+
+    def load_data(self, filepath, **kwargs):
+        return self.sample.df
+
+    @property
+    def sample_note(self) -> str:
+        if self.sample.complete:
+            return ''
+        total_rows = f"约 {self.sample.estimated_rows:,} 行" if self.sample.estimated_rows is not None else "行数未知"
+        total_size = f"{self.sample.content_length / 1024 / 1024:.1f} MB" if self.sample.content_length is not None else "大小未知"
+        return (f"> 远程文件（{total_size}，{total_rows}）仅抽样读取了 {len(self.sample.df):,} 行用于预览，"
+                f"以下取值范围和质量概况基于抽样数据\n\n")
+
+    @property
+    def structure_description(self):
+        return self.sample_note + super().structure_description
@@ -0,0 +1,119 @@
+"""
+基于问题的列相关性排序
+
+宽表（几百列）的完整数据描述会占用数万token，这里根据问题对列打分，
+只为最相关的列输出典型取值等详细信息，其余列仅列出列名和字段类型。
+
+打分依据：
+- 列名是否完整出现在问题中
+- 列名、列描述与问题的英文/数字词重合度
+- 列名、列描述与问题的字符 n-gram 重合度（适配中文）
+- 列的典型取值是否出现在问题中
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+from schema.data_summary import DataSummary
+
+_WORD_PATTERN = re.compile(r'[a-z0-9_]+')
+
+# 各项匹配的权重
+NAME_EXACT_WEIGHT = 3.0
+NAME_WORD_WEIGHT = 1.0
+NAME_NGRAM_WEIGHT = 2.0
+DESCRIPTION_NGRAM_WEIGHT = 1.0
+VALUE_MATCH_WEIGHT = 2.0
+
+
+def normalize_text(text) -> str:
+    return unicodedata.normalize('NFKC', str(text)).lower().strip()
+
+
+def char_ngrams(text: str, sizes: Iterable[int] = (2, 3)) -> Set[str]:
+    """
+    字符 n-gram 集合，文本长度小于 n 时整体作为一个 gram
+    """
+    grams = set()
+    for n in sizes:
+        if len(text) < n:
+            if text:
+                grams.add(text)
+            continue
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def _containment(part: Set[str], whole: Set[str]) -> float:
+    if not part:
+        return 0.0
+    return len(part & whole) / len(part)
+
+
+class ColumnRanker:
+    def __init__(self, data_summary: DataSummary, min_value_length: int = 2):
+        """
+        :param data_summary: 数据摘要
+        :param min_value_length: 参与匹配的典型取值的最短长度，过短的取值（如“是”、“1”）容易误匹配
+        """
+        self.data_summary = data_summary
+        self._columns = []
+        for col in data_summary.columns:
+            name = normalize_text(col)
+            description = normalize_text(data_summary.column_descriptions.get(col, '') or '')
+            values = {
+                normalize_text(v) for v in data_summary.column_values.get(col, [])
+                if isinstance(v, str) and len(v.strip()) >= min_value_length
+            }
+            self._columns.append((
+                col,
+                name,
+                set(_WORD_PATTERN.findall(name)),
+                char_ngrams(name),
+                char_ngrams(description),
+                values
+            ))
+
+    def score(self, question: str) -> Dict[str, float]:
+        question = normalize_text(question)
+        question_words = set(_WORD_PATTERN.findall(question))
+        question_ngrams = char_ngrams(question)
+
+        scores = {}
+        for col, name, name_words, name_ngrams, description_ngrams, values in self._columns:
+            score = 0.0
+            if name and name in question:
+                score += NAME_EXACT_WEIGHT
+            if name_words:
+                score += NAME_WORD_WEIGHT * len(name_words & question_words) / len(name_words)
+            score += NAME_NGRAM_WEIGHT * _containment(name_ngrams, question_ngrams)
+            score += DESCRIPTION_NGRAM_WEIGHT * _containment(description_ngrams, question_ngrams)
+            if any(v in question for v in values):
+                score += VALUE_MATCH_WEIGHT
+            scores[col] = score
+        return scores
+
+    def rank(self, question: str, top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        按相关性从高到低排序，分数相同时保持原始列顺序
+        """
+        scores = self.score(question)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:top_k] if top_k is not None else ranked
+
+
+def describe_for_question(data_summary: DataSummary, question: str) -> str:
+    """
+    生成面向问题的数据描述：列数超过阈值时，仅为相关性最高的 top_k 列提供详细信息，
+    超出token预算时由渲染器优先折叠相关性低的列
+    """
+    prompt_config = config.get_config().get('prompt', {})
+    selection_config = prompt_config.get('column_selection', {})
+    token_budget = prompt_config.get('description_token_budget')
+    if not selection_config.get('enabled', True) or len(data_summary.columns) <= selection_config.get('min_columns', 30):
+        return data_summary.build_description(token_budget=token_budget)
+
+    ranked = ColumnRanker(data_summary).rank(question, top_k=selection_config.get('top_k', 20))
+    return data_summary.build_description([col for col, _ in ranked], token_budget=token_budget)
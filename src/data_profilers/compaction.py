@@ -0,0 +1,192 @@
+"""
+紧凑数据类型
+
+缓存的数据中，取值种类很少的文本列（地区、产品线、状态码等）和取值范围很小的 int64/float64 列，
+占用的内存是实际需要的数倍。这里在加载后按需进行压缩：
+- 低基数文本列转换为 category（字典编码）
+- 数值列向下转换为更小的类型
+- 绝大部分为空的数值列转换为稀疏数组
+- 文本列可以整体转换为 Arrow 存储的 string[pyarrow]，内存更小、.str 操作更快
+
+压缩前的类型记录在 df.attrs['compacted_dtypes'] 中，生成的代码在压缩后的数据上因类型不兼容而执行失败时
+（is_dtype_error 判断），可以用 restore_dtypes 还原后重试。
+"""
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class ColumnCompaction:
+    # 列名
+    column: str
+    # 压缩前的类型
+    original_dtype: str
+    # 压缩后的类型
+    compact_dtype: str
+    # 压缩前占用字节数
+    bytes_before: int
+    # 压缩后占用字节数
+    bytes_after: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def _is_text_dtype(dtype) -> bool:
+    return pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.StringDtype)
+
+
+def _compact_series(series: pd.Series, max_categories: int, max_category_ratio: float,
+                    sparse_null_ratio: float, min_integer_bits: int, downcast_float: bool):
+    if len(series) == 0:
+        return None
+
+    null_ratio = series.isna().mean()
+    if pd.api.types.is_float_dtype(series.dtype) and null_ratio >= sparse_null_ratio:
+        return series.astype(pd.SparseDtype(series.dtype, np.nan))
+
+    if _is_text_dtype(series.dtype):
+        distinct_count = series.nunique(dropna=True)
+        if distinct_count <= max_categories and distinct_count <= max_category_ratio * len(series):
+            try:
+                return series.astype('category')
+            except TypeError:
+                # 含 list 等不可哈希的取值
+                return None
+        return None
+
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind == 'i' and series.dtype.itemsize * 8 > min_integer_bits:
+        downcast = pd.to_numeric(series, downcast='integer')
+        if downcast.dtype.itemsize * 8 < min_integer_bits:
+            downcast = downcast.astype(f'int{min_integer_bits}')
+        return downcast
+
+    if downcast_float and series.dtype == np.float64:
+        downcast = series.astype(np.float32)
+        # 只在转换不损失精度（转回 float64 后完全相等）时使用
+        if np.array_equal(series.to_numpy(), downcast.to_numpy(dtype=np.float64), equal_nan=True):
+            return downcast
+    return None
+
+
+def compact_dataframe(
+        df: pd.DataFrame,
+        max_categories: int = 1000,
+        max_category_ratio: float = 0.5,
+        sparse_null_ratio: float = 0.9,
+        min_integer_bits: int = 32,
+        downcast_float: bool = False
+) -> Tuple[pd.DataFrame, List[ColumnCompaction]]:
+    """
+    压缩数据类型
+    :param df:
+    :param max_categories: 转换为 category 的文本列最多的不同取值数
+    :param max_category_ratio: 转换为 category 的文本列，不同取值数占行数的最大比例
+    :param sparse_null_ratio: 缺失率不低于该值的浮点列转换为稀疏数组
+    :param min_integer_bits: 整数向下转换的最小位数，过小的整数类型在生成的代码中做乘法等运算时容易溢出
+    :param downcast_float: 是否将 float64 转换为 float32（仅在不损失精度时）
+    :return: 压缩后的DataFrame，以及每个被压缩列的节省情况
+    """
+    report = []
+    compacted_dtypes = dict(df.attrs.get('compacted_dtypes', {}))
+    if not df.columns.is_unique:
+        return df, report
+
+    for col in df.columns:
+        series = df[col]
+        compacted = _compact_series(series, max_categories, max_category_ratio, sparse_null_ratio, min_integer_bits, downcast_float)
+        if compacted is None or compacted.dtype == series.dtype:
+            continue
+
+        bytes_before = int(series.memory_usage(index=False, deep=True))
+        bytes_after = int(compacted.memory_usage(index=False, deep=True))
+        if bytes_after >= bytes_before:
+            continue
+
+        df[col] = compacted
+        compacted_dtypes.setdefault(col, str(series.dtype))
+        report.append(ColumnCompaction(
+            column=col,
+            original_dtype=str(series.dtype),
+            compact_dtype=str(compacted.dtype),
+            bytes_before=bytes_before,
+            bytes_after=bytes_after
+        ))
+
+    df.attrs['compacted_dtypes'] = compacted_dtypes
+    return df, report
+
+
+def convert_string_columns(df: pd.DataFrame, storage: str = 'pyarrow') -> pd.DataFrame:
+    """
+    将取值全部为文本的 object 列转换为 StringDtype(storage)，转换的列记录在 df.attrs['compacted_dtypes'] 中
+    :param df:
+    :param storage: 字符串存储方式，pyarrow 或 python
+    :return:
+    """
+    compacted_dtypes = dict(df.attrs.get('compacted_dtypes', {}))
+    if not df.columns.is_unique:
+        return df
+
+    string_dtype = pd.StringDtype(storage)
+    for col in df.columns:
+        series = df[col]
+        # 混有数字、日期等取值的列转换后会丢失原始类型，保持不变
+        if not pd.api.types.is_object_dtype(series.dtype) or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            continue
+        df[col] = series.astype(string_dtype)
+        compacted_dtypes.setdefault(col, str(series.dtype))
+
+    df.attrs['compacted_dtypes'] = compacted_dtypes
+    return df
+
+
+def restore_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将压缩过的列还原为压缩前的类型，返回新的DataFrame
+    """
+    compacted_dtypes = df.attrs.get('compacted_dtypes', {})
+    restored = df.copy()
+    for col, dtype in compacted_dtypes.items():
+        if col not in restored.columns:
+            continue
+        series = restored[col]
+        if isinstance(series.dtype, pd.SparseDtype):
+            series = series.sparse.to_dense()
+        restored_series = series.astype(dtype)
+        if dtype == 'object':
+            # StringDtype 的缺失值为 pd.NA，还原为 object 列时与原始数据一致使用 NaN
+            restored_series = restored_series.where(series.notna(), np.nan)
+        restored[col] = restored_series
+    restored.attrs['compacted_dtypes'] = {}
+    return restored
+
+
+# 报错信息中出现这些关键字时，认为与紧凑类型（category、稀疏数组、Arrow 字符串）有关
+_DTYPE_ERROR_KEYWORDS = ('categor', 'sparse', 'arrow')
+
+
+def is_dtype_error(e: BaseException) -> bool:
+    """
+    报错是否可能由紧凑类型引起：TypeError、NotImplementedError，或报错信息提及 category、稀疏数组、Arrow；
+    列名错误、代码逻辑错误等还原类型后重试同样会失败，不应重试
+    """
+    if isinstance(e, (TypeError, NotImplementedError)):
+        return True
+    message = str(e).lower()
+    return any(keyword in message for keyword in _DTYPE_ERROR_KEYWORDS)
+
+
+def describe_compaction_report(report: List[ColumnCompaction]) -> str:
+    total_before = sum(item.bytes_before for item in report)
+    total_saved = sum(item.saved_bytes for item in report)
+    lines = [f"compacted {len(report)} columns, saved {total_saved / 1024 / 1024:.1f} MB of {total_before / 1024 / 1024:.1f} MB"]
+    for item in sorted(report, key=lambda item: -item.saved_bytes):
+        lines.append(f"  {item.column}: {item.original_dtype} -> {item.compact_dtype}, "
+                     f"{item.bytes_before:,} -> {item.bytes_after:,} bytes")
+    return '\n'.join(lines)
@@ -0,0 +1,103 @@
+"""
+重复行检测
+
+基于 64 位行哈希统计重复行，避免 df.duplicated() 在宽表、object 列上构造大量中间元组。
+
+支持三种方式：
+- exact：先用哈希筛出候选行，再对候选行做精确比较，排除哈希碰撞（默认）
+- hash：仅比较行哈希，内存占用约为 8 字节/行；object 列的取值按字符串形式哈希，
+  1 与 "1" 这类类型不同、字符串形式相同的取值会被当作相同
+- sample：按哈希值做一致性抽样，只统计落入哈希空间固定比例的行，再按比例放大估计
+"""
+
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+DUPLICATE_METHODS = ('hash', 'exact', 'sample')
+
+_UINT64_SPACE = float(2 ** 64)
+
+
+@dataclass
+class DuplicateSummary:
+    # 重复行数（第一次出现的行不计入）
+    duplicate_rows: int
+    # 检测方式：hash / exact / sample
+    method: str
+    # 是否为估计值（仅抽样模式下为 True）
+    estimated: bool = False
+
+
+def _hash_frame(df: pd.DataFrame) -> np.ndarray:
+    try:
+        return pd.util.hash_pandas_object(df, index=False).to_numpy()
+    except TypeError:
+        # 含 list、dict 等不可哈希的取值时，按字符串形式参与哈希
+        return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+
+
+def iter_row_hashes(df: pd.DataFrame, chunk_rows: int = 100_000) -> Iterator[np.ndarray]:
+    """
+    分块计算行哈希，单次只为 chunk_rows 行构造中间数据
+    :param df:
+    :param chunk_rows: 每块的行数
+    :return: 每块行哈希组成的 uint64 数组
+    """
+    for start in range(0, len(df), chunk_rows):
+        yield _hash_frame(df.iloc[start:start + chunk_rows])
+
+
+def _count_duplicated(hashes: np.ndarray) -> int:
+    return int(len(hashes) - len(pd.unique(hashes)))
+
+
+def count_duplicate_rows(
+        df: pd.DataFrame,
+        method: str = 'exact',
+        sample_rows: int = 1_000_000,
+        chunk_rows: int = 100_000
+) -> DuplicateSummary:
+    """
+    统计重复行数
+    :param df:
+    :param method: hash / exact / sample
+    :param sample_rows: 抽样模式下期望参与统计的行数，数据行数不超过该值时退化为 hash 方式
+    :param chunk_rows: 分块计算哈希时每块的行数
+    :return:
+    """
+    if method not in DUPLICATE_METHODS:
+        raise ValueError(f'不支持的重复行检测方式: {method}，可选值: {DUPLICATE_METHODS}')
+
+    total_rows = len(df)
+    if total_rows == 0:
+        return DuplicateSummary(duplicate_rows=0, method=method)
+
+    if method == 'sample' and total_rows > sample_rows:
+        # 同一行的所有副本哈希相同，要么全部入选要么全部落选，样本内的重复行数是精确的
+        fraction = sample_rows / total_rows
+        threshold = np.uint64(min(fraction * _UINT64_SPACE, _UINT64_SPACE - 1))
+        sampled = [h[h < threshold] for h in iter_row_hashes(df, chunk_rows)]
+        sampled_duplicates = _count_duplicated(np.concatenate(sampled))
+        return DuplicateSummary(
+            duplicate_rows=int(round(sampled_duplicates / fraction)),
+            method=method,
+            estimated=True
+        )
+
+    hashes = np.concatenate(list(iter_row_hashes(df, chunk_rows)))
+    if method != 'exact':
+        return DuplicateSummary(duplicate_rows=_count_duplicated(hashes), method='hash' if method == 'sample' else method)
+
+    # 精确模式：只有哈希出现多次的行才可能重复，仅对这部分行做逐值比较
+    candidate_mask = pd.Series(hashes).duplicated(keep=False).to_numpy()
+    if not candidate_mask.any():
+        return DuplicateSummary(duplicate_rows=0, method=method)
+    candidates = df[candidate_mask]
+    try:
+        duplicate_rows = int(candidates.duplicated().sum())
+    except TypeError:
+        duplicate_rows = int(candidates.astype(str).duplicated().sum())
+    return DuplicateSummary(duplicate_rows=duplicate_rows, method=method)
@@ -0,0 +1,187 @@
+"""
+多表关联键发现
+
+多表合并时，LLM 只能看到每个文件各自的描述，经常选错关联键或选到重合度很低的列，
+导致执行失败，或者产生多对多合并、内存暴涨。
+
+这里在探查数据时为每列计算取值集合的 MinHash 签名，估算不同文件两两列之间的取值重合度，
+结合各列的唯一率给出候选关联键，写入Prompt。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Mersenne 素数 2^61-1，用于 (a*x+b) mod p 的哈希族
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 61) - 1)
+
+# 唯一率不低于该值的列视为唯一键
+UNIQUE_KEY_RATIO = 0.99
+
+
+@dataclass
+class ColumnSignature:
+    # 列名
+    column: str
+    # 取值集合的 MinHash 签名
+    signature: np.ndarray
+    # 不同取值数
+    distinct_count: int
+    # 非空行数
+    non_null_count: int
+
+    @property
+    def uniqueness(self) -> float:
+        if self.non_null_count == 0:
+            return 0.0
+        return self.distinct_count / self.non_null_count
+
+    @property
+    def is_unique(self) -> bool:
+        return self.uniqueness >= UNIQUE_KEY_RATIO
+
+
+@dataclass
+class JoinKeyCandidate:
+    # 左表序号（从0开始）
+    left_index: int
+    left: ColumnSignature
+    # 右表序号（从0开始）
+    right_index: int
+    right: ColumnSignature
+    # 估算的 Jaccard 相似度
+    jaccard: float
+    # 估算的重合度：交集大小 / 较小一侧的不同取值数
+    overlap: float
+
+    @property
+    def many_to_many(self) -> bool:
+        return not self.left.is_unique and not self.right.is_unique
+
+    @property
+    def score(self) -> float:
+        # 至少一侧唯一的关联键更可靠，多对多的关联键降权
+        return self.overlap * max(self.left.uniqueness, self.right.uniqueness)
+
+
+def _hash_permutations(num_perm: int, seed: int):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _distinct_join_values(series: pd.Series) -> np.ndarray:
+    """
+    去重后统一关联键取值的表示：整数值的浮点列（如读入时因缺失值变为 float）按整数处理，
+    文本去除首尾空白，避免 1 与 1.0、'A01 ' 与 'A01' 被视为不同取值
+    """
+    distinct = pd.Series(series.dropna().unique())
+    if pd.api.types.is_float_dtype(distinct.dtype) and len(distinct) > 0 and (distinct % 1 == 0).all():
+        distinct = distinct.astype('int64')
+    if not (pd.api.types.is_object_dtype(distinct.dtype) or isinstance(distinct.dtype, pd.StringDtype)):
+        # 数值、日期等类型转为文本后不会产生首尾空白，也不会产生新的重复
+        return distinct.astype(str).to_numpy()
+    return pd.unique(distinct.astype(str).str.strip().to_numpy())
+
+
+def compute_column_signature(series: pd.Series, column: str, num_perm: int = 64, seed: int = 1, chunk_size: int = 50_000) -> ColumnSignature:
+    distinct = _distinct_join_values(series)
+    signature = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+
+    a, b = _hash_permutations(num_perm, seed)
+    base_hashes = pd.util.hash_array(distinct.astype(object)) % _MERSENNE_PRIME if len(distinct) else np.array([], dtype=np.uint64)
+    # 按块计算，避免 不同取值数 × num_perm 的矩阵过大
+    for start in range(0, len(base_hashes), chunk_size):
+        chunk = base_hashes[start:start + chunk_size]
+        # uint64 乘法按 2^64 取模，再对 2^61-1 取模作为各排列下的哈希值
+        permuted = (np.outer(chunk, a) + b) % _MERSENNE_PRIME
+        signature = np.minimum(signature, permuted.min(axis=0))
+
+    return ColumnSignature(
+        column=column,
+        signature=signature,
+        distinct_count=len(distinct),
+        non_null_count=int(series.notna().sum())
+    )
+
+
+def compute_signatures(df: pd.DataFrame, num_perm: int = 64, seed: int = 1) -> Dict[str, ColumnSignature]:
+    """
+    为可能作为关联键的列计算 MinHash 签名，跳过布尔列、非整数的浮点列和重名列
+    """
+    signatures = {}
+    for col in df.columns.unique():
+        series = df[col]
+        if isinstance(series, pd.DataFrame) or pd.api.types.is_bool_dtype(series.dtype):
+            continue
+        if pd.api.types.is_float_dtype(series.dtype) and not (series.dropna() % 1 == 0).all():
+            continue
+        signatures[col] = compute_column_signature(series, col, num_perm=num_perm, seed=seed)
+    return signatures
+
+
+def estimate_jaccard(left: ColumnSignature, right: ColumnSignature) -> float:
+    return float(np.mean(left.signature == right.signature))
+
+
+def find_join_key_candidates(
+        table_signatures: Sequence[Dict[str, ColumnSignature]],
+        min_overlap: float = 0.5,
+        top_k: int = 5
+) -> List[JoinKeyCandidate]:
+    """
+    估算不同表两两列之间的取值重合度，返回得分最高的候选关联键
+    :param table_signatures: 每个表的列签名
+    :param min_overlap: 最低重合度
+    :param top_k: 返回的候选数量
+    :return:
+    """
+    candidates = []
+    for i in range(len(table_signatures)):
+        for j in range(i + 1, len(table_signatures)):
+            for left in table_signatures[i].values():
+                for right in table_signatures[j].values():
+                    if left.distinct_count == 0 or right.distinct_count == 0:
+                        continue
+                    # 不同取值数只有一两个的列（如性别、标志位）重合度高但不适合做关联键
+                    if min(left.distinct_count, right.distinct_count) < 3:
+                        continue
+                    jaccard = estimate_jaccard(left, right)
+                    if jaccard == 0:
+                        continue
+                    intersection = jaccard * (left.distinct_count + right.distinct_count) / (1 + jaccard)
+                    overlap = min(1.0, intersection / min(left.distinct_count, right.distinct_count))
+                    if overlap < min_overlap:
+                        continue
+                    candidates.append(JoinKeyCandidate(
+                        left_index=i, left=left, right_index=j, right=right,
+                        jaccard=jaccard, overlap=overlap
+                    ))
+
+    candidates.sort(key=lambda candidate: -candidate.score)
+    return candidates[:top_k]
+
+
+def describe_join_key_candidates(candidates: List[JoinKeyCandidate]) -> str:
+    """
+    生成候选关联键的说明，供Prompt使用；没有候选时返回空字符串
+    """
+    if not candidates:
+        return ''
+
+    def side(index: int, signature: ColumnSignature) -> str:
+        return (f"输入文件 {index + 1} 的「{signature.column}」"
+                f"（不同取值约 {signature.distinct_count:,} 个，唯一率 {signature.uniqueness:.0%}）")
+
+    lines = []
+    for candidate in candidates:
+        line = (f"- {side(candidate.left_index, candidate.left)} ↔ {side(candidate.right_index, candidate.right)}："
+                f"取值重合度约 {candidate.overlap:.0%}")
+        if candidate.many_to_many:
+            line += "；两侧取值均不唯一，直接合并会产生多对多匹配，行数可能大幅膨胀"
+        lines.append(line)
+    return "### 候选关联键（根据取值重合度估算）\n" + '\n'.join(lines)
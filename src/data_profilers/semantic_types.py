@@ -0,0 +1,186 @@
+"""
+语义类型识别与转换
+
+以文本形式存储的日期、带千分位/货币符号的数字、百分比，读入后都是 object 类型，
+生成的代码每次请求都要逐行 apply 转换，也是执行报错的主要来源之一。
+这里在数据加载时抽样识别这类列，并一次性向量化转换，转换结果随数据缓存复用。
+日期列按抽样推断出的固定格式解析，解析格式记录在 df.attrs['datetime_formats'] 中，
+生成Prompt时告知LLM该列已是日期时间类型，无需在每次请求中重复调用 pd.to_datetime。
+
+只有整列都能无损转换时才会转换：除常见的空值占位符外，任何原本非空的值转换后变为空，则保留原列。
+"""
+
+import re
+import warnings
+from typing import Dict, Optional
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# 语义类型
+SEMANTIC_DATETIME = 'datetime'
+SEMANTIC_NUMBER = 'number'
+SEMANTIC_PERCENT = 'percent'
+
+# 语义类型在数据描述中的说明
+SEMANTIC_TYPE_NOTES = {
+    SEMANTIC_DATETIME: '已由日期文本解析为日期时间类型，无需再调用 pd.to_datetime',
+    SEMANTIC_NUMBER: '已由带千分位/货币符号的数字文本转换为数值类型',
+    SEMANTIC_PERCENT: '已由百分比文本转换为小数，如 12.5% 存储为 0.125',
+}
+
+# 常见的空值占位符，转换时视为缺失值
+NULL_TOKENS = {'', '-', '--', '—', 'n/a', 'na', 'nan', 'null', 'none', '无', '空'}
+_MAX_NULL_TOKEN_LENGTH = max(len(token) for token in NULL_TOKENS)
+
+_DATETIME_PATTERN = re.compile(
+    r'^\d{4}[-/.]\d{1,2}([-/.]\d{1,2})?([ T]\d{1,2}:\d{1,2}(:\d{1,2}(\.\d+)?)?)?$'
+)
+_NUMBER_PATTERN = re.compile(r'^[-+]?[¥￥$]?\s*(\d{1,3}(,\d{3})+|\d+)(\.\d+)?$')
+_PERCENT_PATTERN = re.compile(r'^[-+]?\d+(\.\d+)?\s*%$')
+# 以0开头的多位数字（编码、邮编等）和超过15位的数字（身份证号等）转换后会丢失信息
+_CODE_LIKE_PATTERN = re.compile(r'^[-+]?0\d|\d{16,}')
+
+
+def _sample_text(series: pd.Series, sample_size: int) -> pd.Series:
+    """
+    抽样非空值，去除首尾空白并剔除空值占位符；先抽样再处理，避免对整列做字符串操作
+    """
+    values = series.dropna()
+    if len(values) > sample_size:
+        values = values.sample(sample_size, random_state=0)
+    text = values.astype(str).str.strip()
+    return text[~text.str.lower().isin(NULL_TOKENS)]
+
+
+def _all_match(text: pd.Series, pattern: re.Pattern) -> bool:
+    return len(text) > 0 and bool(text.str.match(pattern).all())
+
+
+def detect_column_semantic_type(series: pd.Series, sample_size: int = 1000):
+    """
+    抽样识别单列的语义类型
+    :param series:
+    :param sample_size: 参与识别的非空值数量
+    :return: 语义类型，无法识别时返回 None
+    """
+    if series.dtype != object and not isinstance(series.dtype, pd.StringDtype):
+        return None
+
+    text = _sample_text(series, sample_size)
+    if len(text) == 0:
+        return None
+
+    if _all_match(text, _PERCENT_PATTERN):
+        return SEMANTIC_PERCENT
+    if _all_match(text, _NUMBER_PATTERN) and not text.str.contains(_CODE_LIKE_PATTERN).any():
+        return SEMANTIC_NUMBER
+    if _all_match(text, _DATETIME_PATTERN) and _to_datetime(text).notna().all():
+        return SEMANTIC_DATETIME
+    return None
+
+
+def detect_semantic_types(df: pd.DataFrame, sample_size: int = 1000) -> Dict[str, str]:
+    semantic_types = {}
+    for col in df.columns:
+        semantic_type = detect_column_semantic_type(df[col], sample_size)
+        if semantic_type is not None:
+            semantic_types[col] = semantic_type
+    return semantic_types
+
+
+def _to_datetime(text: pd.Series, datetime_format: Optional[str] = None) -> pd.Series:
+    """
+    按固定格式解析日期，未指定格式时逐个推断（format='mixed'，较慢），结果以是否无损为准
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(text, format=datetime_format or 'mixed', errors='coerce')
+
+
+def infer_datetime_format(series: pd.Series, sample_size: int = 1000) -> Optional[str]:
+    """
+    根据抽样推断日期列的固定格式，抽样中存在无法按该格式解析的值时返回 None
+    """
+    text = _sample_text(series, sample_size)
+    if len(text) == 0:
+        return None
+    datetime_format = guess_datetime_format(text.iloc[0])
+    if datetime_format is None or _to_datetime(text, datetime_format).isna().any():
+        return None
+    return datetime_format
+
+
+def _normalize_column(series: pd.Series):
+    """
+    去除首尾空白，并标记缺失值及空值占位符；只对长度不超过占位符的短文本做小写匹配
+    :return: (文本, 缺失标记)
+    """
+    text = series.astype(str).str.strip()
+    null_mask = series.isna().to_numpy(copy=True)
+    short = (text.str.len() <= _MAX_NULL_TOKEN_LENGTH).to_numpy()
+    null_mask[short] |= text[short].str.lower().isin(NULL_TOKENS).to_numpy()
+    return text, pd.Series(null_mask, index=series.index)
+
+
+def convert_column(series: pd.Series, semantic_type: str, datetime_format: Optional[str] = None) -> pd.Series:
+    """
+    按语义类型向量化转换单列，空值占位符转换为缺失值
+    :param series:
+    :param semantic_type: 语义类型
+    :param datetime_format: 日期列的解析格式，None 时逐个推断
+    :return:
+    """
+    text, null_mask = _normalize_column(series)
+    return _convert_text(text.where(~null_mask, None), semantic_type, datetime_format)
+
+
+def _convert_text(text: pd.Series, semantic_type: str, datetime_format: Optional[str] = None) -> pd.Series:
+    if semantic_type == SEMANTIC_PERCENT:
+        return pd.to_numeric(text.str.rstrip('%').str.strip(), errors='coerce') / 100
+    if semantic_type == SEMANTIC_NUMBER:
+        return pd.to_numeric(text.str.replace(r'[,¥￥$\s]', '', regex=True), errors='coerce')
+    if semantic_type == SEMANTIC_DATETIME:
+        return _to_datetime(text, datetime_format)
+    raise ValueError(f'不支持的语义类型: {semantic_type}')
+
+
+def convert_semantic_types(df: pd.DataFrame, sample_size: int = 1000) -> pd.DataFrame:
+    """
+    识别并转换语义类型，转换成功的列记录在 df.attrs['semantic_types'] 中，
+    日期列的解析格式记录在 df.attrs['datetime_formats'] 中（随缓存副本一起保留）
+    :param df:
+    :param sample_size: 识别时每列参与抽样的非空值数量
+    :return: 转换后的DataFrame
+    """
+    converted = {}
+    datetime_formats = {}
+    if not df.columns.is_unique:
+        # 存在重名列时按列名取值会得到多列，不做转换
+        df.attrs['semantic_types'] = converted
+        df.attrs['datetime_formats'] = datetime_formats
+        return df
+
+    for col, semantic_type in detect_semantic_types(df, sample_size).items():
+        series = df[col]
+        datetime_format = infer_datetime_format(series, sample_size) if semantic_type == SEMANTIC_DATETIME else None
+        text, expected_nulls = _normalize_column(series)
+        text = text.where(~expected_nulls, None)
+        new_series = _convert_text(text, semantic_type, datetime_format)
+        # 原本非空（且不是空值占位符）的值转换后变为空，说明抽样未覆盖到异常值，放弃转换
+        lost = new_series.isna() & ~expected_nulls
+        if lost.any() and datetime_format is not None:
+            # 存在与推断格式不一致的日期，退回逐个推断
+            datetime_format = None
+            new_series = _convert_text(text, semantic_type)
+            lost = new_series.isna() & ~expected_nulls
+        if lost.any():
+            continue
+        df[col] = new_series
+        converted[col] = semantic_type
+        if datetime_format is not None:
+            datetime_formats[col] = datetime_format
+
+    df.attrs['semantic_types'] = converted
+    df.attrs['datetime_formats'] = datetime_formats
+    return df
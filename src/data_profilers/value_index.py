@@ -0,0 +1,122 @@
+"""
+取值倒排索引
+
+问题中经常直接提到某个取值（如“北京”、“iPhone 15”），却不说明它在哪一列。
+这里为文本/分类列建立“归一化取值 -> (列名, 出现次数)”的倒排索引，
+生成Prompt时据此告诉LLM问题中的取值分别位于哪一列。
+
+查找问题中的取值时，只按索引中出现过的取值长度切分问题子串做字典查找，
+查找开销只与问题长度有关，与数据行数无关。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_profilers.column_ranker import normalize_text
+
+
+@dataclass
+class ValueLocation:
+    # 所在列
+    column: str
+    # 出现次数
+    frequency: int
+    # 原始取值（未归一化）
+    value: str
+
+
+class ValueIndex:
+    def __init__(self, entries: Dict[str, List[ValueLocation]]):
+        """
+        :param entries: 归一化取值 -> 取值所在的列（按出现次数从高到低）
+        """
+        self._entries = entries
+        self._lengths = sorted({len(key) for key in entries}, reverse=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, max_distinct: int = 10000, min_length: int = 2, max_length: int = 30) -> 'ValueIndex':
+        """
+        为文本/分类列建立索引
+        :param df:
+        :param max_distinct: 每列最多索引的不同取值数，超出时只保留出现次数最多的取值
+        :param min_length: 参与索引的取值最短长度，过短的取值容易误匹配
+        :param max_length: 参与索引的取值最大长度，过长的一般是备注等自由文本
+        :return:
+        """
+        entries: Dict[str, List[ValueLocation]] = {}
+        for col in df.columns.unique():
+            series = df[col]
+            if isinstance(series, pd.DataFrame):
+                continue
+            if not (pd.api.types.is_object_dtype(series.dtype)
+                    or pd.api.types.is_string_dtype(series.dtype)
+                    or isinstance(series.dtype, pd.CategoricalDtype)):
+                continue
+
+            value_counts = series.value_counts(dropna=True).head(max_distinct)
+            value_counts = value_counts[value_counts > 0]
+            originals = value_counts.index.astype(str)
+            keys = originals.str.normalize('NFKC').str.lower().str.strip()
+            key_lengths = keys.str.len()
+            valid = np.asarray((key_lengths >= min_length) & (key_lengths <= max_length))
+
+            for key, original, frequency in zip(keys[valid], originals[valid], value_counts.to_numpy()[valid]):
+                locations = entries.setdefault(key, [])
+                # 同一列中归一化后相同的取值合并计数
+                for location in locations:
+                    if location.column == col:
+                        location.frequency += int(frequency)
+                        break
+                else:
+                    locations.append(ValueLocation(column=col, frequency=int(frequency), value=original))
+
+        for locations in entries.values():
+            locations.sort(key=lambda location: -location.frequency)
+        return cls(entries)
+
+    def lookup(self, value) -> List[ValueLocation]:
+        return self._entries.get(normalize_text(value), [])
+
+    def find_mentions(self, question: str) -> List[Tuple[str, List[ValueLocation]]]:
+        """
+        查找问题中提到的取值，优先匹配较长的取值，被更长取值覆盖的子串不再单独匹配
+        :param question:
+        :return: [(问题中的取值, 取值所在的列)]，按在问题中出现的位置排序
+        """
+        text = normalize_text(question)
+        covered = [False] * len(text)
+        mentions = []
+        for length in self._lengths:
+            for start in range(len(text) - length + 1):
+                if all(covered[start:start + length]):
+                    continue
+                locations = self._entries.get(text[start:start + length])
+                if locations:
+                    mentions.append((start, text[start:start + length], locations))
+                    covered[start:start + length] = [True] * length
+        mentions.sort(key=lambda mention: mention[0])
+        return [(value, locations) for _, value, locations in mentions]
+
+
+def describe_value_mentions(value_index: ValueIndex, question: str, max_mentions: int = 10, max_columns: int = 3) -> str:
+    """
+    生成问题中提及取值的位置说明，供Prompt使用；未提及任何已知取值时返回空字符串
+    """
+    if value_index is None:
+        return ''
+
+    mentions = value_index.find_mentions(question)[:max_mentions]
+    if not mentions:
+        return ''
+
+    lines = []
+    for _, locations in mentions:
+        where = '，'.join(f"列「{location.column}」（出现{location.frequency:,}次）" for location in locations[:max_columns])
+        lines.append(f"- “{locations[0].value}”：位于{where}")
+    return "问题中提及的取值所在列：\n" + '\n'.join(lines)
@@ -1,7 +1,20 @@
+import asyncio
+import json
 import time
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Callable
 
+import config
 import utils
+from llms.rate_limiter import get_rate_limiter
+from llms.response_cache import LLMResponseCache, make_cache_key
+from llms.retry_policy import backoff_delay, is_retryable, retry_after_seconds
+from llms.usage import record_cache_hit
+from utils.metrics import metrics
+
+# 尚未按配置创建响应缓存的标记
+_UNSET = object()
 
 
 class BaseLLM(ABC):
@@ -15,28 +28,242 @@ class BaseLLM(ABC):
         self.logger = utils.get_logger(self.__class__.__name__)
         self.model_name = model_name
         self.extra_body = extra_body
+        self._response_cache = _UNSET
+
+    @property
+    def response_cache(self):
+        """
+        LLM响应缓存，首次使用时按配置创建，未开启时为 None
+        """
+        if self._response_cache is _UNSET:
+            self._response_cache = LLMResponseCache.from_config()
+        return self._response_cache
+
+    def _cache_key(self, prompt, kwargs):
+        # 生成参数包括实例上的默认参数和本次调用传入的参数
+        generation_kwargs = {**getattr(self, 'kwargs', {}), **kwargs, 'extra_body': self.extra_body}
+        return make_cache_key(self.model_name, prompt, generation_kwargs)
+
+    def _get_cached_response(self, prompt, kwargs):
+        if self.response_cache is None:
+            return None, None
+        key = self._cache_key(prompt, kwargs)
+        resp = self.response_cache.get(key)
+        if resp is not None:
+            self.logger.info(f"prompt {prompt[:20]}, llm response cache hit")
+            record_cache_hit()
+        return key, resp
+
+    def discard_cached_response(self, prompt, **kwargs):
+        """
+        删除Prompt对应的缓存响应（如缓存的代码执行失败时调用），kwargs 需与调用时一致
+        """
+        if self.response_cache is not None:
+            self.response_cache.delete(self._cache_key(prompt, kwargs))
 
     @abstractmethod
     def chat(self, prompt, **kwargs):
         pass
 
-    def chat_with_retry(self, prompt, max_retry=3, error_sleeping_seconds=8, **kwargs):
+    def _estimate_tokens(self, prompt, kwargs) -> int:
+        """
+        估算一次请求消耗的token数（Prompt加输出），用于每分钟token数限流
+        """
+        text = prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False)
+        completion_tokens = kwargs.get('max_tokens') or config.get_config().get('llm_rate_limit', {}).get('completion_tokens', 1024)
+        return utils.estimate_tokens(text) + completion_tokens
+
+    def _rate_limited(self, prompt, kwargs):
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is None:
+            return nullcontext()
+        return rate_limiter.acquire(self._estimate_tokens(prompt, kwargs))
+
+    def _arate_limited(self, prompt, kwargs):
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is None:
+            return nullcontext()
+        return rate_limiter.aacquire(self._estimate_tokens(prompt, kwargs))
+
+    def _retry_delay(self, prompt, e: Exception, attempt: int, max_retry: int, error_sleeping_seconds=None):
+        """
+        计算失败后重试前的等待时长；不可重试的错误直接抛出
+        :param attempt: 已失败的次数减一
+        :param error_sleeping_seconds: 退避的基础时长，为空时使用配置
+        """
+        retry_config = config.get_config().get('llm_retry', {})
+        if not is_retryable(e):
+            self.logger.error(f"prompt {prompt[:20]}, chat error: {e}, not retryable")
+            metrics.increment('llm.errors', retryable=False)
+            raise e
+        metrics.increment('llm.errors', retryable=True)
+        base_delay = retry_config.get('base_delay_seconds', 2) if error_sleeping_seconds is None else error_sleeping_seconds
+        delay = backoff_delay(attempt, base_delay, retry_config.get('max_delay_seconds', 60), retry_after_seconds(e))
+        self.logger.error(f"prompt {prompt[:20]}, chat error: {e}, retry left: {max_retry - attempt - 1}, sleeping {delay:.2f} seconds")
+        return delay
+
+    def chat_with_retry(self, prompt, max_retry=3, error_sleeping_seconds=None, use_cache=False, **kwargs):
         """
-        增加一个带重试的方法，使上层调用更稳定
+        增加一个带重试的方法，使上层调用更稳定：按指数退避加随机抖动重试，遵循服务端的 Retry-After，
+        不可重试的错误（如参数错误、鉴权失败）直接抛出；每次请求前经过共享的限流器
         :param prompt:
         :param max_retry:
-        :param error_sleeping_seconds:
+        :param error_sleeping_seconds: 退避的基础时长（秒），为空时使用配置 llm_retry.base_delay_seconds
+        :param use_cache: 是否使用LLM响应缓存（需在配置中开启），相同的模型、Prompt和生成参数直接返回缓存的响应
         :param kwargs:
         :return:
         """
-        while max_retry > 0:
+        cache_key = None
+        if use_cache:
+            cache_key, resp = self._get_cached_response(prompt, kwargs)
+            if resp is not None:
+                return resp
+
+        for attempt in range(max_retry):
             try:
-                return self.chat(prompt, **kwargs)
+                with self._rate_limited(prompt, kwargs):
+                    resp = self.chat(prompt, **kwargs)
+                if cache_key is not None:
+                    self.response_cache.set(cache_key, resp)
+                return resp
             except Exception as e:
-                self.logger.error(f"prompt {prompt[:20]}, chat error: {e}, retry left: {max_retry}, sleeping {error_sleeping_seconds} seconds")
-                time.sleep(error_sleeping_seconds)
-                max_retry -= 1
+                delay = self._retry_delay(prompt, e, attempt, max_retry, error_sleeping_seconds)
+                if attempt + 1 < max_retry:
+                    time.sleep(delay)
         raise ValueError(f'chat failed after {max_retry} retries')
 
+    @property
+    def supports_stream(self) -> bool:
+        """
+        是否支持流式输出；包装其他LLM的类（如路由）按被包装的LLM判断
+        """
+        return type(self).stream_chat is not BaseLLM.stream_chat
+
+    @property
+    def supports_astream(self) -> bool:
+        return type(self).astream_chat is not BaseLLM.astream_chat
+
     def stream_chat(self, prompt, **kwargs):
         raise NotImplementedError
+
+    def stream_until(self, prompt, until: Callable[[str], bool], max_retry=3, error_sleeping_seconds=None,
+                     use_cache=False, **kwargs):
+        """
+        带重试的流式调用，每收到一段输出调用一次 until(已收到的文本)，返回 True 时关闭流，不再等待剩余的输出
+        （如代码块闭合后无需等待其后的说明文字）；不支持流式输出的LLM退化为 chat_with_retry
+        :param prompt:
+        :param until: 判断已收到的文本是否足够的函数
+        :param max_retry:
+        :param error_sleeping_seconds:
+        :param use_cache: 是否使用LLM响应缓存，缓存的是停止时已收到的文本
+        :param kwargs:
+        :return: 已收到的文本
+        """
+        cache_key = None
+        if use_cache:
+            cache_key, resp = self._get_cached_response(prompt, kwargs)
+            if resp is not None:
+                return resp
+
+        if not self.supports_stream:
+            return self.chat_with_retry(prompt, max_retry, error_sleeping_seconds, use_cache, **kwargs)
+
+        for attempt in range(max_retry):
+            resp = ''
+            try:
+                with self._rate_limited(prompt, kwargs):
+                    stream = self.stream_chat(prompt, **kwargs)
+                    try:
+                        for piece in stream:
+                            resp += piece
+                            if until(resp):
+                                break
+                    finally:
+                        stream.close()
+            except Exception as e:
+                delay = self._retry_delay(prompt, e, attempt, max_retry, error_sleeping_seconds)
+                if attempt + 1 < max_retry:
+                    time.sleep(delay)
+                continue
+            if cache_key is not None:
+                self.response_cache.set(cache_key, resp)
+            return resp
+        raise ValueError(f'stream chat failed after {max_retry} retries')
+
+    async def achat(self, prompt, **kwargs):
+        """
+        异步调用，在MCP工具等 async 代码中使用，等待LLM返回时不阻塞事件循环；
+        子类没有异步客户端时，默认在工作线程中调用 chat
+        """
+        return await asyncio.to_thread(self.chat, prompt, **kwargs)
+
+    async def achat_with_retry(self, prompt, max_retry=3, error_sleeping_seconds=None, use_cache=False, **kwargs):
+        """
+        带重试的异步调用，重试等待期间不阻塞事件循环
+        :param prompt:
+        :param max_retry:
+        :param error_sleeping_seconds:
+        :param use_cache: 是否使用LLM响应缓存，同 chat_with_retry
+        :param kwargs:
+        :return:
+        """
+        cache_key = None
+        if use_cache:
+            cache_key, resp = await asyncio.to_thread(self._get_cached_response, prompt, kwargs)
+            if resp is not None:
+                return resp
+
+        for attempt in range(max_retry):
+            try:
+                async with self._arate_limited(prompt, kwargs):
+                    resp = await self.achat(prompt, **kwargs)
+                if cache_key is not None:
+                    await asyncio.to_thread(self.response_cache.set, cache_key, resp)
+                return resp
+            except Exception as e:
+                delay = self._retry_delay(prompt, e, attempt, max_retry, error_sleeping_seconds)
+                if attempt + 1 < max_retry:
+                    await asyncio.sleep(delay)
+        raise ValueError(f'chat failed after {max_retry} retries')
+
+    def astream_chat(self, prompt, **kwargs):
+        """
+        异步流式输出，子类以异步生成器重写，逐段 yield 文本；是否支持通过 supports_astream 判断
+        """
+        raise NotImplementedError
+
+    async def astream_until(self, prompt, until: Callable[[str], bool], max_retry=3, error_sleeping_seconds=None,
+                            use_cache=False, **kwargs):
+        """
+        stream_until 的异步版本，不支持异步流式输出的LLM退化为 achat_with_retry
+        """
+        cache_key = None
+        if use_cache:
+            cache_key, resp = await asyncio.to_thread(self._get_cached_response, prompt, kwargs)
+            if resp is not None:
+                return resp
+
+        if not self.supports_astream:
+            return await self.achat_with_retry(prompt, max_retry, error_sleeping_seconds, use_cache, **kwargs)
+
+        for attempt in range(max_retry):
+            resp = ''
+            try:
+                async with self._arate_limited(prompt, kwargs):
+                    stream = self.astream_chat(prompt, **kwargs)
+                    try:
+                        async for piece in stream:
+                            resp += piece
+                            if until(resp):
+                                break
+                    finally:
+                        await stream.aclose()
+            except Exception as e:
+                delay = self._retry_delay(prompt, e, attempt, max_retry, error_sleeping_seconds)
+                if attempt + 1 < max_retry:
+                    await asyncio.sleep(delay)
+                continue
+            if cache_key is not None:
+                await asyncio.to_thread(self.response_cache.set, cache_key, resp)
+            return resp
+        raise ValueError(f'stream chat failed after {max_retry} retries')
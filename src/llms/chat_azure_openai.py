@@ -1,14 +1,16 @@
 import os
 
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI, AzureOpenAI
 
+from llms.base_llm import BaseLLM
 from llms.chat_openai import ChatOpenAI
 
 
 class ChatAzureOpenAI(ChatOpenAI):
     def __init__(self, model_name=None, remove_think=False, extra_body=None, **kwargs):
-        super().__init__(model_name=model_name, extra_body=extra_body)
+        # 不调用 ChatOpenAI.__init__，只配置了 Azure 时不需要 OPENAI_API_KEY
+        BaseLLM.__init__(self, model_name=model_name, extra_body=extra_body)
 
         load_dotenv()
 
@@ -17,6 +19,14 @@ class ChatAzureOpenAI(ChatOpenAI):
             azure_endpoint=os.environ['AZURE_ENDPOINT'],
             azure_deployment=os.environ['AZURE_DEPLOYMENT'],
             api_version=os.environ['AZURE_API_VERSION'],
+            max_retries=0,
+        )
+        self.async_client = AsyncAzureOpenAI(
+            api_key=os.environ['AZURE_API_KEY'],
+            azure_endpoint=os.environ['AZURE_ENDPOINT'],
+            azure_deployment=os.environ['AZURE_DEPLOYMENT'],
+            api_version=os.environ['AZURE_API_VERSION'],
+            max_retries=0,
         )
         self.model_name = model_name or os.environ['AZURE_DEPLOYMENT']
         self.remove_think = remove_think
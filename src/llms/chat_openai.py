@@ -1,56 +1,116 @@
 import os
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from llms.base_llm import BaseLLM
+from llms.usage import CallTracker
 
 
 class ChatOpenAI(BaseLLM):
-    def __init__(self, model_name=None, remove_think=False, extra_body=None, **kwargs):
+    def __init__(self, model_name=None, remove_think=False, extra_body=None, base_url=None, api_key=None, **kwargs):
+        """
+        :param base_url: 服务地址，为空时使用环境变量 OPENAI_BASE_URL；自部署的 vLLM 等 OpenAI 兼容服务同样适用
+        :param api_key: 为空时使用环境变量 OPENAI_API_KEY
+        """
         super().__init__(model_name=model_name, extra_body=extra_body)
 
         load_dotenv()
 
+        base_url = base_url or os.environ.get('OPENAI_BASE_URL')
+        api_key = api_key or os.environ['OPENAI_API_KEY']
+        # 重试由 BaseLLM 统一处理（退避、限流），关闭SDK自带的重试，避免重试次数叠加
         self.client = OpenAI(
-            base_url=os.environ.get('OPENAI_BASE_URL'),
-            api_key=os.environ['OPENAI_API_KEY']
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0
+        )
+        self.async_client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0
         )
         self.model_name = model_name or os.environ['OPENAI_MODEL_NAME']
         self.remove_think = remove_think
         self.kwargs = kwargs
 
-    def chat(self, prompt, **kwargs):
-        self.kwargs.update(kwargs)
-        kwargs = self.kwargs
+    def _build_request(self, prompt, kwargs):
+        # 合并为新的参数字典，不修改 self.kwargs，同一实例被多个请求并发使用时参数互不影响
+        kwargs = {**self.kwargs, **kwargs}
         self.logger.info(f"chat kwargs: {kwargs}")
+        messages = [{'role': 'user', 'content': prompt}] if isinstance(prompt, str) else prompt
+        return messages, kwargs
 
-        resp = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{'role': 'user', 'content': prompt}] if isinstance(prompt, str) else prompt,
-            **kwargs
-        )
+    def _parse_response(self, resp):
         if self.remove_think:
             return resp.choices[0].message.content.split('</think>')[-1]
         return resp.choices[0].message.content
 
+    def chat(self, prompt, **kwargs):
+        messages, kwargs = self._build_request(prompt, kwargs)
+        with CallTracker(self.model_name, messages) as tracker:
+            resp = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                **kwargs
+            )
+            tracker.usage = resp.usage
+            return self._parse_response(resp)
+
     def stream_chat(self, prompt, **kwargs):
-        self.kwargs.update(kwargs)
-        kwargs = self.kwargs
-        self.logger.info(f"chat kwargs: {kwargs}")
+        messages, kwargs = self._build_request(prompt, kwargs)
+        with CallTracker(self.model_name, messages) as tracker:
+            resp = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=True,
+                # 可选，配置以后会在流式输出的最后一行展示token使用信息，记录到用量统计中
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            # 调用方提前停止迭代时关闭连接，服务端不再继续生成，此时没有用量信息，按本地估算
+            try:
+                for chunk in resp:
+                    if chunk.usage is not None:
+                        tracker.usage = chunk.usage
+                    if len(chunk.choices) == 0 or chunk.choices[0].delta.content is None:
+                        continue
+                    tracker.on_piece(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            finally:
+                resp.close()
 
-        resp = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{'role': 'user', 'content': prompt}] if isinstance(prompt, str) else prompt,
-            stream=True,
-            # 可选，配置以后会在流式输出的最后一行展示token使用信息
-            stream_options={"include_usage": True},
-            **kwargs
-        )
-        for chunk in resp:
-            if len(chunk.choices) == 0 or chunk.choices[0].delta.content is None:
-                continue
-            yield chunk.choices[0].delta.content
+    async def achat(self, prompt, **kwargs):
+        messages, kwargs = self._build_request(prompt, kwargs)
+        with CallTracker(self.model_name, messages) as tracker:
+            resp = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                **kwargs
+            )
+            tracker.usage = resp.usage
+            return self._parse_response(resp)
+
+    async def astream_chat(self, prompt, **kwargs):
+        messages, kwargs = self._build_request(prompt, kwargs)
+        with CallTracker(self.model_name, messages) as tracker:
+            resp = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            try:
+                async for chunk in resp:
+                    if chunk.usage is not None:
+                        tracker.usage = chunk.usage
+                    if len(chunk.choices) == 0 or chunk.choices[0].delta.content is None:
+                        continue
+                    tracker.on_piece(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            finally:
+                await resp.close()
 
 
 if __name__ == '__main__':
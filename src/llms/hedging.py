@@ -0,0 +1,228 @@
+"""
+对冲请求：降低LLM调用的长尾延迟
+
+HedgedLLM 包装任意 LLM（包括 LLMRouter），异步调用超过对冲阈值仍未返回时，再发送一个相同的请求，
+取先完成的结果并取消其余请求：
+- 阈值自适应：按最近请求延迟的分位数（默认 p90）计算，样本不足时使用初始阈值；流式调用按首段输出的时间计
+- 额度：每个请求最多对冲 max_hedges_per_request 次；全局每个请求累积 max_hedge_ratio 个对冲额度，
+  额度用完时不再对冲，额外的请求量不超过该比例
+- 对冲请求同样经过共享的限流器；包装 LLMRouter 时，路由按正在进行的请求数打分，对冲请求会发往其他后端
+
+同步调用（chat、stream_chat）在工作线程中执行，无法取消落后的请求，直接调用被包装的LLM，不做对冲。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import config
+from llms.base_llm import BaseLLM
+from utils.metrics import metrics
+
+
+class LatencyTracker:
+    def __init__(self, window_size: int = 200):
+        """
+        :param window_size: 保留最近多少个请求的延迟
+        """
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class HedgeBudget:
+    def __init__(self, ratio: float, burst: float = 10):
+        """
+        :param ratio: 每个请求累积的对冲额度，即对冲请求数占请求数的最大比例
+        :param burst: 额度上限，允许短时间内集中对冲的次数
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class HedgedLLM(BaseLLM):
+    def __init__(self, llm: BaseLLM, quantile: float = 0.9, min_samples: int = 20, initial_delay_seconds: float = 10,
+                 min_delay_seconds: float = 0.5, max_hedges_per_request: int = 1, max_hedge_ratio: float = 0.1,
+                 window_size: int = 200):
+        """
+        :param llm: 被包装的LLM
+        :param quantile: 对冲阈值取最近请求延迟的分位数
+        :param min_samples: 样本数达到该值后才按分位数计算阈值
+        :param initial_delay_seconds: 样本不足时的对冲阈值（秒）
+        :param min_delay_seconds: 对冲阈值的下限（秒），避免延迟普遍很低时频繁对冲
+        :param max_hedges_per_request: 每个请求最多的对冲次数
+        :param max_hedge_ratio: 对冲请求数占请求数的最大比例
+        :param window_size: 计算分位数使用的最近请求数
+        """
+        super().__init__(model_name=llm.model_name, extra_body=llm.extra_body)
+        self.llm = llm
+        # 生成参数与被包装的LLM一致，响应缓存的键不变
+        self.kwargs = getattr(llm, 'kwargs', {})
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_delay_seconds = initial_delay_seconds
+        self.min_delay_seconds = min_delay_seconds
+        self.max_hedges_per_request = max_hedges_per_request
+        self.budget = HedgeBudget(max_hedge_ratio)
+        # 非流式调用按完整耗时、流式调用按首段输出的时间分别统计
+        self.chat_latency = LatencyTracker(window_size)
+        self.stream_latency = LatencyTracker(window_size)
+
+    @classmethod
+    def from_config(cls, llm: BaseLLM) -> Optional['HedgedLLM']:
+        """
+        按配置包装LLM，未开启时返回 None
+        """
+        hedge_config = config.get_config().get('llm_hedging', {})
+        if not hedge_config.get('enabled', False):
+            return None
+        return cls(
+            llm,
+            quantile=hedge_config.get('quantile', 0.9),
+            min_samples=hedge_config.get('min_samples', 20),
+            initial_delay_seconds=hedge_config.get('initial_delay_seconds', 10),
+            min_delay_seconds=hedge_config.get('min_delay_seconds', 0.5),
+            max_hedges_per_request=hedge_config.get('max_hedges_per_request', 1),
+            max_hedge_ratio=hedge_config.get('max_hedge_ratio', 0.1),
+            window_size=hedge_config.get('window_size', 200)
+        )
+
+    @property
+    def supports_stream(self) -> bool:
+        return self.llm.supports_stream
+
+    @property
+    def supports_astream(self) -> bool:
+        return self.llm.supports_astream
+
+    def hedge_delay(self, tracker: LatencyTracker) -> float:
+        """
+        当前的对冲阈值（秒）
+        """
+        if len(tracker) < self.min_samples:
+            return self.initial_delay_seconds
+        return max(self.min_delay_seconds, tracker.quantile(self.quantile))
+
+    async def _race(self, prompt, kwargs, tracker: LatencyTracker, attempt: Callable[[], Awaitable[Any]],
+                    discard: Optional[Callable[[Any], Awaitable]] = None):
+        """
+        先发送一个请求，超过对冲阈值仍未完成时发送对冲请求，返回最先成功的结果，取消其余请求
+        :param attempt: 发送一次请求的函数
+        :param discard: 处理已完成但未被采用的结果（如关闭流）
+        """
+        self.budget.on_request()
+        metrics.increment('llm.hedge.requests')
+        delay = self.hedge_delay(tracker)
+        metrics.set('llm.hedge.delay_seconds', delay)
+        start = time.monotonic()
+        primary = asyncio.create_task(attempt())
+        all_tasks, pending = [primary], {primary}
+        hedges, next_hedge_at = 0, start + delay
+        winner, last_error = None, None
+
+        async def hedge_attempt():
+            # 对冲请求同样占用限流额度
+            async with self._arate_limited(prompt, kwargs):
+                return await attempt()
+
+        try:
+            while pending and winner is None:
+                can_hedge = hedges < self.max_hedges_per_request
+                timeout = max(0.0, next_hedge_at - time.monotonic()) if can_hedge else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if self.budget.try_spend():
+                        hedges += 1
+                        next_hedge_at += delay
+                        metrics.increment('llm.hedge.hedged')
+                        self.logger.info(f"prompt {prompt[:20]}, no response after {delay:.2f}s, sending hedge request {hedges}")
+                        task = asyncio.create_task(hedge_attempt())
+                        all_tasks.append(task)
+                        pending.add(task)
+                    else:
+                        # 额度用完，本次请求不再对冲
+                        hedges = self.max_hedges_per_request
+                        metrics.increment('llm.hedge.budget_exhausted')
+                    continue
+                for task in all_tasks:
+                    if task in done and task.exception() is None:
+                        winner = task
+                        break
+                    if task in done:
+                        last_error = task.exception()
+            if winner is None:
+                raise last_error
+            tracker.record(time.monotonic() - start)
+            if winner is not primary:
+                metrics.increment('llm.hedge.wins')
+            return winner.result()
+        finally:
+            for task in all_tasks:
+                task.cancel()
+            await asyncio.gather(*all_tasks, return_exceptions=True)
+            if discard is not None:
+                for task in all_tasks:
+                    if task is not winner and not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
+
+    def chat(self, prompt, **kwargs):
+        return self.llm.chat(prompt, **kwargs)
+
+    def stream_chat(self, prompt, **kwargs):
+        yield from self.llm.stream_chat(prompt, **kwargs)
+
+    async def achat(self, prompt, **kwargs):
+        return await self._race(prompt, kwargs, self.chat_latency, lambda: self.llm.achat(prompt, **kwargs))
+
+    async def astream_chat(self, prompt, **kwargs):
+        async def first_piece():
+            stream = self.llm.astream_chat(prompt, **kwargs)
+            try:
+                return await stream.__anext__(), stream
+            except StopAsyncIteration:
+                return '', None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def discard(result):
+            if result[1] is not None:
+                await result[1].aclose()
+
+        piece, stream = await self._race(prompt, kwargs, self.stream_latency, first_piece, discard)
+        if stream is None:
+            return
+        try:
+            yield piece
+            async for piece in stream:
+                yield piece
+        finally:
+            await stream.aclose()
@@ -0,0 +1,310 @@
+"""
+多个 OpenAI 兼容服务之间的路由
+
+LLMRouter 本身是一个 BaseLLM，持有若干后端（OpenAI、Azure、自部署的 vLLM 等），每次调用：
+- 按指数加权移动平均（EWMA）的延迟和错误率为后端打分，优先选择又快又稳的后端，未使用过的后端优先尝试；
+  打分同时考虑后端上正在进行的请求数，并发的重复请求（如对冲请求）会分散到其他后端
+- 后端连续失败达到阈值后熔断，冷却期内不再选择；冷却期过后放行一个探测请求，成功则恢复
+- 某个后端失败时立即换下一个后端重试（故障转移），全部失败后才交给 BaseLLM 的退避重试
+
+流式调用的延迟按首段输出的时间计；已经输出内容后的失败不再转移，直接抛出由上层重试。
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import config
+from llms.base_llm import BaseLLM
+from llms.chat_azure_openai import ChatAzureOpenAI
+from llms.chat_openai import ChatOpenAI
+from llms.retry_policy import get_status_code, is_retryable
+from utils.metrics import metrics
+
+# 后端自身配置导致的错误（鉴权失败、模型不存在），换一个后端可能成功；其余不可重试的错误（如参数错误）直接抛出
+BACKEND_ERROR_STATUS_CODES = {401, 403, 404}
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, cooldown_seconds: float = 30):
+        """
+        :param failure_threshold: 连续失败多少次后熔断
+        :param cooldown_seconds: 熔断后多久放行探测请求
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        是否允许向后端发送请求；冷却期过后放行一个探测请求，探测请求没有结果（如被取消）时，再过一个冷却期放行下一个
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> bool:
+        """
+        :return: 本次失败是否导致熔断
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+
+class Backend:
+    def __init__(self, name: str, llm: BaseLLM, ewma_alpha: float = 0.3, failure_threshold: int = 3,
+                 cooldown_seconds: float = 30):
+        """
+        :param name: 后端名称，用于日志和指标
+        :param llm: 后端的LLM实例
+        :param ewma_alpha: 延迟和错误率的平滑系数，越大越看重最近的请求
+        """
+        self.name = name
+        self.llm = llm
+        self.ewma_alpha = ewma_alpha
+        self.breaker = CircuitBreaker(failure_threshold, cooldown_seconds)
+        # 未使用过时延迟为 None
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        # 正在进行的请求数
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def score(self) -> float:
+        """
+        预期的请求耗时，越小越优先：延迟按错误率放大，错误率越高，需要重试的概率越大；
+        正在进行的请求越多，新请求的排队可能越长
+        """
+        if self.latency_ewma is None:
+            return float(self.in_flight)
+        return self.latency_ewma * (1 + self.in_flight) / max(1 - self.error_rate, 0.05)
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _update(self, latency: Optional[float], error: float):
+        with self._lock:
+            self.error_rate += self.ewma_alpha * (error - self.error_rate)
+            if latency is not None:
+                if self.latency_ewma is None:
+                    self.latency_ewma = latency
+                else:
+                    self.latency_ewma += self.ewma_alpha * (latency - self.latency_ewma)
+        metrics.set('llm.router.error_rate', self.error_rate, backend=self.name)
+        if self.latency_ewma is not None:
+            metrics.set('llm.router.latency_ewma', self.latency_ewma, backend=self.name)
+
+    def record_success(self, latency: float):
+        self._update(latency, 0.0)
+        self.breaker.record_success()
+        metrics.increment('llm.router.requests', backend=self.name, outcome='success')
+
+    def record_failure(self):
+        self._update(None, 1.0)
+        if self.breaker.record_failure():
+            metrics.increment('llm.router.circuit_open', backend=self.name)
+        metrics.increment('llm.router.requests', backend=self.name, outcome='failure')
+
+
+class LLMRouter(BaseLLM):
+    def __init__(self, backends: List[Backend]):
+        """
+        :param backends: 后端列表，顺序仅在打分相同时作为优先级
+        """
+        if not backends:
+            raise ValueError("LLMRouter 至少需要一个后端")
+        super().__init__(model_name='router:' + ','.join(backend.llm.model_name or backend.name for backend in backends))
+        self.backends = backends
+
+    @property
+    def supports_stream(self) -> bool:
+        return all(backend.llm.supports_stream for backend in self.backends)
+
+    @property
+    def supports_astream(self) -> bool:
+        return all(backend.llm.supports_astream for backend in self.backends)
+
+    @classmethod
+    def from_config(cls) -> Optional['LLMRouter']:
+        """
+        按配置创建路由，未开启时返回 None
+        """
+        router_config = config.get_config().get('llm_router', {})
+        if not router_config.get('enabled', False):
+            return None
+        backends = [
+            Backend(
+                name=backend_config.get('name') or f'backend{i}',
+                llm=create_backend_llm(backend_config),
+                ewma_alpha=router_config.get('ewma_alpha', 0.3),
+                failure_threshold=router_config.get('failure_threshold', 3),
+                cooldown_seconds=router_config.get('cooldown_seconds', 30)
+            )
+            for i, backend_config in enumerate(router_config.get('backends', []))
+        ]
+        return cls(backends)
+
+    def _candidates(self) -> Iterator[Backend]:
+        """
+        依次产出本次调用尝试的后端：按打分排序，跳过熔断的后端；全部熔断时仍按打分尝试，不直接失败
+        """
+        ranked = sorted(self.backends, key=lambda backend: backend.score())
+        skipped = []
+        for backend in ranked:
+            # 尝试到该后端时才检查熔断状态，避免占用了探测名额却没有发送请求
+            if backend.breaker.allow():
+                yield backend
+            else:
+                skipped.append(backend)
+        if len(skipped) == len(ranked):
+            yield from skipped
+
+    def _on_failure(self, backend: Backend, e: Exception):
+        """
+        记录后端失败；请求本身的错误不再换后端，直接抛出
+        """
+        if not is_retryable(e) and get_status_code(e) not in BACKEND_ERROR_STATUS_CODES:
+            raise e
+        backend.record_failure()
+        self.logger.warning(f"backend {backend.name} failed: {e}, trying next backend")
+
+    def chat(self, prompt, **kwargs):
+        last_error = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            try:
+                with backend.track():
+                    resp = backend.llm.chat(prompt, **kwargs)
+            except Exception as e:
+                self._on_failure(backend, e)
+                last_error = e
+                continue
+            backend.record_success(time.monotonic() - start)
+            return resp
+        raise last_error
+
+    def stream_chat(self, prompt, **kwargs):
+        last_error = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            started = False
+            try:
+                with backend.track():
+                    stream = backend.llm.stream_chat(prompt, **kwargs)
+                    try:
+                        for piece in stream:
+                            if not started:
+                                started = True
+                                backend.record_success(time.monotonic() - start)
+                            yield piece
+                    finally:
+                        stream.close()
+            except Exception as e:
+                if started:
+                    # 已经输出了部分内容，不能换后端接着输出
+                    backend.record_failure()
+                    raise
+                self._on_failure(backend, e)
+                last_error = e
+                continue
+            if not started:
+                backend.record_success(time.monotonic() - start)
+            return
+        raise last_error
+
+    async def achat(self, prompt, **kwargs):
+        last_error = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            try:
+                with backend.track():
+                    resp = await backend.llm.achat(prompt, **kwargs)
+            except Exception as e:
+                self._on_failure(backend, e)
+                last_error = e
+                continue
+            backend.record_success(time.monotonic() - start)
+            return resp
+        raise last_error
+
+    async def astream_chat(self, prompt, **kwargs):
+        last_error = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            started = False
+            try:
+                with backend.track():
+                    stream = backend.llm.astream_chat(prompt, **kwargs)
+                    try:
+                        async for piece in stream:
+                            if not started:
+                                started = True
+                                backend.record_success(time.monotonic() - start)
+                            yield piece
+                    finally:
+                        await stream.aclose()
+            except Exception as e:
+                if started:
+                    backend.record_failure()
+                    raise
+                self._on_failure(backend, e)
+                last_error = e
+                continue
+            if not started:
+                backend.record_success(time.monotonic() - start)
+            return
+        raise last_error
+
+
+def create_backend_llm(backend_config: dict) -> BaseLLM:
+    """
+    按后端配置创建LLM实例
+    :param backend_config: type 为 openai（OpenAI 及 vLLM 等兼容服务）或 azure（使用 AZURE_* 环境变量）；
+        base_url、model_name 为空时使用环境变量；api_key_env 为存放 API Key 的环境变量名
+    """
+    backend_type = backend_config.get('type', 'openai')
+    model_name = backend_config.get('model_name')
+    remove_think = backend_config.get('remove_think', False)
+    if backend_type == 'azure':
+        return ChatAzureOpenAI(model_name=model_name, remove_think=remove_think)
+    if backend_type != 'openai':
+        raise ValueError(f"不支持的后端类型：{backend_type}")
+    api_key_env = backend_config.get('api_key_env')
+    return ChatOpenAI(
+        model_name=model_name,
+        remove_think=remove_think,
+        base_url=backend_config.get('base_url'),
+        api_key=os.environ[api_key_env] if api_key_env else None
+    )
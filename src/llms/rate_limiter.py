@@ -0,0 +1,180 @@
+"""
+LLM 调用的限流
+
+所有代码生成器、纠错器共享一个进程内的限流器：
+- 每分钟请求数（RPM）、每分钟token数（TPM）两个令牌桶，按预留的方式计算等待时长，先到的请求先获得令牌
+- 最大并发数，超出时排队等待
+
+同步调用（工作线程中）和异步调用（事件循环中）共用同一份额度，排队数和等待时长记录到运行指标中。
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import config
+from utils.metrics import metrics
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        :param rate_per_minute: 每分钟补充的令牌数
+        :param capacity: 桶容量，即允许的突发量，默认为一分钟的令牌数
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        预留令牌，返回需要等待的秒数；令牌不足时余额为负，之后的请求需要等待更久，从而按到达顺序排队
+        """
+        # 单次请求超过桶容量时按容量计，避免永远等不到
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self._active < self.max_concurrency:
+                self._active += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self.max_concurrency:
+                self._condition.wait()
+            self._active += 1
+
+    async def aacquire(self):
+        # 与同步调用共用计数，事件循环中不能阻塞在线程锁上，短间隔轮询
+        interval = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.05)
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+class LLMRateLimiter:
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: Optional[int] = None):
+        """
+        :param requests_per_minute: 每分钟最多请求数，为空时不限制
+        :param tokens_per_minute: 每分钟最多token数（Prompt和输出合计），为空时不限制
+        :param max_concurrency: 最大并发请求数，为空时不限制
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = ConcurrencyLimiter(max_concurrency) if max_concurrency else None
+        self._queue_depth = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    def _enter_queue(self):
+        with self._lock:
+            self._queue_depth += 1
+            metrics.set('llm.rate_limit.queue_depth', self._queue_depth)
+
+    def _leave_queue(self, wait_seconds: float):
+        with self._lock:
+            self._queue_depth -= 1
+            metrics.set('llm.rate_limit.queue_depth', self._queue_depth)
+        metrics.increment('llm.rate_limit.requests')
+        metrics.increment('llm.rate_limit.wait_seconds', wait_seconds)
+
+    def _reserve(self, tokens: int) -> float:
+        wait_seconds = 0.0
+        if self.request_bucket is not None:
+            wait_seconds = max(wait_seconds, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait_seconds = max(wait_seconds, self.token_bucket.reserve(tokens))
+        return wait_seconds
+
+    @contextmanager
+    def acquire(self, tokens: int):
+        """
+        同步调用获取额度，退出时释放并发名额
+        :param tokens: 本次请求预计消耗的token数
+        """
+        start = time.monotonic()
+        self._enter_queue()
+        try:
+            wait_seconds = self._reserve(tokens)
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+            if self.concurrency is not None:
+                self.concurrency.acquire()
+        finally:
+            self._leave_queue(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release()
+
+    @asynccontextmanager
+    async def aacquire(self, tokens: int):
+        """
+        acquire 的异步版本，等待期间不阻塞事件循环
+        """
+        start = time.monotonic()
+        self._enter_queue()
+        try:
+            wait_seconds = self._reserve(tokens)
+            if wait_seconds > 0:
+                await asyncio.sleep(wait_seconds)
+            if self.concurrency is not None:
+                await self.concurrency.aacquire()
+        finally:
+            self._leave_queue(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[LLMRateLimiter]:
+    """
+    获取进程内共享的限流器，首次调用时按配置创建，未开启时返回 None
+    """
+    global _rate_limiter
+    limit_config = config.get_config().get('llm_rate_limit', {})
+    if not limit_config.get('enabled', False):
+        return None
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = LLMRateLimiter(
+                requests_per_minute=limit_config.get('requests_per_minute'),
+                tokens_per_minute=limit_config.get('tokens_per_minute'),
+                max_concurrency=limit_config.get('max_concurrency')
+            )
+        return _rate_limiter
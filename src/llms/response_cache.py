@@ -0,0 +1,119 @@
+"""
+LLM 响应缓存
+
+相同文件上的相同问题生成的Prompt完全一致，每次仍要完整调用一次LLM。
+这里按 (模型, Prompt, 生成参数) 的哈希缓存LLM的返回，存储在本地 sqlite 文件中，
+进程重启后仍然有效，按过期时间和最大条数淘汰。
+
+Prompt 原样计入缓存key，问题和数据描述中的时间不做任何归一化。代码生成Prompt中的当前时间（{{current_time}}）
+只精确到日期，同一天内的重复请求可以命中，跨天后重新生成（问题中的“今天”“近7天”等相对日期仍然正确）。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import config
+
+def normalize_prompt(prompt) -> str:
+    """
+    归一化Prompt用于计算缓存key：消息列表等非文本Prompt按键排序序列化
+    """
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, ensure_ascii=False, sort_keys=True)
+    return prompt
+
+
+def make_cache_key(model_name, prompt, kwargs: dict) -> str:
+    payload = json.dumps(
+        {'model': model_name, 'prompt': normalize_prompt(prompt), 'kwargs': kwargs},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path: str, ttl_seconds: float = 86400, max_entries: int = 10000):
+        """
+        :param path: sqlite 文件路径
+        :param ttl_seconds: 缓存有效期（秒）
+        :param max_entries: 最大缓存条数，超出时淘汰最久未访问的条目
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS llm_responses ('
+                'key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed_at ON llm_responses (accessed_at)')
+
+    @classmethod
+    def from_config(cls) -> Optional['LLMResponseCache']:
+        """
+        按配置创建缓存，未开启时返回 None；相对路径相对于项目根目录
+        """
+        cache_config = config.get_config().get('llm_cache', {})
+        if not cache_config.get('enabled', False):
+            return None
+        path = cache_config.get('path', os.path.join('.cache', 'llm_responses.sqlite3'))
+        if not os.path.isabs(path):
+            path = os.path.join(config.proj_root, path)
+        return cls(path, ttl_seconds=cache_config.get('ttl_seconds', 86400), max_entries=cache_config.get('max_entries', 10000))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute('SELECT response, created_at FROM llm_responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE llm_responses SET accessed_at = ? WHERE key = ?', (now, key))
+            return response
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, response, now, now)
+            )
+            conn.execute('DELETE FROM llm_responses WHERE created_at < ?', (now - self.ttl_seconds,))
+            count = conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    'DELETE FROM llm_responses WHERE key IN '
+                    '(SELECT key FROM llm_responses ORDER BY accessed_at LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+
+    def delete(self, key: str):
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+
+    def __len__(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
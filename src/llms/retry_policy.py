@@ -0,0 +1,77 @@
+"""
+LLM 调用的重试策略
+
+- 指数退避加随机抖动（equal jitter：一半固定、一半随机），避免大量请求在同一时刻重试
+- 服务端返回 Retry-After / retry-after-ms 时，至少等待该时长
+- 参数错误、鉴权失败等重试也不会成功的错误（4xx，408/409/429 除外）直接抛出，不再重试
+
+这里不依赖具体的SDK，按异常上的 status_code、response.headers 判断，openai SDK 的异常均带有这两个属性
+"""
+
+import email.utils
+import random
+import time
+from typing import Optional
+
+# 可以重试的HTTP状态码：请求超时、冲突、限流以及服务端错误
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# 代码本身的错误，重试也不会成功
+NON_RETRYABLE_EXCEPTIONS = (NotImplementedError, TypeError)
+
+
+def get_status_code(e: Exception) -> Optional[int]:
+    status_code = getattr(e, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable(e: Exception) -> bool:
+    """
+    判断异常是否值得重试：没有状态码的异常（连接失败、超时等）和可重试的状态码重试，其余4xx和代码错误直接失败
+    """
+    if isinstance(e, NON_RETRYABLE_EXCEPTIONS):
+        return False
+    status_code = get_status_code(e)
+    if status_code is None:
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """
+    解析响应头中的 retry-after-ms 或 Retry-After（秒数或HTTP日期）
+    """
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get('retry-after-ms')
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000)
+        retry_after = headers.get('retry-after')
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次（从0开始）失败后的等待时长
+    :param attempt: 已失败的次数减一
+    :param base_delay: 退避的基础时长（秒）
+    :param max_delay: 单次等待的最长时长（秒）
+    :param retry_after: 服务端要求的最短等待时长
+    """
+    ceiling = min(max_delay, base_delay * (2 ** attempt))
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    if retry_after is not None:
+        # 在服务端要求的时长之上再加少量抖动，避免同一时刻集中重试
+        delay = retry_after + random.uniform(0, base_delay)
+    return delay
@@ -0,0 +1,219 @@
+"""
+LLM调用的用量统计
+
+每次实际发出的LLM请求（包括重试、故障转移和对冲请求）记录Prompt/输出token数、首token时间（流式调用）和总耗时，
+按调用方（PythonGenerator、CodeErrorCorrector 等）分别计入直方图；服务端没有返回用量时（如流式调用提前停止）按本地估算。
+- 调用方：在调用LLM前用 llm_caller(名称) 标记，通过 contextvars 传递，工作线程和子任务同样生效
+- 单次请求汇总：MCP工具用 track_request_usage 包装后，该次工具调用内的所有LLM调用汇总为一份用量，结束时输出到日志
+- 费用：配置 llm_usage.prices 中模型的单价后，按token数估算
+"""
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import List, Optional
+
+import config
+import utils
+from utils.metrics import SECONDS_BUCKETS, TOKEN_BUCKETS, metrics
+
+logger = utils.get_logger(__name__)
+
+_caller: ContextVar[str] = ContextVar('llm_caller', default='unknown')
+_request_usage: ContextVar[Optional['RequestUsage']] = ContextVar('llm_request_usage', default=None)
+
+
+@contextmanager
+def llm_caller(name: str):
+    """
+    标记其中的LLM调用所属的调用方
+    """
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def current_caller() -> str:
+    return _caller.get()
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    按配置的单价估算费用，未配置该模型的单价时为 None
+    """
+    price = config.get_config().get('llm_usage', {}).get('prices', {}).get(model)
+    if not price:
+        return None
+    return (prompt_tokens * price.get('prompt_per_1k_tokens', 0) + completion_tokens * price.get('completion_per_1k_tokens', 0)) / 1000
+
+
+@dataclass
+class CallUsage:
+    caller: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_seconds: float
+    # 首token时间，仅流式调用有
+    ttft_seconds: Optional[float] = None
+    # token数是否为本地估算
+    estimated: bool = False
+    succeeded: bool = True
+    cost: Optional[float] = None
+
+
+class RequestUsage:
+    """
+    一次工具调用内所有LLM调用的用量
+    """
+
+    def __init__(self):
+        self.calls: List[CallUsage] = []
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, call: CallUsage):
+        with self._lock:
+            self.calls.append(call)
+
+    def add_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def summary(self) -> dict:
+        """
+        :return: 总调用次数、token数、耗时、费用，以及按调用方的明细
+        """
+        with self._lock:
+            calls = list(self.calls)
+            cache_hits = self.cache_hits
+
+        def aggregate(items: List[CallUsage]) -> dict:
+            costs = [call.cost for call in items if call.cost is not None]
+            ttfts = [call.ttft_seconds for call in items if call.ttft_seconds is not None]
+            return {
+                'calls': len(items),
+                'failed_calls': sum(not call.succeeded for call in items),
+                'prompt_tokens': sum(call.prompt_tokens for call in items),
+                'completion_tokens': sum(call.completion_tokens for call in items),
+                'latency_seconds': round(sum(call.latency_seconds for call in items), 3),
+                'max_ttft_seconds': round(max(ttfts), 3) if ttfts else None,
+                'cost': round(sum(costs), 6) if costs else None,
+            }
+
+        callers = sorted({call.caller for call in calls})
+        return {
+            **aggregate(calls),
+            'cache_hits': cache_hits,
+            'by_caller': {caller: aggregate([call for call in calls if call.caller == caller]) for caller in callers},
+        }
+
+
+@contextmanager
+def track_request_usage(name: str):
+    """
+    汇总其中所有LLM调用的用量，结束时输出到日志
+    :param name: 请求名称，如工具名
+    """
+    request_usage = RequestUsage()
+    token = _request_usage.set(request_usage)
+    try:
+        yield request_usage
+    finally:
+        _request_usage.reset(token)
+        logger.info(f"{name} llm usage: {json.dumps(request_usage.summary(), ensure_ascii=False)}")
+
+
+def with_request_usage(func):
+    """
+    track_request_usage 的装饰器形式，用于 async 的MCP工具函数
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with track_request_usage(func.__name__):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def current_request_usage() -> Optional[RequestUsage]:
+    return _request_usage.get()
+
+
+def record_call(call: CallUsage):
+    """
+    记录一次LLM调用的用量到运行指标和当前请求的汇总
+    """
+    metrics.increment('llm.calls', caller=call.caller, succeeded=call.succeeded)
+    metrics.observe('llm.prompt_tokens', call.prompt_tokens, buckets=TOKEN_BUCKETS, caller=call.caller)
+    metrics.observe('llm.completion_tokens', call.completion_tokens, buckets=TOKEN_BUCKETS, caller=call.caller)
+    metrics.observe('llm.latency_seconds', call.latency_seconds, buckets=SECONDS_BUCKETS, caller=call.caller)
+    if call.ttft_seconds is not None:
+        metrics.observe('llm.ttft_seconds', call.ttft_seconds, buckets=SECONDS_BUCKETS, caller=call.caller)
+    if call.cost is not None:
+        metrics.increment('llm.cost', call.cost, caller=call.caller)
+    request_usage = current_request_usage()
+    if request_usage is not None:
+        request_usage.add(call)
+
+
+def record_cache_hit():
+    metrics.increment('llm.cache_hits', caller=current_caller())
+    request_usage = current_request_usage()
+    if request_usage is not None:
+        request_usage.add_cache_hit()
+
+
+class CallTracker:
+    """
+    跟踪一次LLM请求：创建时开始计时，流式调用收到首段输出时记录首token时间，退出时记录用量；
+    以异常退出时记为失败，调用方提前停止流式迭代（GeneratorExit）不算失败
+    """
+
+    def __init__(self, model: str, prompt):
+        self.model = model
+        self.prompt = prompt
+        self.caller = current_caller()
+        self.start = time.monotonic()
+        self.ttft_seconds: Optional[float] = None
+        self.text = ''
+        # 服务端返回的用量（openai SDK 的 CompletionUsage）
+        self.usage = None
+
+    def on_piece(self, piece: str):
+        if self.ttft_seconds is None:
+            self.ttft_seconds = time.monotonic() - self.start
+        self.text += piece
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(succeeded=exc_type is None or not issubclass(exc_type, Exception))
+        return False
+
+    def finish(self, succeeded: bool = True):
+        latency = time.monotonic() - self.start
+        if self.usage is not None:
+            prompt_tokens, completion_tokens, estimated = self.usage.prompt_tokens, self.usage.completion_tokens, False
+        else:
+            prompt_text = self.prompt if isinstance(self.prompt, str) else json.dumps(self.prompt, ensure_ascii=False)
+            prompt_tokens, completion_tokens, estimated = utils.estimate_tokens(prompt_text), utils.estimate_tokens(self.text), True
+        record_call(CallUsage(
+            caller=self.caller,
+            model=self.model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_seconds=latency,
+            ttft_seconds=self.ttft_seconds,
+            estimated=estimated,
+            succeeded=succeeded,
+            cost=estimate_cost(self.model, prompt_tokens, completion_tokens),
+        ))
@@ -1,21 +1,34 @@
 import os
 import json
+import asyncio
 import traceback
 from typing import List, Annotated
 
 from fastmcp import FastMCP, Context
 from fastmcp.tools.tool import ToolResult
 from pydantic import Field
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 import config
 import utils
 from code_executor import CodeExecutor
 from code_generators.python_generator import PythonGenerator
 from code_generators.table_operation_generator import TableOperationGenerator
+from speculative_executor import SpeculativeExecutor
+from stepwise_executor import CodeStep, StepwiseExecutor
 from table_operation_executor import TableOperationExecutor
 from data_accessors.csv_accessor import CSVAccessor
 from data_accessors.excel_accessor import ExcelAccessor
+from data_accessors.remote_csv import RemoteCSVAccessor, is_remote_path
 from llms.chat_openai import ChatOpenAI
+from llms.hedging import HedgedLLM
+from llms.llm_router import LLMRouter
+from llms.usage import with_request_usage
+from retrieval.code_store import CodeStore, schema_fingerprint
+from retrieval.few_shot import record_generation
+from retrieval.similarity import question_literals
+from utils.metrics import metrics
 
 mcp_transport = os.getenv('MCP_TRANSPORT_MODE', 'streamable-http')
 server_host = os.getenv('SERVER_HOST', '0.0.0.0')
@@ -25,7 +38,16 @@ mcp = FastMCP('data-analyzer')
 
 logger = utils.get_logger(__name__)
 
-llm = ChatOpenAI()
+# 配置了多个后端时通过路由调用，否则直接使用 OPENAI_* 环境变量配置的服务
+llm = LLMRouter.from_config() or ChatOpenAI()
+# 开启对冲请求时包装，超过延迟阈值的请求发送重复请求
+llm = HedgedLLM.from_config(llm) or llm
+
+# 已验证代码的存储，未开启时为 None
+code_store = CodeStore.from_config()
+
+# 仍在运行的后台任务（如预览时的质量分析）
+background_tasks = set()
 
 
 def get_data_accessor(path_or_url: str):
@@ -43,6 +65,42 @@ def get_data_accessor(path_or_url: str):
         raise TypeError("文件类型不支持")
     return data_accessor
 
+
+def load_and_profile(path_or_url: str, profile_join_keys: bool = False):
+    """
+    加载数据并完成探查，供工作线程调用
+    """
+    data_accessor = get_data_accessor(path_or_url)
+    data_accessor.get_data_summary()
+    if profile_join_keys:
+        data_accessor.get_column_signatures()
+    return data_accessor
+
+
+async def load_data_accessors(input_paths: List[str], context: Context, progress_start: float = 0.0, progress_end: float = 0.2):
+    """
+    在有界的工作线程池中并行加载、探查多个输入文件，每完成一个汇报一次进度
+    """
+    max_workers = config.get_config().get('data_load', {}).get('max_parallel_inputs', 4)
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+    profile_join_keys = len(input_paths) > 1
+    finished_count = 0
+
+    async def load(path: str):
+        nonlocal finished_count
+        async with semaphore:
+            data_accessor = await asyncio.to_thread(load_and_profile, path, profile_join_keys)
+        finished_count += 1
+        await context.report_progress(
+            progress=progress_start + (progress_end - progress_start) * finished_count / len(input_paths),
+            total=1.0,
+            message=f"完成数据加载（{finished_count}/{len(input_paths)}）：{path}",
+        )
+        return data_accessor
+
+    return list(await asyncio.gather(*[load(p) for p in input_paths]))
+
+
 @mcp.prompt(
     name='get_prompt',
     title='获取Prompt',
@@ -78,23 +136,120 @@ async def get_preview_data(
     """
     logger.info(f'filepath: {path_or_url}')
 
-    data_accessor = get_data_accessor(path_or_url)
-    
-    # 获取质量摘要用于日志记录
+    data_accessor = await asyncio.to_thread(get_preview_data_accessor, path_or_url)
+    structure_info = await asyncio.to_thread(lambda: data_accessor.structure_description)
+
+    # 质量分析（缺失率、重复行、异常值）在后台计算，结构信息不等待其完成
+    quality_description = await get_quality_description(data_accessor, context)
+    return "# 当前数据信息\n\n" + data_accessor.compose_description(structure_info, quality_description)
+
+
+def get_preview_data_accessor(path_or_url: str):
+    """
+    获取预览用的数据访问器：远程CSV通过 Range 请求抽样读取，不下载完整文件
+    """
+    remote_config = config.get_config().get('preview', {}).get('remote_csv', {})
+    if is_remote_path(path_or_url) and remote_config.get('enabled', True) and not path_or_url.lower().endswith('xlsx'):
+        try:
+            return RemoteCSVAccessor(
+                path_or_url,
+                head_bytes=remote_config.get('head_bytes', 4 * 1024 * 1024),
+                sample_blocks=remote_config.get('sample_blocks', 4),
+                block_bytes=remote_config.get('block_bytes', 256 * 1024),
+                timeout=remote_config.get('timeout', 30)
+            )
+        except Exception as e:
+            logger.info(f"remote csv sampling failed, fall back to full download: {e}")
+    return get_data_accessor(path_or_url)
+
+
+def build_quality_description(data_accessor) -> str:
+    """
+    计算数据质量概况，供工作线程调用
+    """
+    quality_summary = data_accessor.get_quality_summary()
+    if quality_summary:
+        logger.info(f"Data quality: {quality_summary['quality_level']}, score: {quality_summary['quality_score']}")
+    return data_accessor.get_quality_description()
+
+
+async def get_quality_description(data_accessor, context: Context) -> str:
+    """
+    获取数据质量概况：已有缓存时直接返回；否则在后台计算，最多等待配置的时长，
+    超时后先返回提示，计算结果写入缓存，下次调用 get_preview_data 时直接返回
+    """
+    if data_accessor.has_quality_summary():
+        return await asyncio.to_thread(data_accessor.get_quality_description)
+
+    wait_seconds = config.get_config().get('preview', {}).get('quality_wait_seconds', 2.0)
+    task = asyncio.create_task(asyncio.to_thread(build_quality_description, data_accessor))
+    done, _ = await asyncio.wait({task}, timeout=wait_seconds)
+    if task in done:
+        try:
+            return task.result()
+        except Exception as e:
+            logger.warning(f"Failed to get quality summary: {e}")
+            return ''
+
+    # 保留任务引用，避免后台任务被回收
+    background_tasks.add(task)
+    task.add_done_callback(finish_background_quality)
+    await context.report_progress(progress=1.0, total=1.0, message="数据结构已返回，数据质量分析在后台进行")
+    return ("## 📊 数据质量概况\n"
+            "> 数据量较大，质量分析（缺失率、重复行、异常值）正在后台进行，完成后再次调用 get_preview_data 可获取完整的质量概况")
+
+
+def finish_background_quality(task: asyncio.Task):
+    background_tasks.discard(task)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.warning(f"Failed to get quality summary: {task.exception()}")
+    else:
+        logger.info("background quality analysis finished")
+
+
+def run_reusable_code(data_accessor, question: str):
+    """
+    查找并执行同一表结构下相似问题已验证的代码，供工作线程调用
+    :return: (表结构指纹, 问题字面量, 执行结果)，没有可复用的代码或执行失败时执行结果为 None
+    """
+    schema_fp = schema_fingerprint(data_accessor.get_schema_summary())
+    literals = question_literals(question, data_accessor.get_value_index())
+    min_similarity = config.get_config().get('code_reuse', {}).get('min_similarity', 0.8)
+    match = code_store.find_reusable(schema_fp, question, literals, min_similarity)
+    if match is None:
+        return schema_fp, literals, None
+
+    example, score = match
     try:
-        quality_summary = data_accessor.get_quality_summary()
-        if quality_summary:
-            logger.info(f"Data quality: {quality_summary['quality_level']}, score: {quality_summary['quality_score']}")
+        ans_df = data_accessor.execute(example.code)
     except Exception as e:
-        logger.warning(f"Failed to get quality summary: {e}")
-    
-    return "# 当前数据信息\n\n" + data_accessor.description
+        logger.info(f"reused code failed, fall back to code generation: {e}")
+        code_store.remove(example)
+        return schema_fp, literals, None
+    code_store.mark_used(example)
+    logger.info(f"reuse code of '{example.question}' (similarity: {score:.2f})")
+    return schema_fp, literals, ans_df
+
+
+async def notify_step(context: Context, step: CodeStep):
+    """
+    分步执行时，每个步骤开始执行前发送步骤通知
+    """
+    await context.info(json.dumps({"key_step": True, "content": "", "step": step.name}, ensure_ascii=False))
+    await context.report_progress(
+        progress=min(0.9, 0.33 + 0.1 * step.index),
+        total=1.0,
+        message=f"执行步骤{step.index}：{step.name}",
+    )
 
 
 @mcp.tool(
     name='analyze_data',
     description='对数据进行分析，结果以字典数组形式组织'
 )
+@with_request_usage
 async def analyze_data(
         question: Annotated[str, Field(description="用户问题")],
         path_or_url: Annotated[str, Field(description="数据文件所在路径或者URL，仅支持Excel和CSV")],
@@ -118,40 +273,71 @@ async def analyze_data(
     path_or_url = path_or_url.strip()
     question = question.strip()
 
-    data_accessor = get_data_accessor(path_or_url)
+    data_accessor = await asyncio.to_thread(load_and_profile, path_or_url)
     await context.report_progress(
         progress=0.33,
         total=1.0,
         message="完成数据探查",
     )
 
-    code_generator = PythonGenerator(data_accessor, llm)
-    code_executor = CodeExecutor(data_accessor, llm)
-
-    try:
-        code = code_generator.generate_code(question)
-        await context.report_progress(
-            progress=0.67,
-            total=1.0,
-            message="完成代码生成",
-        )
-
-        ans_df = code_executor.execute(question, code)
-        await context.report_progress(
-            progress=1.0,
-            total=1.0,
-            message="完成代码执行",
-        )
+    # 相似问题已有验证过的代码时直接执行，跳过代码生成
+    ans_df = None
+    if code_store is not None:
+        schema_fp, literals, ans_df = await asyncio.to_thread(run_reusable_code, data_accessor, question)
+        if ans_df is not None:
+            await context.report_progress(
+                progress=1.0,
+                total=1.0,
+                message="复用已验证的代码，完成代码执行",
+            )
+
+    if ans_df is None:
+        try:
+            if config.get_config().get('stepwise_execution', {}).get('enabled', False):
+                # 按 # @step: 注释分步，边生成边执行
+                code_executor = StepwiseExecutor(data_accessor, llm, code_store)
+                code_generator = code_executor.generator
+                ans_df = await code_executor.arun(question, on_step=lambda step: notify_step(context, step))
+            elif config.get_config().get('speculative_generation', {}).get('enabled', False):
+                # 并发生成多份候选代码并行执行，取最先成功的
+                code_executor = SpeculativeExecutor(data_accessor, llm, code_store)
+                code_generator = code_executor.generator
+                ans_df = await code_executor.arun(question)
+            else:
+                code_generator = PythonGenerator(data_accessor, llm, code_store)
+                code_executor = CodeExecutor(data_accessor, llm)
+                code = await code_generator.agenerate_code(question)
+                await context.report_progress(
+                    progress=0.67,
+                    total=1.0,
+                    message="完成代码生成",
+                )
+                ans_df = await code_executor.aexecute(question, code)
+
+            if not code_executor.succeeded or code_executor.correction_count > 0:
+                code_generator.discard_cached_response()
+            record_generation(code_generator.example_count, code_executor.succeeded, code_executor.correction_count)
+            if code_executor.succeeded and code_store is not None:
+                await asyncio.to_thread(
+                    code_store.add, schema_fp, question, literals, code_executor.final_code,
+                    data_accessor.get_schema_summary().columns
+                )
+            await context.report_progress(
+                progress=1.0,
+                total=1.0,
+                message="完成代码执行",
+            )
 
-    except Exception as e:
-        logger.info(traceback.format_exc())
-        raise
+        except Exception as e:
+            logger.info(traceback.format_exc())
+            raise
 
     if len(ans_df) > 500:
         logger.info(f'ans_df.shape: {ans_df.shape}, truncate to 500 rows')
         ans_df = ans_df.head(500)
 
-    # structured_content要求是dict类型的
+    # structured_content要求是dict类型的，Arrow 字符串列的 pd.NA 无法序列化，先转换为 object
+    ans_df = utils.to_python_strings(ans_df)
     resp = ans_df.to_dict(orient='list')
     logger.info(f'{question} -> {resp}')
 
@@ -166,6 +352,7 @@ async def analyze_data(
     name='Table_operation',
     description='对数据表进行转换操作（如插入列、删除列、pivot、melt、筛选、排序、合并等），结果保存到指定的输出路径'
 )
+@with_request_usage
 async def operation_table(
         instruction: Annotated[str, Field(description="操作指令，详细描述需要对表格进行的转换操作，例如：'删除A列'、'按日期排序'、'将表1和表2按ID列合并'")],
         input_paths: Annotated[List[str], Field(description="输入文件路径列表，包含完整路径、文件名和后缀。单表操作传1个路径，多表操作（如合并）传多个路径。仅支持Excel(.xlsx)和CSV(.csv)格式")],
@@ -199,27 +386,25 @@ async def operation_table(
     output_path = output_path.strip()
     input_paths = [p.strip() for p in input_paths]
 
-    # 获取所有输入文件的数据访问器
-    data_accessors = [get_data_accessor(p) for p in input_paths]
-    await context.report_progress(
-        progress=0.2,
-        total=1.0,
-        message="完成数据加载",
-    )
+    # 每个输入文件的完整描述都要写入Prompt、数据都要传给生成的代码，无法延迟，
+    # 因此并行加载、探查所有输入文件，总耗时接近最慢的一个文件
+    data_accessors = await load_data_accessors(input_paths, context, progress_end=0.2)
 
     # 生成转换代码（使用第一个数据访问器作为主表）
     code_generator = TableOperationGenerator(data_accessors, llm)
     code_executor = TableOperationExecutor(data_accessors, llm)
 
     try:
-        code = code_generator.generate_code(instruction, input_paths, output_path)
+        code = await code_generator.agenerate_code(instruction, input_paths, output_path)
         await context.report_progress(
             progress=0.5,
             total=1.0,
             message="完成代码生成",
         )
 
-        result_df, operation_desc = code_executor.execute(instruction, code, input_paths, output_path)
+        result_df, operation_desc = await code_executor.aexecute(instruction, code, input_paths, output_path)
+        if not code_executor.succeeded or code_executor.correction_count > 0:
+            code_generator.discard_cached_response()
         await context.report_progress(
             progress=0.9,
             total=1.0,
@@ -247,6 +432,14 @@ async def operation_table(
     return json.dumps(result, ensure_ascii=False)
 
 
+@mcp.custom_route('/metrics', methods=['GET'])
+async def get_metrics(request: Request) -> JSONResponse:
+    """
+    运行指标，包括按调用方统计的LLM调用次数、token数、首token时间和耗时的直方图（仅 HTTP 传输方式可用）
+    """
+    return JSONResponse(metrics.snapshot())
+
+
 if __name__ == '__main__':
 
     mcp.run(transport=mcp_transport, host=server_host, port=server_port)
@@ -0,0 +1,256 @@
+"""
+已验证代码的存储与复用
+
+同一份数据（列名、类型相同）上的问题常常只是说法不同，如“各地区销售额”与“按地区统计销售总额”。
+代码执行成功后按 (表结构指纹, 归一化问题, 字面量, 最终执行成功的代码) 保存到本地 sqlite 文件，
+新问题到来时在同一表结构的历史问题中检索：相似度足够高且字面量完全一致时直接执行已保存的代码，跳过代码生成。
+不能直接复用时，按问题文本和列名检索最接近的若干条作为代码生成的参考示例（few-shot），提高首次生成即执行成功的比例。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import config
+from retrieval.similarity import NgramIndex, mutual_containment, normalize_question, question_ngrams
+from schema.data_summary import DataSummary
+
+
+def schema_fingerprint(data_summary: DataSummary) -> str:
+    """
+    表结构指纹：列名及其类型，与取值无关，同一结构的不同文件共享已保存的代码
+    """
+    payload = json.dumps(
+        [[col, str(data_summary.dtypes.get(col))] for col in data_summary.columns],
+        ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@dataclass(frozen=True)
+class CodeExample:
+    id: int
+    schema_fingerprint: str
+    question: str
+    normalized_question: str
+    literals: FrozenSet[str]
+    code: str
+    columns: Tuple[str, ...] = ()
+
+    @property
+    def ngrams(self) -> FrozenSet[str]:
+        return question_ngrams(self.normalized_question)
+
+
+class CodeStore:
+    def __init__(self, path: str, max_examples_per_schema: int = 200, max_examples: int = 5000):
+        """
+        :param path: sqlite 文件路径
+        :param max_examples_per_schema: 每个表结构最多保存的代码条数，超出时淘汰最久未使用的条目
+        :param max_examples: 所有表结构合计最多保存的代码条数，超出时淘汰最久未使用的条目
+        """
+        self.path = path
+        self.max_examples_per_schema = max_examples_per_schema
+        self.max_examples = max_examples
+        self._lock = threading.Lock()
+        # 按表结构指纹缓存的 (示例, n-gram索引)，增删代码时同步更新；键为 None 时为所有表结构的索引
+        self._indexes: Dict[Optional[str], Tuple[Dict[int, CodeExample], NgramIndex]] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS code_examples ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, schema_fingerprint TEXT NOT NULL, question TEXT NOT NULL, '
+                'normalized_question TEXT NOT NULL, literals TEXT NOT NULL, code TEXT NOT NULL, '
+                'created_at REAL NOT NULL, used_at REAL NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0, '
+                "columns TEXT NOT NULL DEFAULT '[]')"
+            )
+            existing_columns = {row[1] for row in conn.execute('PRAGMA table_info(code_examples)')}
+            if 'columns' not in existing_columns:
+                conn.execute("ALTER TABLE code_examples ADD COLUMN columns TEXT NOT NULL DEFAULT '[]'")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_code_examples_schema ON code_examples (schema_fingerprint)')
+
+    @classmethod
+    def from_config(cls) -> Optional['CodeStore']:
+        """
+        按配置创建存储，未开启时返回 None；相对路径相对于项目根目录
+        """
+        reuse_config = config.get_config().get('code_reuse', {})
+        if not reuse_config.get('enabled', False):
+            return None
+        path = reuse_config.get('path', os.path.join('.cache', 'code_examples.sqlite3'))
+        if not os.path.isabs(path):
+            path = os.path.join(config.proj_root, path)
+        return cls(
+            path,
+            max_examples_per_schema=reuse_config.get('max_examples_per_schema', 200),
+            max_examples=reuse_config.get('max_examples', 5000)
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, schema_fp: str, question: str, literals: FrozenSet[str], code: str, columns: Iterable[str] = ()):
+        """
+        保存执行成功的代码；同一表结构下归一化问题和字面量都相同的条目只保留最新的代码
+        :param columns: 数据的列名，用于按列名检索参考示例
+        """
+        normalized = normalize_question(question)
+        literals_json = json.dumps(sorted(literals), ensure_ascii=False)
+        columns = tuple(str(col) for col in columns)
+        columns_json = json.dumps(list(columns), ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # 被替换或淘汰的条目：[(id, 表结构指纹)]
+            removed = conn.execute(
+                'SELECT id, schema_fingerprint FROM code_examples '
+                'WHERE schema_fingerprint = ? AND normalized_question = ? AND literals = ?',
+                (schema_fp, normalized, literals_json)
+            ).fetchall()
+            cursor = conn.execute(
+                'INSERT INTO code_examples '
+                '(schema_fingerprint, question, normalized_question, literals, code, columns, created_at, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (schema_fp, question, normalized, literals_json, code, columns_json, now, now)
+            )
+            added = CodeExample(cursor.lastrowid, schema_fp, question, normalized, frozenset(literals), code, columns)
+            removed_ids = [row[0] for row in removed]
+            count = conn.execute(
+                'SELECT COUNT(*) FROM code_examples WHERE schema_fingerprint = ?', (schema_fp,)
+            ).fetchone()[0] - len(removed)
+            if count > self.max_examples_per_schema:
+                removed += conn.execute(
+                    'SELECT id, schema_fingerprint FROM code_examples WHERE schema_fingerprint = ? AND id NOT IN ({}) '
+                    'ORDER BY used_at, id LIMIT ?'.format(','.join('?' * len(removed_ids))),
+                    (schema_fp, *removed_ids, count - self.max_examples_per_schema)
+                ).fetchall()
+                removed_ids = [row[0] for row in removed]
+            total = conn.execute('SELECT COUNT(*) FROM code_examples').fetchone()[0] - len(removed)
+            if total > self.max_examples:
+                removed += conn.execute(
+                    'SELECT id, schema_fingerprint FROM code_examples WHERE id NOT IN ({}) '
+                    'ORDER BY used_at, id LIMIT ?'.format(','.join('?' * len(removed_ids))),
+                    (*removed_ids, total - self.max_examples)
+                ).fetchall()
+            conn.executemany('DELETE FROM code_examples WHERE id = ?', [(row[0],) for row in removed])
+            self._update_indexes(added, removed)
+
+    def remove(self, example: CodeExample):
+        """
+        删除执行失败的代码
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute('DELETE FROM code_examples WHERE id = ?', (example.id,))
+            self._update_indexes(None, [(example.id, example.schema_fingerprint)])
+
+    def mark_used(self, example: CodeExample):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'UPDATE code_examples SET used_at = ?, hit_count = hit_count + 1 WHERE id = ?',
+                (time.time(), example.id)
+            )
+
+    def _update_indexes(self, added: Optional[CodeExample], removed: List[Tuple[int, str]]):
+        """
+        将增删的条目同步到已加载的索引（对应表结构的索引和所有表结构的索引），不重新读取整张表；需持有 self._lock
+        """
+        for doc_id, schema_fp in removed:
+            for key in (schema_fp, None):
+                if key in self._indexes:
+                    examples, index = self._indexes[key]
+                    examples.pop(doc_id, None)
+                    index.remove(doc_id)
+        if added is not None:
+            for key in (added.schema_fingerprint, None):
+                if key in self._indexes:
+                    examples, index = self._indexes[key]
+                    examples[added.id] = added
+                    index.add(added.id, added.ngrams)
+
+    def _get_index(self, schema_fp: Optional[str]) -> Tuple[Dict[int, CodeExample], NgramIndex]:
+        """
+        获取索引，首次使用时从 sqlite 读取；索引会被增删操作原地更新，调用方需持有 self._lock
+        """
+        if schema_fp not in self._indexes:
+            sql = 'SELECT id, schema_fingerprint, question, normalized_question, literals, code, columns FROM code_examples'
+            with self._connect() as conn:
+                if schema_fp is None:
+                    rows = conn.execute(sql).fetchall()
+                else:
+                    rows = conn.execute(sql + ' WHERE schema_fingerprint = ?', (schema_fp,)).fetchall()
+            examples = {
+                row[0]: CodeExample(
+                    row[0], row[1], row[2], row[3], frozenset(json.loads(row[4])), row[5], tuple(json.loads(row[6]))
+                )
+                for row in rows
+            }
+            index = NgramIndex()
+            for example in examples.values():
+                index.add(example.id, example.ngrams)
+            self._indexes[schema_fp] = (examples, index)
+        return self._indexes[schema_fp]
+
+    def search(self, schema_fp: str, question: str, top_k: int = 5) -> List[Tuple[CodeExample, float]]:
+        """
+        检索同一表结构下相似的历史问题
+        :return: [(示例, 相似度)]，按相似度从高到低排列
+        """
+        grams = question_ngrams(normalize_question(question))
+        with self._lock:
+            examples, index = self._get_index(schema_fp)
+            return [(examples[doc_id], score) for doc_id, score in index.search(grams, top_k)]
+
+    def find_reusable(self, schema_fp: str, question: str, literals: FrozenSet[str],
+                      min_similarity: float = 0.8) -> Optional[Tuple[CodeExample, float]]:
+        """
+        查找可以直接复用的代码：字面量完全一致，且归一化问题的双向包含度不低于阈值
+        :return: (示例, 包含度)，没有足够接近的问题时返回 None
+        """
+        grams = question_ngrams(normalize_question(question))
+        best = None
+        for example, _ in self.search(schema_fp, question):
+            if example.literals != literals:
+                continue
+            score = mutual_containment(grams, example.ngrams)
+            if score >= min_similarity and (best is None or score > best[1]):
+                best = (example, score)
+        return best
+
+    def search_examples(self, question: str, columns: Iterable[str], top_k: int = 3,
+                        min_similarity: float = 0.3) -> List[Tuple[CodeExample, float]]:
+        """
+        在所有表结构中检索参考示例：按问题相似度和列名重合度综合排序
+        :param columns: 当前数据的列名，示例所在数据的列大多在当前数据中时更有参考价值
+        :return: [(示例, 综合得分)]，按得分从高到低排列
+        """
+        columns = {str(col) for col in columns}
+        grams = question_ngrams(normalize_question(question))
+        with self._lock:
+            examples, index = self._get_index(None)
+            candidates = [(examples[doc_id], similarity) for doc_id, similarity in index.search(grams, top_k * 5)]
+        scored = []
+        for example, similarity in candidates:
+            column_overlap = len(columns & set(example.columns)) / len(example.columns) if example.columns else 0.0
+            score = 0.7 * similarity + 0.3 * column_overlap
+            if score >= min_similarity:
+                scored.append((example, score))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:top_k]
+
+    def __len__(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM code_examples').fetchone()[0]
@@ -0,0 +1,84 @@
+"""
+代码生成的参考示例（few-shot）
+
+纠错重试是 CodeExecutor 尾延迟的主要来源，每次都是一次完整的LLM调用加重新执行。
+从已验证代码的存储中检索与当前问题最接近的若干条“问题-代码”示例放入代码生成的Prompt，提高首次生成即执行成功的比例。
+
+带示例与不带示例的生成分别统计请求数和纠错次数，据此估算示例避免的纠错重试次数：
+    避免的重试次数 ≈ 带示例的请求数 × (不带示例的平均纠错次数 - 带示例的平均纠错次数)
+"""
+
+from typing import List, Optional, Tuple
+
+import config
+import utils
+from retrieval.code_store import CodeExample, CodeStore
+from utils.metrics import metrics
+
+logger = utils.get_logger(__name__)
+
+
+def select_examples(code_store: Optional[CodeStore], question: str, columns) -> List[CodeExample]:
+    """
+    按配置检索参考示例，未开启存储或 few-shot 时返回空列表
+    """
+    few_shot_config = config.get_config().get('code_reuse', {}).get('few_shot', {})
+    if code_store is None or not few_shot_config.get('enabled', True):
+        return []
+    results = code_store.search_examples(
+        question, columns,
+        top_k=few_shot_config.get('max_examples', 3),
+        min_similarity=few_shot_config.get('min_similarity', 0.3)
+    )
+    return [example for example, _ in results]
+
+
+def describe_examples(examples: List[CodeExample]) -> str:
+    if not examples:
+        return ''
+    blocks = [
+        "## 参考示例\n\n"
+        "以下是相似问题在类似数据上执行成功的代码，仅供参考计算思路，列名和取值必须以当前的数据信息为准："
+    ]
+    for i, example in enumerate(examples, 1):
+        blocks.append(f"### 示例{i}\n\n问题：{example.question}\n\n```python\n{example.code.strip()}\n```")
+    return '\n\n'.join(blocks)
+
+
+def _label(example_count: int) -> str:
+    return 'with' if example_count > 0 else 'without'
+
+
+def record_generation(example_count: int, succeeded: bool, correction_count: int):
+    """
+    记录一次代码生成的执行结果
+    :param example_count: Prompt 中的参考示例数
+    """
+    label = _label(example_count)
+    metrics.increment('code_gen.requests', few_shot=label)
+    metrics.increment('code_gen.corrections', correction_count, few_shot=label)
+    if succeeded and correction_count == 0:
+        metrics.increment('code_gen.first_shot_success', few_shot=label)
+    logger.info(f"few-shot metrics: {few_shot_summary()}")
+
+
+def estimate_retries_avoided() -> float:
+    with_count, without_count = (metrics.get('code_gen.requests', few_shot=label) for label in ('with', 'without'))
+    if with_count == 0 or without_count == 0:
+        return 0.0
+    with_rate = metrics.get('code_gen.corrections', few_shot='with') / with_count
+    without_rate = metrics.get('code_gen.corrections', few_shot='without') / without_count
+    return with_count * (without_rate - with_rate)
+
+
+def few_shot_summary() -> dict:
+    summary = {}
+    for label in ('with', 'without'):
+        count = metrics.get('code_gen.requests', few_shot=label)
+        summary[f'{label}_examples'] = {
+            'requests': count,
+            'first_shot_success_rate': metrics.get('code_gen.first_shot_success', few_shot=label) / count if count else None,
+            'avg_corrections': metrics.get('code_gen.corrections', few_shot=label) / count if count else None,
+        }
+    summary['retries_avoided'] = estimate_retries_avoided()
+    return summary
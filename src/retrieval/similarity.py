@@ -0,0 +1,122 @@
+"""
+问题文本的相似度计算
+
+基于字符 n-gram 的本地相似度，不依赖向量模型：
+- 归一化时去掉“请”“统计”“按”等不影响计算逻辑的虚词，统一“总额/总量”等说法
+- 问题中的数字、英文词、“最高/最低”等关键词以及数据中的取值（如“华东”“2024”）作为字面量单独比较，字面量不同的问题不能复用代码
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from data_profilers.column_ranker import char_ngrams, normalize_text
+from data_profilers.value_index import ValueIndex
+
+# 不影响计算逻辑的虚词、客套词，按长度从长到短去除
+STOP_PHRASES = sorted([
+    '请问', '请', '帮我', '帮忙', '一下', '查询', '查看', '统计', '计算', '分析', '按照', '按', '根据',
+    '各个', '各', '每个', '每一个', '每', '分别', '的', '是多少', '多少', '有哪些', '列出', '给出', '展示', '显示',
+], key=len, reverse=True)
+# 同义说法的统一，如“销售总额”与“销售额”
+_SYNONYM_PATTERNS = [
+    (re.compile(r'总(额|量|数|金额)'), r'\1'),
+    (re.compile(r'(合计|总计|总和|求和|汇总)'), '总和'),
+]
+# 决定计算逻辑的关键词，与数字一样作为字面量比较，避免“最高”与“最低”这类只差一两个字的问题被视为相同
+OPERATOR_TERMS = (
+    '最高', '最低', '最大', '最小', '最多', '最少', '最早', '最晚', '最新', '前', '后', '升序', '降序',
+    '平均', '中位', '总和', '计数', '去重', '占比', '比例', '排名', '累计', '同比', '环比', '增长', '下降',
+    '大于', '小于', '超过', '低于', '不超过', '不低于', '以上', '以下', '之间', '不', '非', '没有',
+)
+_PUNCTUATION_PATTERN = re.compile(r'[\s?？!！。，,、：:；;“”"\'（）()]+')
+_LITERAL_PATTERN = re.compile(r'\d+(\.\d+)?|[a-z][a-z0-9_]*')
+
+
+def normalize_question(question: str) -> str:
+    text = _PUNCTUATION_PATTERN.sub('', normalize_text(question))
+    for pattern, replacement in _SYNONYM_PATTERNS:
+        text = pattern.sub(replacement, text)
+    for phrase in STOP_PHRASES:
+        text = text.replace(phrase, '')
+    return text
+
+
+def question_literals(question: str, value_index: Optional[ValueIndex] = None) -> FrozenSet[str]:
+    """
+    问题中的字面量：数字、英文词、决定计算逻辑的关键词，以及数据中出现过的取值
+    """
+    text = normalize_text(question)
+    literals = {match.group(0) for match in _LITERAL_PATTERN.finditer(text)}
+    normalized = normalize_question(question)
+    literals.update(term for term in OPERATOR_TERMS if term in normalized)
+    if value_index is not None:
+        literals.update(value for value, _ in value_index.find_mentions(question))
+    return frozenset(literals)
+
+
+def question_ngrams(normalized_question: str) -> FrozenSet[str]:
+    return frozenset(char_ngrams(normalized_question, (2, 3)))
+
+
+def mutual_containment(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    """
+    双向包含度的较小值：一个问题是另一个问题的扩展（如“销售额”与“销售额占比”）时得分较低
+    """
+    if not left or not right:
+        return 0.0
+    overlap = len(left & right)
+    return min(overlap / len(left), overlap / len(right))
+
+
+class NgramIndex:
+    """
+    问题文本的 n-gram 倒排索引，按 IDF 加权的余弦相似度检索
+    """
+
+    def __init__(self):
+        self._grams: Dict[int, FrozenSet[str]] = {}
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, doc_id: int, grams: Iterable[str]):
+        grams = frozenset(grams)
+        self._grams[doc_id] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(doc_id)
+
+    def remove(self, doc_id: int):
+        grams = self._grams.pop(doc_id, None)
+        for gram in grams or ():
+            postings = self._postings[gram]
+            postings.remove(doc_id)
+            if not postings:
+                del self._postings[gram]
+
+    def _idf(self, gram: str) -> float:
+        return math.log(1 + len(self._grams) / (1 + len(self._postings.get(gram, ()))))
+
+    def search(self, grams: Iterable[str], top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        :return: [(文档id, 相似度)]，按相似度从高到低排列
+        """
+        grams = frozenset(grams)
+        if not grams or not self._grams:
+            return []
+
+        weights = {gram: self._idf(gram) for gram in grams}
+        query_norm = math.sqrt(sum(weight ** 2 for weight in weights.values()))
+        dot_products = Counter()
+        for gram, weight in weights.items():
+            for doc_id in self._postings.get(gram, ()):
+                dot_products[doc_id] += weight ** 2
+
+        scores = []
+        for doc_id, dot_product in dot_products.items():
+            doc_norm = math.sqrt(sum(self._idf(gram) ** 2 for gram in self._grams[doc_id]))
+            scores.append((doc_id, dot_product / (query_norm * doc_norm)))
+        scores.sort(key=lambda item: -item[1])
+        return scores[:top_k]
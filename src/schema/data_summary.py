@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from textwrap import dedent
+from dataclasses import dataclass, field
+
+import config
 
 
 @dataclass
@@ -18,36 +19,32 @@ class DataSummary:
     column_min_values: dict
     # 每个列的最大值
     column_max_values: dict
+    # 加载时由文本转换而来的列的语义类型（datetime/number/percent）
+    semantic_types: dict = field(default_factory=dict)
+    # 加载时已解析的日期列及其解析格式（如 %Y-%m-%d）
+    datetime_formats: dict = field(default_factory=dict)
+
+    # 摘要版本号，修改摘要内容后需调用 mark_updated()，使已缓存的描述失效
+    version: int = field(default=0, compare=False)
+    # 按（版本、详细描述列、token预算）缓存的渲染结果
+    _description_cache: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def mark_updated(self):
+        self.version += 1
+        self._description_cache.clear()
 
     @property
     def description(self):
-        data_summary = self
-        data_descriptions = []
-        for col in data_summary.columns:
-            values = data_summary.column_values[col][:15]
-            # 非字符串类型的，只预览5个值
-            value_range_info = ''
-
-            columns_description = data_summary.column_descriptions.get(col, '')
-            if columns_description != '':
-                columns_description = f"列名含义：{columns_description}\n"
-
-            if data_summary.dtypes[col] != 'string' and col in data_summary.column_min_values:
-                values = values[:3]
-                value_range_info = f"最小取值：{data_summary.column_min_values[col]}\n最大取值：{data_summary.column_max_values[col]}"
-
-            data_info = dedent(f"""
-                    ------
-                    列名：{col}
-                    典型取值：{values}
-                    字段类型：{data_summary.dtypes[col]}
-                    """) + columns_description + value_range_info
-            data_descriptions.append(data_info)
-
-        table_description = data_summary.table_description
-        if table_description is not None and table_description.strip() != '':
-            table_description = f"表格描述：{table_description}\n"
-
-        final_data_info = table_description + '\n'.join(data_descriptions).strip()
-
-        return final_data_info
\ No newline at end of file
+        token_budget = config.get_config().get('prompt', {}).get('description_token_budget')
+        return self.build_description(token_budget=token_budget)
+
+    def build_description(self, detail_columns=None, token_budget=None):
+        """
+        生成数据描述
+        :param detail_columns: 需要详细描述（典型取值、取值范围等）的列，按优先级排列，None 表示全部列；其余列仅列出列名和字段类型
+        :param token_budget: token预算，超出时先减少典型取值数量，再折叠优先级低的列，None 表示不限制
+        :return:
+        """
+        from schema.description_renderer import render_description
+
+        return render_description(self, detail_columns, token_budget)
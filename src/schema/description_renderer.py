@@ -0,0 +1,165 @@
+"""
+数据描述渲染
+
+将 DataSummary 渲染为Prompt中使用的Markdown描述：
+- 按摘要版本缓存渲染结果，生成Prompt、纠错重试时不再重复拼接
+- 按本地估算的token预算控制长度，超出时先逐级减少典型取值数量，再将优先级低的列折叠为“列名:类型”
+"""
+
+from typing import List, Optional, Sequence
+
+import utils
+from data_profilers.semantic_types import SEMANTIC_TYPE_NOTES
+from schema.data_summary import DataSummary
+
+# 典型取值数量的降级档位，第一档与不限预算时一致
+VALUE_SAMPLE_LEVELS = (15, 8, 5, 3, 1)
+# 数值等非字符串列已给出取值范围，典型取值最多展示3个
+RANGED_VALUE_LIMIT = 3
+# 读入时已是日期时间类型的列（如Excel日期单元格）的说明
+DATETIME_DTYPE_NOTE = '日期时间类型，无需再调用 pd.to_datetime'
+
+
+class DescriptionRenderer:
+    def __init__(self, value_sample_levels: Sequence[int] = VALUE_SAMPLE_LEVELS):
+        self.value_sample_levels = tuple(value_sample_levels)
+
+    def render(self, data_summary: DataSummary, detail_columns: Optional[Sequence[str]] = None, token_budget: Optional[int] = None) -> str:
+        """
+        渲染数据描述
+        :param data_summary: 数据摘要
+        :param detail_columns: 需要详细描述的列，按优先级从高到低排列，None 表示全部列（优先级为原始列顺序）
+        :param token_budget: token预算，None 表示不限制
+        :return:
+        """
+        cache_key = (
+            data_summary.version,
+            None if detail_columns is None else tuple(detail_columns),
+            token_budget
+        )
+        cache = data_summary._description_cache
+        if cache_key not in cache:
+            cache[cache_key] = self._render(data_summary, detail_columns, token_budget)
+        return cache[cache_key]
+
+    def _render(self, data_summary: DataSummary, detail_columns, token_budget) -> str:
+        if detail_columns is None:
+            detail_columns = list(data_summary.columns)
+        else:
+            known_columns = set(data_summary.columns)
+            detail_columns = [col for col in detail_columns if col in known_columns]
+
+        header = self._render_header(data_summary)
+        if token_budget is None:
+            return self._compose(data_summary, header, detail_columns, self.value_sample_levels[0])
+
+        header_tokens = utils.estimate_tokens(header)
+        compact_tokens = {col: utils.estimate_tokens(self._render_compact_item(data_summary, col)) + 1 for col in data_summary.columns}
+        fragment_tokens = {}
+
+        def estimate(columns, max_values):
+            total = header_tokens
+            detail_set = set(columns)
+            for col in data_summary.columns:
+                if col in detail_set:
+                    key = (col, max_values)
+                    if key not in fragment_tokens:
+                        fragment_tokens[key] = utils.estimate_tokens(self._render_column(data_summary, col, max_values))
+                    total += fragment_tokens[key]
+                else:
+                    total += compact_tokens[col]
+            return total
+
+        # 第一步：逐级减少典型取值数量
+        for max_values in self.value_sample_levels:
+            if estimate(detail_columns, max_values) <= token_budget:
+                return self._compose(data_summary, header, detail_columns, max_values)
+
+        # 第二步：从优先级最低的列开始折叠为“列名:类型”
+        max_values = self.value_sample_levels[-1]
+        detail_columns = list(detail_columns)
+        while detail_columns:
+            detail_columns.pop()
+            if estimate(detail_columns, max_values) <= token_budget:
+                return self._compose(data_summary, header, detail_columns, max_values)
+
+        # 第三步：仅列出列名仍超出预算时，截断列清单
+        return self._compose(data_summary, header, [], max_values, token_budget=token_budget)
+
+    def _compose(self, data_summary: DataSummary, header: str, detail_columns: List[str], max_values: int, token_budget: Optional[int] = None) -> str:
+        detail_set = set(detail_columns)
+        data_descriptions = []
+        compact_items = []
+        for col in data_summary.columns:
+            if col in detail_set:
+                data_descriptions.append(self._render_column(data_summary, col, max_values))
+            else:
+                compact_items.append(self._render_compact_item(data_summary, col))
+
+        if compact_items:
+            if token_budget is not None:
+                compact_items = self._truncate_items(compact_items, token_budget - utils.estimate_tokens(header))
+            data_descriptions.append(f"\n------\n其余列（列名:字段类型）：{', '.join(compact_items)}")
+
+        return header + '\n'.join(data_descriptions).strip()
+
+    @staticmethod
+    def _truncate_items(items: List[str], token_budget: int) -> List[str]:
+        kept = []
+        used = 0
+        for item in items:
+            used += utils.estimate_tokens(item) + 1
+            if used > token_budget:
+                kept.append(f"……等共{len(items)}列")
+                break
+            kept.append(item)
+        return kept
+
+    @staticmethod
+    def _render_header(data_summary: DataSummary) -> str:
+        table_description = data_summary.table_description
+        if table_description is not None and table_description.strip() != '':
+            return f"表格描述：{table_description}\n"
+        return ''
+
+    @staticmethod
+    def _render_compact_item(data_summary: DataSummary, col) -> str:
+        return f"{col}:{data_summary.dtypes[col]}"
+
+    @staticmethod
+    def _render_column(data_summary: DataSummary, col, max_values: int) -> str:
+        values = data_summary.column_values[col][:max_values]
+        value_range_info = ''
+
+        columns_description = data_summary.column_descriptions.get(col, '')
+        if columns_description != '':
+            columns_description = f"列名含义：{columns_description}\n"
+
+        # 非字符串类型的，给出取值范围，典型取值只预览少量
+        if data_summary.dtypes[col] != 'string' and col in data_summary.column_min_values:
+            values = values[:RANGED_VALUE_LIMIT]
+            value_range_info = f"最小取值：{data_summary.column_min_values[col]}\n最大取值：{data_summary.column_max_values[col]}"
+
+        dtype_info = data_summary.dtypes[col]
+        semantic_type = data_summary.semantic_types.get(col)
+        if semantic_type in SEMANTIC_TYPE_NOTES:
+            note = SEMANTIC_TYPE_NOTES[semantic_type]
+            if col in data_summary.datetime_formats:
+                note += f"，原始文本格式为 {data_summary.datetime_formats[col]}"
+            dtype_info += f"（{note}）"
+        elif str(dtype_info).startswith('datetime64'):
+            dtype_info += f"（{DATETIME_DTYPE_NOTE}）"
+
+        return (
+            f"\n------\n"
+            f"列名：{col}\n"
+            f"典型取值：{values}\n"
+            f"字段类型：{dtype_info}\n"
+        ) + columns_description + value_range_info
+
+
+_default_renderer = DescriptionRenderer()
+
+
+def render_description(data_summary: DataSummary, detail_columns: Optional[Sequence[str]] = None, token_budget: Optional[int] = None) -> str:
+    return _default_renderer.render(data_summary, detail_columns, token_budget)
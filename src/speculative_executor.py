@@ -0,0 +1,161 @@
+"""
+多候选并行生成与执行
+
+对同一Prompt并发请求多份候选代码（第一份使用默认生成参数并使用响应缓存，其余使用不同的 temperature），
+每份代码生成完毕即在工作线程中执行，返回最先执行成功并通过结果检查的候选，取消其余候选。
+全部候选执行失败时，才带着第一份候选的报错进入 CodeExecutor 的纠错流程。
+"""
+
+import asyncio
+import traceback
+from dataclasses import dataclass
+from typing import List, Optional
+
+import pandas as pd
+
+import config
+import utils
+from code_executor import CodeExecutor
+from code_generators.python_generator import PythonGenerator
+from data_accessors.dataframe_accessor import DataFrameAccessor
+from llms.base_llm import BaseLLM
+from retrieval.code_store import CodeStore
+from utils.metrics import metrics
+
+
+@dataclass
+class Candidate:
+    # 候选序号，从0开始
+    index: int
+    code: Optional[str] = None
+    result: Optional[pd.DataFrame] = None
+    # 生成或执行时的异常
+    error: Optional[Exception] = None
+    # 执行成功但未通过结果检查的原因
+    check_failure: Optional[str] = None
+
+
+def _is_unnamed_column(column) -> bool:
+    # 索引被当作数据写出再读入、或拼接时产生的空列名
+    return column is None or not str(column).strip() or str(column).startswith('Unnamed:')
+
+
+def check_result(ans_df) -> Optional[str]:
+    """
+    代价很低的结果检查：执行结果应为非空、不全为缺失值的表格，列名不重复且都有列名
+    :return: 未通过检查的原因，通过时为 None
+    """
+    if not isinstance(ans_df, pd.DataFrame):
+        return f"结果不是表格：{type(ans_df).__name__}"
+    if ans_df.shape[0] == 0 or ans_df.shape[1] == 0:
+        return "结果为空"
+    duplicated = ans_df.columns[ans_df.columns.duplicated()]
+    if len(duplicated) > 0:
+        return f"结果存在重复的列名：{'、'.join(str(column) for column in duplicated.unique())}"
+    if any(_is_unnamed_column(column) for column in ans_df.columns):
+        return "结果存在没有列名的列"
+    if ans_df.isna().all().all():
+        return "结果全为缺失值"
+    return None
+
+
+class SpeculativeExecutor:
+    def __init__(self, data_accessor: DataFrameAccessor, llm: BaseLLM, code_store: Optional[CodeStore] = None,
+                 candidate_count: Optional[int] = None, temperatures: Optional[List[float]] = None):
+        """
+        :param candidate_count: 候选数量，为空时使用配置
+        :param temperatures: 第二份及之后的候选依次使用的 temperature，为空时使用配置
+        """
+        speculative_config = config.get_config().get('speculative_generation', {})
+        self.llm = llm
+        self.data_accessor = data_accessor
+        self.generator = PythonGenerator(data_accessor, llm, code_store)
+        self.candidate_count = max(1, candidate_count or speculative_config.get('candidates', 3))
+        self.temperatures = temperatures or speculative_config.get('temperatures', [0.7, 1.0])
+        self.logger = utils.get_logger(self.__class__.__name__)
+        self.candidates: List[Candidate] = []
+        # 采用的候选
+        self.winner: Optional[Candidate] = None
+        # 与 CodeExecutor 一致的执行结果：是否成功、纠错次数、最终执行成功的代码
+        self.succeeded = False
+        self.correction_count = 0
+        self.final_code = None
+
+    def _generation_kwargs(self, index: int) -> dict:
+        if index == 0:
+            return {}
+        return {'temperature': self.temperatures[(index - 1) % len(self.temperatures)]}
+
+    def _execute(self, code: str) -> pd.DataFrame:
+        # 深拷贝：候选代码可能原地改写数值（df.loc[...] = ...、inplace=True），浅拷贝与缓存的数据共用同一份数据块；
+        # 落选的候选在工作线程中无法中断，各自的副本保证其他候选、纠错流程和后续请求读到的数据不受影响
+        return self.data_accessor.execute(code, df=self.data_accessor.dataframe.copy())
+
+    async def _run_candidate(self, candidate: Candidate, prompt: str):
+        """
+        生成并执行一份候选代码，结果和异常记录在 candidate 上
+        """
+        try:
+            candidate.code = await self.generator.agenerate_code_from_prompt(
+                prompt, use_cache=candidate.index == 0, **self._generation_kwargs(candidate.index)
+            )
+            candidate.result = await asyncio.to_thread(self._execute, candidate.code)
+            candidate.check_failure = check_result(candidate.result)
+        except Exception as e:
+            self.logger.warning(f"candidate {candidate.index} failed:\n{traceback.format_exc()}")
+            candidate.error = e
+
+    async def arun(self, question: str) -> pd.DataFrame:
+        """
+        并发生成、执行多份候选代码，返回最先执行成功并通过检查的结果；全部失败时进入纠错流程
+        """
+        prompt = await asyncio.to_thread(self.generator.build_prompt, question)
+        self.generator.last_prompt = prompt
+        self.candidates = [Candidate(index=i) for i in range(self.candidate_count)]
+        tasks = {asyncio.create_task(self._run_candidate(candidate, prompt)): candidate for candidate in self.candidates}
+        try:
+            pending = set(tasks)
+            while pending and self.winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    candidate = tasks[task]
+                    if candidate.error is None and candidate.check_failure is None and self.winner is None:
+                        self.winner = candidate
+        finally:
+            # 取消仍在生成的候选；已在工作线程中执行的代码无法中断，结果直接丢弃
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        first = self.candidates[0]
+        if first.code is not None and (first.error is not None or first.check_failure is not None):
+            # 缓存的第一份候选有误，避免后续请求复用
+            self.generator.discard_cached_response()
+
+        if self.winner is None:
+            # 没有通过检查的候选时，执行成功但结果为空等也是有效的答案，优先于纠错
+            executed = [candidate for candidate in self.candidates if candidate.result is not None]
+            if executed:
+                self.winner = executed[0]
+
+        if self.winner is not None:
+            metrics.increment('code_gen.speculative.winner', candidate=self.winner.index)
+            self.logger.info(f"candidate {self.winner.index} succeeded")
+            self.succeeded = True
+            self.final_code = self.winner.code
+            return self.winner.result
+
+        metrics.increment('code_gen.speculative.all_failed')
+        generated = [candidate for candidate in self.candidates if candidate.code is not None]
+        if not generated:
+            # 全部候选都没有生成代码（如LLM调用失败）
+            raise first.error
+
+        # 带着已知的报错进入纠错流程，不再重复执行失败的代码
+        candidate = generated[0]
+        code_executor = CodeExecutor(self.data_accessor, self.llm)
+        ans_df = await code_executor.aexecute(question, candidate.code, first_error=candidate.error)
+        self.succeeded = code_executor.succeeded
+        self.correction_count = code_executor.correction_count
+        self.final_code = code_executor.final_code
+        return ans_df
@@ -0,0 +1,284 @@
+"""
+分步流式执行
+
+LLM 按 `# @step: <步骤描述>` 注释把代码分为若干步骤（见 docs/REACT_TOOL_DESIGN.md）。
+流式接收LLM输出时，每当一个步骤完整生成（下一个 @step 注释出现或代码块闭合），
+就在本次请求的命名空间中执行该步骤并发送步骤通知，同时继续接收后续步骤，LLM生成与代码执行时间重叠。
+某一步执行失败时立即停止生成，把已生成的代码包装为 analyze 函数，带着报错进入 CodeExecutor 的纠错流程。
+某一步在紧凑类型数据上因类型不兼容而失败时，与 DataFrameAccessor.execute 一样还原为原始类型，重新执行已执行的步骤后继续。
+流式调用本身失败（如网络错误）时无法接着已收到的输出继续生成，改为一次性生成完整代码后由 CodeExecutor 执行。
+"""
+
+import asyncio
+import re
+import textwrap
+import traceback
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+import pandas as pd
+
+import utils
+from code_executor import CodeExecutor
+from code_generators.python_generator import PythonGenerator
+from data_accessors.dataframe_accessor import DataFrameAccessor
+from data_profilers.compaction import is_dtype_error, restore_dtypes
+from llms.base_llm import BaseLLM
+from llms.usage import llm_caller
+from retrieval.code_store import CodeStore
+from utils.metrics import metrics
+
+STEP_PATTERN = re.compile(r'^\s*#\s*@step:\s*(.+?)\s*$')
+_ANALYZE_DEF_PATTERN = re.compile(r'^def analyze\(', re.MULTILINE)
+# 第一个 @step 注释之前的代码（如 import 语句）作为一个单独的步骤
+PREAMBLE_STEP_NAME = '准备'
+
+
+@dataclass
+class CodeStep:
+    # 步骤序号，从1开始
+    index: int
+    name: str
+    code: str
+
+
+class StepCodeParser:
+    """
+    增量解析LLM输出中的代码步骤，每次传入目前已收到的全部文本，返回新完成的步骤
+    """
+
+    def __init__(self):
+        self.emitted_count = 0
+        # 代码块是否已闭合
+        self.closed = False
+
+    @staticmethod
+    def _code_body(text: str, final: bool):
+        """
+        :return: (代码块中目前已收到的代码, 代码块是否已闭合)，还未出现代码块时代码为 None
+        """
+        lines = text.split('\n')
+        for i, line in enumerate(lines):
+            if line.strip().startswith('```'):
+                body = lines[i + 1:]
+                for j, body_line in enumerate(body):
+                    if body_line.strip() == '```':
+                        return body[:j], True
+                return body, False
+        # LLM 没有用代码块包裹代码时，输出结束后按整段代码处理
+        return (lines, True) if final else (None, False)
+
+    def parse(self, text: str, final: bool = False) -> List[CodeStep]:
+        """
+        :param text: 目前已收到的全部文本
+        :param final: 输出是否已经结束
+        :return: 新完成的步骤
+        """
+        lines, self.closed = self._code_body(text, final)
+        if lines is None:
+            return []
+        if not self.closed and not final:
+            # 最后一行可能还没有接收完整
+            lines = lines[:-1]
+
+        steps = []
+        name, code_lines = PREAMBLE_STEP_NAME, []
+        for line in lines:
+            match = STEP_PATTERN.match(line)
+            if match:
+                steps.append((name, code_lines))
+                name, code_lines = match.group(1), [line]
+            else:
+                code_lines.append(line)
+        steps.append((name, code_lines))
+
+        if not self.closed and not final:
+            # 最后一个步骤要等到下一个 @step 注释出现或代码块闭合才算完整
+            steps = steps[:-1]
+        # 只有注释和空行的准备步骤不执行
+        if steps and steps[0][0] == PREAMBLE_STEP_NAME and not _has_statement(steps[0][1]):
+            steps = steps[1:]
+
+        new_steps = [
+            CodeStep(index=i + 1, name=name, code='\n'.join(code_lines).strip('\n'))
+            for i, (name, code_lines) in enumerate(steps)
+        ][self.emitted_count:]
+        self.emitted_count += len(new_steps)
+        return new_steps
+
+
+def _has_statement(lines: List[str]) -> bool:
+    return any(line.strip() and not line.strip().startswith('#') for line in lines)
+
+
+def to_function_code(steps: List[CodeStep]) -> str:
+    """
+    将分步代码包装为 analyze 函数，与 CodeExecutor、代码复用使用的代码形式一致
+    """
+    body = '\n\n'.join(step.code for step in steps)
+    if _ANALYZE_DEF_PATTERN.search(body):
+        # LLM 没有按步骤格式而是直接生成了 analyze 函数
+        return body + '\n'
+    return f"def analyze(df):\n{textwrap.indent(body, '    ')}\n    return result\n"
+
+
+class StepwisePythonGenerator(PythonGenerator):
+    prompt_version = "stepwise_v1"
+
+
+class StepwiseExecutor:
+    def __init__(self, data_accessor: DataFrameAccessor, llm: BaseLLM, code_store: Optional[CodeStore] = None):
+        self.llm = llm
+        self.data_accessor = data_accessor
+        self.generator = StepwisePythonGenerator(data_accessor, llm, code_store)
+        self.logger = utils.get_logger(self.__class__.__name__)
+        # 已开始执行的步骤，以及执行失败的步骤和异常
+        self.steps: List[CodeStep] = []
+        self.failed_step: Optional[CodeStep] = None
+        self.error: Optional[Exception] = None
+        # 与 CodeExecutor 一致的执行结果：是否成功、纠错次数、最终执行成功的代码（analyze 函数形式）
+        self.succeeded = False
+        self.correction_count = 0
+        self.final_code = None
+        # 是否已还原为原始类型重新执行
+        self.dtypes_restored = False
+
+    @property
+    def function_code(self) -> str:
+        return to_function_code(self.steps)
+
+    def _execute_step(self, step: CodeStep, namespace: dict):
+        exec(compile(step.code, f'<step {step.index}: {step.name}>', 'exec'), namespace, namespace)
+
+    def _new_namespace(self) -> dict:
+        # 深拷贝：步骤在命名空间中直接改写 df（如 df.loc[...] = ...），浅拷贝会改写缓存的数据，
+        # 纠错流程和还原类型后重新执行的步骤都会读到被改写过的数据
+        return {'pd': pd, 'df': self.data_accessor.dataframe.copy()}
+
+    def _can_restore_dtypes(self, e: Exception) -> bool:
+        return (not self.dtypes_restored and bool(self.data_accessor.dataframe.attrs.get('compacted_dtypes'))
+                and is_dtype_error(e))
+
+    def _replay_with_restored_dtypes(self, namespace: dict):
+        """
+        紧凑类型（category、稀疏数组等）与部分写法不兼容：在原始类型的数据上重新执行已执行的步骤，原地替换命名空间
+        """
+        self.logger.warning("step failed on compacted dtypes, replay steps with original dtypes")
+        self.dtypes_restored = True
+        namespace.clear()
+        namespace.update({'pd': pd, 'df': restore_dtypes(self.data_accessor.dataframe)})
+        for step in self.steps:
+            self._execute_step(step, namespace)
+
+    async def _consume(self, queue: asyncio.Queue, namespace: dict, on_step):
+        """
+        按顺序执行生成完毕的步骤；某一步失败后丢弃后续步骤
+        """
+        while True:
+            step = await queue.get()
+            if step is None:
+                break
+            if self.error is not None:
+                continue
+            self.steps.append(step)
+            if on_step is not None:
+                await on_step(step)
+            try:
+                try:
+                    await asyncio.to_thread(self._execute_step, step, namespace)
+                except Exception as e:
+                    if not self._can_restore_dtypes(e):
+                        raise
+                    await asyncio.to_thread(self._replay_with_restored_dtypes, namespace)
+            except Exception as e:
+                self.logger.warning(f"step {step.index} ({step.name}) failed:\n{traceback.format_exc()}")
+                self.failed_step = step
+                self.error = e
+
+    def _get_result(self, namespace: dict) -> pd.DataFrame:
+        result = namespace.get('result')
+        if result is None and callable(namespace.get('analyze')):
+            # LLM 没有按步骤格式而是生成了 analyze 函数
+            result = namespace['analyze'](namespace['df'])
+        if result is None:
+            raise ValueError("代码执行完成后没有得到 result 变量")
+        return DataFrameAccessor.convert_result(result)
+
+    async def _stream_steps(self, prompt: str, namespace: dict, on_step):
+        """
+        流式接收LLM输出，每个步骤生成完毕即交给后台任务执行；流式调用失败时抛出异常
+        """
+        parser = StepCodeParser()
+        queue = asyncio.Queue()
+
+        def until(resp: str) -> bool:
+            for step in parser.parse(resp):
+                queue.put_nowait(step)
+            # 代码块闭合或某一步已失败时停止接收
+            return parser.closed or self.error is not None
+
+        consumer = asyncio.create_task(self._consume(queue, namespace, on_step))
+        try:
+            with llm_caller(self.generator.__class__.__name__):
+                resp = await self.llm.astream_until(prompt, until, max_retry=1)
+            self.logger.info(f'generated code raw_resp:\n{resp}')
+            for step in parser.parse(resp, final=True):
+                queue.put_nowait(step)
+        finally:
+            queue.put_nowait(None)
+            await consumer
+
+    async def _execute_with_correction(self, question: str, code: str, first_error: Optional[Exception] = None) -> pd.DataFrame:
+        code_executor = CodeExecutor(self.data_accessor, self.llm)
+        ans_df = await code_executor.aexecute(question, code, first_error=first_error)
+        self.succeeded = code_executor.succeeded
+        self.correction_count = code_executor.correction_count
+        self.final_code = code_executor.final_code
+        return ans_df
+
+    async def _fallback(self, question: str) -> pd.DataFrame:
+        """
+        流式调用失败时，按普通的代码生成Prompt一次性生成完整代码（带完整的退避重试）后执行
+        """
+        generator = PythonGenerator(self.data_accessor, self.llm, self.generator.code_store)
+        prompt = await asyncio.to_thread(generator.build_prompt, question)
+        # 调用方只会删除分步Prompt的缓存响应，这里不使用缓存，避免缓存执行有误的代码
+        code = await generator.agenerate_code_from_prompt(prompt, use_cache=False)
+        return await self._execute_with_correction(question, code)
+
+    async def arun(self, question: str, on_step: Optional[Callable[[CodeStep], Awaitable]] = None) -> pd.DataFrame:
+        """
+        流式生成并分步执行代码，失败时进入纠错流程
+        :param question: 用户问题
+        :param on_step: 每个步骤开始执行前调用，用于发送步骤通知
+        :return: 执行结果
+        """
+        prompt = await asyncio.to_thread(self.generator.build_prompt, question)
+        self.generator.last_prompt = prompt
+        namespace = self._new_namespace()
+
+        try:
+            await self._stream_steps(prompt, namespace, on_step)
+        except Exception:
+            self.logger.warning(f"stepwise stream failed after {len(self.steps)} steps, fall back to full generation:\n"
+                                f"{traceback.format_exc()}")
+            metrics.increment('code_gen.stepwise.stream_fallback')
+            return await self._fallback(question)
+
+        if self.error is None:
+            try:
+                try:
+                    ans_df = await asyncio.to_thread(self._get_result, namespace)
+                except Exception as e:
+                    if not self._can_restore_dtypes(e):
+                        raise
+                    await asyncio.to_thread(self._replay_with_restored_dtypes, namespace)
+                    ans_df = await asyncio.to_thread(self._get_result, namespace)
+                self.succeeded = True
+                self.final_code = self.function_code
+                return ans_df
+            except Exception as e:
+                self.error = e
+
+        # 带着已知的报错进入纠错流程，不再重复执行失败的代码
+        return await self._execute_with_correction(question, self.function_code, first_error=self.error)
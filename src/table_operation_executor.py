@@ -1,3 +1,4 @@
+import asyncio
 import os
 import traceback
 from typing import Optional, List, Tuple
@@ -6,8 +7,11 @@ import pandas as pd
 
 import config
 import utils
+from code_generators.table_operation_generator import describe_join_keys
 from data_accessors.base_data_accessor import BaseDataAccessor
+from data_profilers.compaction import restore_dtypes
 from llms.base_llm import BaseLLM
+from llms.usage import llm_caller
 from schema.execution_error_history import ExecutionErrorHistoryItem
 
 
@@ -23,6 +27,48 @@ class TableOperationExecutor:
         self.llm = llm
         self.data_accessors = data_accessors
         self.logger = utils.get_logger(self.__class__.__name__)
+        # 最近一次执行的结果：是否成功、纠错次数、最终执行成功的代码
+        self.succeeded = False
+        self.correction_count = 0
+        self.final_code = None
+
+    def _begin(self) -> int:
+        """
+        开始一次执行：重置执行结果
+
+        Returns:
+            int: 最大纠错次数
+        """
+        max_retry_count = config.get_config()['max_retry_execution_count']
+        self.logger.info(f"max_retry_execution_count: {max_retry_count}")
+        self.succeeded = False
+        self.final_code = None
+        return max_retry_count
+
+    def _on_success(self, code: str):
+        self.succeeded = True
+        self.final_code = code
+
+    def _on_failure(self, code: str, e: Exception, error_history_list: List[ExecutionErrorHistoryItem], max_retry_count: int) -> bool:
+        """
+        记录执行失败
+
+        Returns:
+            bool: 是否还需要纠错，纠错次数用完时为 False
+        """
+        self.logger.warning(
+            f"retry_count: {len(error_history_list)}\n"
+            f"code: {code}\n"
+            f"exception:\n{traceback.format_exc()}"
+        )
+        if len(error_history_list) + 1 > max_retry_count:
+            return False
+        error_history_list.append(ExecutionErrorHistoryItem(code=code, e=e))
+        return True
+
+    def _on_rewritten(self, rewritten_code: str) -> str:
+        self.logger.info(f"rewritten_code:\n{rewritten_code}")
+        return rewritten_code
 
     def execute(self, instruction: str, code: str, input_paths: List[str], output_path: str) -> Tuple[pd.DataFrame, str]:
         """
@@ -37,9 +83,7 @@ class TableOperationExecutor:
         Returns:
             Tuple[pd.DataFrame, str]: 转换后的DataFrame和操作描述
         """
-        max_retry_count = config.get_config()['max_retry_execution_count']
-        self.logger.info(f"max_retry_execution_count: {max_retry_count}")
-
+        max_retry_count = self._begin()
         error_corrector = TableOperationErrorCorrector(self.llm)
         error_history_list: List[ExecutionErrorHistoryItem] = []
         result_df = pd.DataFrame([])
@@ -48,30 +92,60 @@ class TableOperationExecutor:
         while len(error_history_list) <= max_retry_count:
             try:
                 result_df, operation_desc = self._execute_code(code, input_paths, output_path)
+                self._on_success(code)
                 break
             except Exception as e:
-                self.logger.warning(
-                    f"retry_count: {len(error_history_list)}\n"
-                    f"code: {code}\n"
-                    f"exception:\n{traceback.format_exc()}"
-                )
-
-                if len(error_history_list) + 1 > max_retry_count:
+                if not self._on_failure(code, e, error_history_list, max_retry_count):
                     break
+            code = self._on_rewritten(error_corrector.correct(
+                self.data_accessors,
+                instruction,
+                input_paths,
+                output_path,
+                error_history_list
+            ))
 
-                error_history_list.append(ExecutionErrorHistoryItem(code=code, e=e))
-                rewritten_code = error_corrector.correct(
-                    self.data_accessors, 
-                    instruction, 
-                    input_paths,
-                    output_path,
-                    error_history_list
-                )
-                self.logger.info(f"rewritten_code:\n{rewritten_code}")
-                code = rewritten_code
+        self.correction_count = len(error_history_list)
+        return result_df, operation_desc
 
+    async def aexecute(self, instruction: str, code: str, input_paths: List[str], output_path: str) -> Tuple[pd.DataFrame, str]:
+        """
+        execute 的异步版本：代码在工作线程中执行，纠错时异步等待LLM，均不阻塞事件循环
+        """
+        max_retry_count = self._begin()
+        error_corrector = TableOperationErrorCorrector(self.llm)
+        error_history_list: List[ExecutionErrorHistoryItem] = []
+        result_df = pd.DataFrame([])
+        operation_desc = instruction
+
+        while len(error_history_list) <= max_retry_count:
+            try:
+                result_df, operation_desc = await asyncio.to_thread(self._execute_code, code, input_paths, output_path)
+                self._on_success(code)
+                break
+            except Exception as e:
+                if not self._on_failure(code, e, error_history_list, max_retry_count):
+                    break
+            code = self._on_rewritten(await error_corrector.acorrect(
+                self.data_accessors,
+                instruction,
+                input_paths,
+                output_path,
+                error_history_list
+            ))
+
+        self.correction_count = len(error_history_list)
         return result_df, operation_desc
 
+    @staticmethod
+    def _original_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        压缩过类型的数据还原为原始类型（返回新的DataFrame），其余数据原样返回
+        """
+        if df.attrs.get('compacted_dtypes'):
+            return restore_dtypes(df)
+        return df
+
     def _execute_code(self, code: str, input_paths: List[str], output_path: str) -> Tuple[pd.DataFrame, str]:
         """
         执行转换代码
@@ -89,8 +163,9 @@ class TableOperationExecutor:
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
 
-        # 准备所有输入DataFrame
-        dataframes = [accessor.dataframe for accessor in self.data_accessors]
+        # 准备所有输入DataFrame；转换代码会写出文件，不能在报错后重跑，紧凑类型的数据事先还原为原始类型，
+        # 也避免 category、稀疏数组等类型带到输出文件中
+        dataframes = [self._original_dtypes(accessor.dataframe) for accessor in self.data_accessors]
 
         # 在namespace中执行代码
         namespace = {'pd': pd, 'os': os}
@@ -147,6 +222,17 @@ class TableOperationErrorCorrector:
 ```
 """
 
+    @staticmethod
+    def _is_code_complete(resp: str) -> bool:
+        return utils.find_code_block(resp, lang='python') is not None
+
+    @staticmethod
+    def _parse_response(resp: str) -> str:
+        code = utils.find_code_block(resp, lang='python')
+        if code is None:
+            code = utils.extract_code(resp, 'python')
+        return code
+
     def correct(
         self, 
         data_accessors: List[BaseDataAccessor], 
@@ -168,12 +254,55 @@ class TableOperationErrorCorrector:
         Returns:
             修正后的代码
         """
+        prompt = self.build_prompt(data_accessors, instruction, input_paths, output_path, error_history)
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                # 代码块闭合后即停止接收，不等待其后的说明文字
+                raw_rewritten_code = self._llm.stream_until(prompt, self._is_code_complete)
+            else:
+                raw_rewritten_code = self._llm.chat_with_retry(prompt)
+        return self._parse_response(raw_rewritten_code)
+
+    async def acorrect(
+        self,
+        data_accessors: List[BaseDataAccessor],
+        instruction: str,
+        input_paths: List[str],
+        output_path: str,
+        error_history: List[ExecutionErrorHistoryItem]
+    ) -> str:
+        """
+        correct 的异步版本，等待LLM时不阻塞事件循环
+        """
+        prompt = await asyncio.to_thread(self.build_prompt, data_accessors, instruction, input_paths, output_path, error_history)
+        with llm_caller(self.__class__.__name__):
+            if config.get_config().get('stream_code_generation', True):
+                raw_rewritten_code = await self._llm.astream_until(prompt, self._is_code_complete)
+            else:
+                raw_rewritten_code = await self._llm.achat_with_retry(prompt)
+        return self._parse_response(raw_rewritten_code)
+
+    def build_prompt(
+        self,
+        data_accessors: List[BaseDataAccessor],
+        instruction: str,
+        input_paths: List[str],
+        output_path: str,
+        error_history: List[ExecutionErrorHistoryItem]
+    ) -> str:
+        """
+        构建纠错Prompt
+        """
         # 构建所有输入数据的描述
         data_info_parts = []
         for i, accessor in enumerate(data_accessors):
             data_summary = accessor.get_data_summary()
             data_info_parts.append(f"### 输入文件 {i+1}: {input_paths[i]}\n{data_summary.description}")
         
+        join_keys_info = describe_join_keys(data_accessors)
+        if join_keys_info:
+            data_info_parts.append(join_keys_info)
+
         data_info = "\n\n".join(data_info_parts)
         input_paths_str = "\n".join([f"- {p}" for p in input_paths])
         
@@ -196,9 +325,5 @@ class TableOperationErrorCorrector:
         )
         
         self.logger.info(f"prompt: {prompt}")
-
-        raw_rewritten_code = self._llm.chat_with_retry(prompt)
-        rewritten_code = utils.extract_code(raw_rewritten_code, 'python')
-
-        return rewritten_code
+        return prompt
 
@@ -44,6 +44,21 @@ def process_df_value(val, truncate_len=30):
     return val
 
 
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数，无需调用分词器：中文字符及全角符号按1个token计，其余字符按4个字符1个token计
+    :param text:
+    :return:
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
 def extract_code(text: str, lang='sql'):
     if text.startswith(f'```{lang}'):
         pattern = fr"```{lang}\n(.*?)\n```"
@@ -63,6 +78,46 @@ def extract_code(text: str, lang='sql'):
     return code
 
 
+def find_code_block(text: str, lang='python'):
+    """
+    查找文本中第一个已闭合的 ```lang 或 ``` 代码块，代码块之前可以有其他内容；
+    用于流式输出时判断代码是否已经完整，代码块尚未闭合时返回 None
+    :param text:
+    :param lang:
+    :return: 代码块中的代码
+    """
+    lines = text.split('\n')
+    code_start = None
+    fence_lang = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped.startswith('```'):
+            continue
+        if code_start is None:
+            fence_lang = stripped[3:].strip().lower()
+            code_start = i + 1
+        elif stripped == '```':
+            if fence_lang in ('', lang):
+                return '\n'.join(lines[code_start:i])
+            code_start = None
+    return None
+
+
+def to_python_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将 StringDtype（如 string[pyarrow]）列转换为 object 列，缺失值 pd.NA 转为 None，便于序列化
+    :param df:
+    :return:
+    """
+    string_columns = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.StringDtype)]
+    if not string_columns or not df.columns.is_unique:
+        return df
+    df = df.copy()
+    for col in string_columns:
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+
 def convert_series_to_dataframe(data_series: pd.Series):
     index_name = data_series.index.name
     logger.info(f"index_name: {index_name}")
@@ -0,0 +1,140 @@
+"""
+进程内的运行指标
+
+按 (指标名, 标签) 累计计数、记录当前值或分桶统计取值分布（直方图），供日志输出和排查使用，例如：
+    metrics.increment('code_gen.requests', few_shot='with')
+    metrics.get('code_gen.requests', few_shot='with')
+    metrics.observe('llm.latency_seconds', 1.2, buckets=SECONDS_BUCKETS, caller='PythonGenerator')
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+# 直方图的默认分桶上界：耗时（秒）和token数
+SECONDS_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_str(label_key: LabelKey) -> str:
+    return ','.join(f'{key}={value}' for key, value in label_key)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        """
+        :param buckets: 分桶上界，超过最大上界的取值计入最后的 +Inf 桶
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        按分桶估算分位数，返回所在桶的上界（落在 +Inf 桶时返回最大值）
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {
+                **{f'<={bound:g}': count for bound, count in zip(self.buckets, self.bucket_counts)},
+                '+Inf': self.bucket_counts[-1]
+            },
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """
+        设置当前值（如排队数），覆盖之前的值
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values.setdefault(name, {})[key] = value
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), 0)
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = SECONDS_BUCKETS, **labels):
+        """
+        记录一个取值到直方图，同一指标的分桶以首次记录时为准
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get_histogram(self, name: str, **labels) -> Optional[dict]:
+        """
+        :return: 直方图的统计信息（见 Histogram.to_dict），没有记录时为 None
+        """
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_label_key(labels))
+            return histogram.to_dict() if histogram is not None else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        :return: {指标名: {"标签1=取值1,标签2=取值2": 计数}}，直方图的取值为其统计信息
+        """
+        with self._lock:
+            snapshot = {
+                name: {_label_str(label_key): count for label_key, count in series.items()}
+                for name, series in self._values.items()
+            }
+            for name, series in self._histograms.items():
+                snapshot[name] = {_label_str(label_key): histogram.to_dict() for label_key, histogram in series.items()}
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+
+# 全局指标
+metrics = MetricsRegistry()
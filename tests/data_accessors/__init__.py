@@ -0,0 +1 @@
+# 数据访问模块测试
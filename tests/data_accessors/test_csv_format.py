@@ -0,0 +1,86 @@
+"""
+CSV 编码与分隔符识别单元测试
+"""
+
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_accessors.csv_accessor import CSVAccessor
+from data_accessors.csv_format import CsvFormat, detect_delimiter, detect_encoding, sniff_csv_format
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"地区": ["华东", "华北", "华南"], "销售额": [1.5, 2.0, 3.25]})
+
+
+@pytest.fixture
+def serve_dir(tmp_path):
+    """在本地线程中以HTTP服务 tmp_path 下的文件，返回文件的URL"""
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=str(tmp_path)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield lambda name: f"http://127.0.0.1:{httpd.server_address[1]}/{name}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestCsvFormat:
+    """CSV 编码与分隔符识别测试"""
+
+    @pytest.mark.parametrize("encoding, sep, expected_encoding", [
+        ("utf-8", ",", "utf-8"),
+        ("utf-8-sig", ",", "utf-8-sig"),
+        ("gbk", ";", "gb18030"),
+        ("gb18030", "\t", "gb18030"),
+    ])
+    def test_sniff(self, tmp_path, df, encoding, sep, expected_encoding):
+        """测试识别常见编码和分隔符，并按识别结果正确读取"""
+        path = tmp_path / "data.csv"
+        df.to_csv(path, index=False, encoding=encoding, sep=sep)
+
+        csv_format = sniff_csv_format(str(path))
+
+        assert csv_format == CsvFormat(encoding=expected_encoding, sep=sep)
+        pd.testing.assert_frame_equal(CSVAccessor(str(path)).dataframe, df)
+
+    def test_truncated_sample(self):
+        """测试样本在多字节字符中间截断时仍能识别为 UTF-8"""
+        sample = "地区,销售额\n华东,1\n华北,2\n".encode("utf-8")[:-4]
+        assert detect_encoding(sample) == "utf-8"
+
+    def test_single_column(self):
+        """测试只有一列时使用逗号"""
+        assert detect_delimiter("名称\n苹果\n香蕉\n") == ","
+
+    def test_fallback_when_sample_misses_encoding(self, tmp_path):
+        """测试样本之后才出现 GBK 字节时，改用后续候选编码读取"""
+        path = tmp_path / "late_gbk.csv"
+        rows = ["id,name"] + [f"{i},abc" for i in range(20000)] + ["20000,华东"]
+        path.write_bytes("\n".join(rows).encode("gbk"))
+
+        df = CSVAccessor(str(path)).dataframe
+
+        assert df["name"].iloc[-1] == "华东"
+        assert sniff_csv_format(str(path)).encoding == "gb18030"
+
+    def test_load_from_url(self, tmp_path, df, serve_dir):
+        """测试从URL加载CSV：不访问本地文件系统，按下载的样本识别编码和分隔符"""
+        (tmp_path / "remote.csv").write_bytes(df.to_csv(index=False, sep=";").encode("gbk"))
+        url = serve_dir("remote.csv")
+
+        pd.testing.assert_frame_equal(CSVAccessor(url).dataframe, df)
+        # 远程文件不按本地文件指纹缓存，再次加载重新下载
+        pd.testing.assert_frame_equal(CSVAccessor(url).dataframe, df)
@@ -0,0 +1,197 @@
+"""
+DataFrameAccessor 派生结果缓存单元测试
+"""
+
+import threading
+import time
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_accessors.csv_accessor import CSVAccessor
+from data_profilers.compaction import compact_dataframe
+
+
+class TestDerivedData:
+    """派生结果缓存测试"""
+
+    def test_quality_summary_shared_across_requests(self, tmp_path):
+        """测试质量摘要随缓存数据保存，同一文件的新实例直接复用"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"a": [1, 2, 2], "b": ["x", "y", "y"]}).to_csv(path, index=False)
+
+        first = CSVAccessor(str(path))
+        assert not first.has_quality_summary()
+        quality = first.get_quality_summary()
+
+        second = CSVAccessor(str(path))
+        assert second.has_quality_summary()
+        assert second.get_quality_summary() is quality
+        assert quality["duplicates"]["duplicate_rows"] == 1
+
+    def test_build_once_when_concurrent(self, tmp_path):
+        """测试多个线程同时请求同一派生结果时只构建一次"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"a": [1, 2, 3]}).to_csv(path, index=False)
+        accessor = CSVAccessor(str(path))
+        calls = []
+
+        def builder():
+            calls.append(1)
+            time.sleep(0.05)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(accessor.get_derived_data("slow", builder))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["result"] * 4
+        assert len(calls) == 1
+
+
+class TestLazyProfiling:
+    """延迟数据探查测试"""
+
+    def _count_detect_calls(self, monkeypatch):
+        calls = []
+        detect_data = CSVAccessor.detect_data
+
+        def counting_detect_data(self):
+            calls.append(1)
+            return detect_data(self)
+
+        monkeypatch.setattr(CSVAccessor, "detect_data", counting_detect_data)
+        return calls
+
+    def test_construction_and_schema_summary_skip_profiling(self, tmp_path, monkeypatch):
+        """测试创建实例和获取轻量摘要都不触发完整探查"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}).to_csv(path, index=False)
+        calls = self._count_detect_calls(monkeypatch)
+
+        accessor = CSVAccessor(str(path))
+        schema_summary = accessor.get_schema_summary()
+
+        assert calls == []
+        assert schema_summary.columns == ["a", "b"]
+        assert schema_summary.dtypes == {"a": "int64", "b": "string"}
+        assert schema_summary.column_values == {"a": [], "b": []}
+
+    def test_data_summary_profiles_once(self, tmp_path, monkeypatch):
+        """测试完整摘要首次访问时探查一次，之后复用，轻量摘要也改为返回完整摘要"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}).to_csv(path, index=False)
+        calls = self._count_detect_calls(monkeypatch)
+        accessor = CSVAccessor(str(path))
+
+        data_summary = accessor.get_data_summary()
+        assert accessor.get_data_summary() is data_summary
+        assert accessor.description
+        assert accessor.get_schema_summary() is data_summary
+        assert len(calls) == 1
+
+
+def make_slow_accessor_class(calls: list, delay: float = 0.2, barrier: threading.Barrier = None):
+    """
+    每次实际加载都记录文件路径并等待 delay 秒的 CSV 数据访问器，每个类各自缓存；
+    提供 barrier 时改为等待其余加载到达屏障，屏障要求的加载没有同时进行时等待超时，抛出 BrokenBarrierError
+    """
+
+    class SlowCSVAccessor(CSVAccessor):
+        @CSVAccessor.cached_data_loader
+        def load_data(self, filepath, n_rows=None):
+            calls.append(filepath)
+            if barrier is not None:
+                barrier.wait(timeout=10)
+            else:
+                time.sleep(delay)
+            return pd.read_csv(filepath)
+
+    return SlowCSVAccessor
+
+
+class TestCachedDataLoader:
+    """数据加载缓存的并发测试"""
+
+    def _run_concurrently(self, accessor_class, paths):
+        accessors, errors = [], []
+
+        def load(path):
+            try:
+                accessors.append(accessor_class(path))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=load, args=(path,)) for path in paths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return accessors
+
+    def test_same_file_loaded_once(self, tmp_path):
+        """测试多个线程同时加载同一文件时只实际加载一次"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"a": [1, 2, 3]}).to_csv(path, index=False)
+        calls = []
+
+        accessors = self._run_concurrently(make_slow_accessor_class(calls), [str(path)] * 4)
+
+        assert calls == [str(path)]
+        assert all(accessor.dataframe["a"].tolist() == [1, 2, 3] for accessor in accessors)
+
+    def test_different_files_load_in_parallel(self, tmp_path):
+        """测试不同文件各自持有加载锁，可以并行加载：4个文件的加载都到达屏障后才能完成"""
+        paths = []
+        for i in range(4):
+            path = tmp_path / f"data{i}.csv"
+            pd.DataFrame({"a": [i]}).to_csv(path, index=False)
+            paths.append(str(path))
+        calls = []
+
+        self._run_concurrently(make_slow_accessor_class(calls, barrier=threading.Barrier(len(paths))), paths)
+
+        assert sorted(calls) == sorted(paths)
+
+
+class TestExecuteOnCompactedData:
+    """在紧凑类型数据上执行代码的测试"""
+
+    @pytest.fixture
+    def accessor(self, tmp_path):
+        path = tmp_path / "data.csv"
+        df = pd.DataFrame({"地区": ["北京", "上海"] * 50, "销售额": range(100)})
+        df.to_csv(path, index=False)
+        compacted, _ = compact_dataframe(df)
+        return CSVAccessor(str(path), df=compacted)
+
+    def test_retry_on_dtype_error(self, accessor):
+        """测试紧凑类型导致的类型错误还原类型后重试"""
+        code = """
+def analyze(df):
+    return pd.DataFrame({'省份': df['地区'] + '市'})
+"""
+        result = accessor.execute(code)
+        assert result["省份"].tolist()[:2] == ["北京市", "上海市"]
+
+    def test_no_retry_on_other_errors(self, accessor, tmp_path):
+        """测试与类型无关的报错直接抛出，不重复执行代码的副作用"""
+        log_path = tmp_path / "calls.log"
+        code = f"""
+def analyze(df):
+    with open({str(log_path)!r}, 'a') as f:
+        f.write('x')
+    return df['不存在的列']
+"""
+        with pytest.raises(KeyError):
+            accessor.execute(code)
+        assert log_path.read_text() == "x"
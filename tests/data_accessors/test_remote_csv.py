@@ -0,0 +1,181 @@
+"""
+远程CSV分段抽样预览单元测试（使用本地支持 Range 请求的HTTP服务）
+"""
+
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_accessors.csv_accessor import CSVAccessor
+from data_accessors.remote_csv import RemoteCSVAccessor, sample_remote_csv
+
+
+class RangeServer:
+    """在本地线程中运行的静态文件服务，可选是否支持 Range 请求，并统计已发送的字节数"""
+
+    def __init__(self, content: bytes, support_range: bool = True, etag: str = None):
+        self.content = content
+        self.support_range = support_range
+        self.etag = etag
+        self.sent_bytes = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(server.content)))
+                if server.etag:
+                    self.send_header('ETag', server.etag)
+                self.end_headers()
+
+            def do_GET(self):
+                match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+                if server.support_range and match:
+                    start, end = int(match.group(1)), min(int(match.group(2)), len(server.content) - 1)
+                    body = server.content[start:end + 1]
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(server.content)}')
+                else:
+                    body = server.content
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                if server.etag:
+                    self.send_header('ETag', server.etag)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                    server.sent_bytes += len(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/data.csv'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def csv_bytes():
+    """约 5MB 的CSV，前半部分金额为整数、后半部分为小数"""
+    n = 200000
+    df = pd.DataFrame({
+        "订单号": [f"NO{i:08d}" for i in range(n)],
+        "地区": np.random.default_rng(0).choice(["华东", "华北", "华南"], n),
+        "金额": np.where(np.arange(n) < n // 2, 100, 99.5),
+    })
+    return df.to_csv(index=False).encode("utf-8"), n
+
+
+class TestRemoteCsv:
+    """远程CSV抽样测试"""
+
+    def test_sample_with_range(self, csv_bytes):
+        """测试只读取开头和抽样块，按抽样行推断类型并估算总行数"""
+        content, n = csv_bytes
+        server = RangeServer(content)
+        try:
+            sample = sample_remote_csv(server.url, head_bytes=512 * 1024, sample_blocks=4, block_bytes=64 * 1024)
+        finally:
+            server.close()
+
+        assert not sample.complete
+        assert sample.content_length == len(content)
+        assert sample.fetched_bytes <= 512 * 1024 + 4 * 64 * 1024
+        assert server.sent_bytes < len(content) / 5
+        assert list(sample.df.columns) == ["订单号", "地区", "金额"]
+        # 抽样块覆盖到文件后半部分的小数
+        assert sample.df["金额"].dtype == "float64"
+        assert (sample.df["金额"] == 99.5).any()
+        assert sample.estimated_rows == pytest.approx(n, rel=0.05)
+
+    def test_small_file_read_completely(self):
+        """测试小文件一次读取完整，行数准确"""
+        content = "a;b\n1;x\n2;y\n".encode("utf-8")
+        server = RangeServer(content)
+        try:
+            accessor = RemoteCSVAccessor(server.url)
+        finally:
+            server.close()
+
+        assert accessor.sample.complete
+        assert accessor.sample.estimated_rows == 2
+        assert accessor.dataframe["b"].tolist() == ["x", "y"]
+        assert accessor.sample_note == ""
+
+    def test_server_without_range(self, csv_bytes):
+        """测试服务端不支持 Range 时只读取开头部分"""
+        content, _ = csv_bytes
+        server = RangeServer(content, support_range=False)
+        try:
+            accessor = RemoteCSVAccessor(server.url, head_bytes=256 * 1024)
+        finally:
+            server.close()
+
+        assert not accessor.sample.complete
+        assert accessor.sample.fetched_bytes <= 256 * 1024
+        assert "仅抽样读取了" in accessor.structure_description
+
+    def test_full_download_sniffs_format(self):
+        """测试完整读取远程CSV时同样识别编码和分隔符"""
+        content = "地区;金额\n华东;1\n华北;2\n".encode("gbk")
+        server = RangeServer(content)
+        try:
+            df = CSVAccessor(server.url).dataframe
+        finally:
+            server.close()
+
+        assert df["地区"].tolist() == ["华东", "华北"]
+
+
+class TestRemoteDerivedData:
+    """远程数据派生结果缓存测试"""
+
+    def test_sample_quality_shared_by_etag(self):
+        """测试抽样预览的质量概况按URL和ETag复用，文件版本变化后重新计算"""
+        server = RangeServer("a,b\n1,x\n1,x\n2,y\n".encode("utf-8"), etag='"v1"')
+        try:
+            first = RemoteCSVAccessor(server.url)
+            quality = first.get_quality_summary()
+            second = RemoteCSVAccessor(server.url)
+            assert second.has_quality_summary()
+            assert second.get_quality_summary() is quality
+
+            server.etag = '"v2"'
+            assert not RemoteCSVAccessor(server.url).has_quality_summary()
+        finally:
+            server.close()
+
+    def test_full_download_quality_shared_by_etag(self):
+        """测试完整读取的远程CSV按ETag复用质量概况，且与抽样预览的结果分开保存"""
+        server = RangeServer("a,b\n1,x\n1,x\n2,y\n".encode("utf-8"), etag='"full-v1"')
+        try:
+            RemoteCSVAccessor(server.url).get_quality_summary()
+            first = CSVAccessor(server.url)
+            assert not first.has_quality_summary()
+            first.get_quality_summary()
+            assert CSVAccessor(server.url).has_quality_summary()
+        finally:
+            server.close()
+
+    def test_without_version_not_shared(self):
+        """测试服务端不返回版本信息时只在当前实例内复用"""
+        server = RangeServer("a,b\n1,x\n2,y\n".encode("utf-8"))
+        try:
+            RemoteCSVAccessor(server.url).get_quality_summary()
+            assert not RemoteCSVAccessor(server.url).has_quality_summary()
+        finally:
+            server.close()
@@ -0,0 +1 @@
+# 数据探查模块测试
@@ -0,0 +1,68 @@
+"""
+列相关性排序单元测试
+"""
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.column_ranker import ColumnRanker, describe_for_question
+from schema.data_summary import DataSummary
+
+
+@pytest.fixture
+def wide_summary():
+    """包含 100 列的宽表摘要"""
+    columns = ["地区", "销售额", "order_date", "客户名称"] + [f"指标{i}" for i in range(96)]
+    dtypes = {col: "int64" for col in columns}
+    dtypes.update({"地区": "string", "客户名称": "string", "order_date": "datetime64[ns]"})
+    column_values = {col: list(range(25)) for col in columns}
+    column_values.update({
+        "地区": ["华东", "华南", "华北"],
+        "客户名称": ["北京科技有限公司", "上海贸易有限公司"],
+        "order_date": ["2024-01-01 00:00:00"],
+    })
+    return DataSummary(
+        columns=columns,
+        dtypes=dtypes,
+        column_values=column_values,
+        column_descriptions={"指标7": "毛利率"},
+        table_description="",
+        column_min_values={col: "0" for col in columns if dtypes[col] != "string"},
+        column_max_values={col: "24" for col in columns if dtypes[col] != "string"},
+    )
+
+
+class TestColumnRanker:
+    """ColumnRanker 测试"""
+
+    def test_name_match_ranks_first(self, wide_summary):
+        """测试列名出现在问题中的列排在最前"""
+        ranked = ColumnRanker(wide_summary).rank("统计各地区的销售额", top_k=2)
+        assert {col for col, _ in ranked} == {"地区", "销售额"}
+
+    def test_english_words(self, wide_summary):
+        """测试英文列名按词匹配"""
+        ranked = ColumnRanker(wide_summary).rank("按 order date 统计订单数", top_k=1)
+        assert ranked[0][0] == "order_date"
+
+    def test_value_and_description_match(self, wide_summary):
+        """测试通过典型取值和列描述匹配"""
+        scores = ColumnRanker(wide_summary).score("华东的毛利率是多少")
+        assert scores["地区"] > 0
+        assert scores["指标7"] > scores["指标8"]
+
+
+class TestDescribeForQuestion:
+    """describe_for_question 测试"""
+
+    def test_only_relevant_columns_detailed(self, wide_summary):
+        """测试仅相关列给出详细描述，其余列以列名:类型的形式列出"""
+        description = describe_for_question(wide_summary, "统计各地区的销售额")
+
+        assert "列名：地区" in description
+        assert "列名：销售额" in description
+        assert "列名：指标95" not in description
+        assert "指标95:int64" in description
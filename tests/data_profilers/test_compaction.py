@@ -0,0 +1,95 @@
+"""
+紧凑数据类型单元测试
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.compaction import compact_dataframe, convert_string_columns, is_dtype_error, restore_dtypes
+
+
+@pytest.fixture
+def df():
+    """包含低基数文本列、小范围整数列、高缺失率浮点列的数据"""
+    n = 1000
+    sparse = np.full(n, np.nan)
+    sparse[::100] = 1.5
+    return pd.DataFrame({
+        "地区": ["华东", "华北", "华南", "西南"] * (n // 4),
+        "订单号": [f"NO{i:06d}" for i in range(n)],
+        "数量": np.arange(n, dtype="int64") % 50,
+        "折扣": sparse,
+        "金额": np.arange(n, dtype="float64") * 0.1,
+    })
+
+
+class TestCompaction:
+    """紧凑数据类型测试"""
+
+    def test_compact(self, df):
+        """测试各类列的压缩结果"""
+        compacted, report = compact_dataframe(df.copy())
+
+        assert isinstance(compacted["地区"].dtype, pd.CategoricalDtype)
+        # 高基数文本列保持不变
+        assert compacted["订单号"].dtype == object
+        # 整数最多向下转换到32位
+        assert compacted["数量"].dtype == "int32"
+        assert isinstance(compacted["折扣"].dtype, pd.SparseDtype)
+        # 默认不转换 float64
+        assert compacted["金额"].dtype == "float64"
+
+        assert {item.column for item in report} == {"地区", "数量", "折扣"}
+        assert all(item.saved_bytes > 0 for item in report)
+        assert compacted.attrs["compacted_dtypes"] == {"地区": "object", "数量": "int64", "折扣": "float64"}
+
+    def test_downcast_float(self):
+        """测试只在不损失精度时转换为 float32"""
+        df = pd.DataFrame({"整数值": [1.0, 2.0, 3.5] * 10, "高精度": [0.1, 0.2, 0.3] * 10})
+
+        compacted, _ = compact_dataframe(df, downcast_float=True)
+
+        assert compacted["整数值"].dtype == "float32"
+        assert compacted["高精度"].dtype == "float64"
+
+    def test_restore(self, df):
+        """测试还原为压缩前的类型，结果与原数据一致"""
+        compacted, _ = compact_dataframe(df.copy())
+        restored = restore_dtypes(compacted)
+
+        pd.testing.assert_frame_equal(restored, df)
+        assert restored.attrs["compacted_dtypes"] == {}
+
+    def test_arrow_strings(self):
+        """测试文本列转换为 string[pyarrow]，混合类型列保持不变，还原后与原数据一致"""
+        pytest.importorskip("pyarrow")
+        df = pd.DataFrame({
+            "名称": ["苹果", np.nan, "香蕉 "],
+            "混合": ["a", 1, None],
+            "数量": [1, 2, 3],
+        })
+
+        converted = convert_string_columns(df.copy(), storage="pyarrow")
+
+        assert converted["名称"].dtype == pd.StringDtype("pyarrow")
+        assert converted["名称"].str.strip().tolist()[2] == "香蕉"
+        assert converted["混合"].dtype == object
+        assert converted.attrs["compacted_dtypes"] == {"名称": "object"}
+        pd.testing.assert_frame_equal(restore_dtypes(converted), df)
+
+    def test_is_dtype_error(self, df):
+        """测试只有类型相关的报错才视为紧凑类型引起"""
+        compacted, _ = compact_dataframe(df.copy())
+        with pytest.raises(TypeError) as exc_info:
+            compacted.loc[0, "地区"] = "新地区"
+
+        assert is_dtype_error(exc_info.value)
+        assert is_dtype_error(NotImplementedError())
+        assert is_dtype_error(ValueError("Cannot convert a SparseArray to dense"))
+        assert not is_dtype_error(KeyError("不存在的列"))
+        assert not is_dtype_error(ValueError("invalid literal for int()"))
@@ -0,0 +1,72 @@
+"""
+重复行检测单元测试
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.duplicates import count_duplicate_rows
+
+
+@pytest.fixture
+def df():
+    """包含数值、文本、缺失值的重复数据"""
+    return pd.DataFrame({
+        "地区": ["北京", "上海", "北京", None, None, "广州"],
+        "销售额": [1.5, 2.0, 1.5, np.nan, np.nan, 3.0],
+        "数量": [1, 2, 1, 4, 4, 5],
+    })
+
+
+class TestCountDuplicateRows:
+    """count_duplicate_rows 测试"""
+
+    @pytest.mark.parametrize("method", ["hash", "exact", "sample"])
+    def test_matches_duplicated(self, df, method):
+        """测试各方式与 df.duplicated() 结果一致"""
+        summary = count_duplicate_rows(df, method=method)
+
+        assert summary.duplicate_rows == int(df.duplicated().sum()) == 2
+        assert summary.estimated is False
+
+    def test_empty_frame(self):
+        """测试空表"""
+        summary = count_duplicate_rows(pd.DataFrame({"a": []}))
+        assert summary.duplicate_rows == 0
+
+    def test_chunked_hashing(self, df):
+        """测试跨块的重复行也能识别"""
+        summary = count_duplicate_rows(df, chunk_rows=2)
+        assert summary.duplicate_rows == 2
+
+    def test_mixed_type_collision(self):
+        """测试 object 列中 1 与 "1"：hash 方式按字符串形式哈希会误判为重复（已知碰撞），默认的 exact 方式不会"""
+        df = pd.DataFrame({"编号": [1, "1"], "地区": ["北京", "北京"]})
+        assert count_duplicate_rows(df, method="hash").duplicate_rows == 1
+        assert count_duplicate_rows(df).duplicate_rows == int(df.duplicated().sum()) == 0
+
+    def test_unhashable_values(self):
+        """测试含 list 取值的列"""
+        df = pd.DataFrame({"tags": [[1, 2], [1, 2], [3]], "id": [1, 1, 2]})
+        assert count_duplicate_rows(df, method="exact").duplicate_rows == 1
+
+    def test_sample_estimate(self):
+        """测试抽样估计接近真实值"""
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({"k": rng.integers(0, 50_000, size=200_000)})
+        expected = int(df.duplicated().sum())
+
+        summary = count_duplicate_rows(df, method="sample", sample_rows=50_000)
+
+        assert summary.estimated is True
+        assert abs(summary.duplicate_rows - expected) / expected < 0.05
+
+    def test_invalid_method(self, df):
+        """测试非法的检测方式"""
+        with pytest.raises(ValueError):
+            count_duplicate_rows(df, method="unknown")
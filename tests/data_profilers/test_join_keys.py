@@ -0,0 +1,83 @@
+"""
+多表关联键发现单元测试
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.join_keys import (
+    compute_column_signature,
+    compute_signatures,
+    describe_join_key_candidates,
+    estimate_jaccard,
+    find_join_key_candidates,
+)
+
+
+@pytest.fixture
+def tables():
+    """订单表与客户表，客户ID 在订单表中以浮点数存储"""
+    rng = np.random.default_rng(0)
+    orders = pd.DataFrame({
+        "订单ID": [f"O{i}" for i in range(5000)],
+        "客户ID": rng.integers(0, 1000, 5000).astype(float),
+        "是否退款": rng.integers(0, 2, 5000).astype(bool),
+        "金额": rng.random(5000),
+    })
+    customers = pd.DataFrame({
+        "cust_id": [str(i) for i in range(1000)],
+        "客户名称": [f"客户{i}" for i in range(1000)],
+    })
+    return orders, customers
+
+
+class TestJoinKeys:
+    """关联键发现测试"""
+
+    def test_jaccard_estimate(self):
+        """测试 Jaccard 估算误差在合理范围内"""
+        left = compute_column_signature(pd.Series(range(0, 1000)), "a", num_perm=256)
+        right = compute_column_signature(pd.Series(range(500, 1500)), "b", num_perm=256)
+
+        assert estimate_jaccard(left, right) == pytest.approx(500 / 1500, abs=0.08)
+
+    def test_skip_unsuitable_columns(self, tables):
+        """测试跳过布尔列和非整数浮点列"""
+        orders, _ = tables
+        signatures = compute_signatures(orders)
+        assert set(signatures) == {"订单ID", "客户ID"}
+
+    def test_find_candidates(self, tables):
+        """测试找出跨表的关联键，并识别唯一性"""
+        orders, customers = tables
+        candidates = find_join_key_candidates([compute_signatures(orders), compute_signatures(customers)])
+
+        best = candidates[0]
+        assert (best.left.column, best.right.column) == ("客户ID", "cust_id")
+        assert best.overlap > 0.9
+        assert best.right.is_unique and not best.left.is_unique
+        assert not best.many_to_many
+
+    def test_describe(self, tables):
+        """测试生成 Prompt 说明"""
+        orders, customers = tables
+        candidates = find_join_key_candidates([compute_signatures(orders), compute_signatures(customers)])
+        text = describe_join_key_candidates(candidates)
+
+        assert "输入文件 1 的「客户ID」" in text
+        assert "输入文件 2 的「cust_id」" in text
+        assert describe_join_key_candidates([]) == ""
+
+    def test_normalize_distinct_values(self):
+        """测试去重后统一取值表示：整数值的浮点列与文本列的同一取值签名相同，非空计数按原列统计"""
+        floats = compute_column_signature(pd.Series([1.0, 2.0, 2.0, np.nan, 3.0]), "a")
+        texts = compute_column_signature(pd.Series(["1", " 2", "2 ", None, "3"], dtype=object), "b")
+
+        assert floats.distinct_count == texts.distinct_count == 3
+        assert floats.non_null_count == texts.non_null_count == 4
+        assert estimate_jaccard(floats, texts) == 1.0
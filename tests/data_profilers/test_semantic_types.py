@@ -0,0 +1,95 @@
+"""
+语义类型识别与转换单元测试
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.semantic_types import (
+    SEMANTIC_DATETIME,
+    SEMANTIC_NUMBER,
+    SEMANTIC_PERCENT,
+    convert_semantic_types,
+    detect_column_semantic_type,
+    detect_semantic_types,
+    infer_datetime_format,
+)
+
+
+@pytest.fixture
+def df():
+    """以文本形式存储日期、千分位数字、百分比的数据"""
+    return pd.DataFrame({
+        "日期": ["2024-01-05", "2024-01-06", None],
+        "销售额": ["1,234.5", "¥2,000", "-"],
+        "占比": ["12.5%", "7%", "N/A"],
+        "编码": ["00123", "00124", "00125"],
+        "备注": ["a", "b", "c"],
+    })
+
+
+class TestSemanticTypes:
+    """语义类型测试"""
+
+    def test_detect(self, df):
+        """测试识别语义类型，编码类文本不识别为数字"""
+        assert detect_semantic_types(df) == {
+            "日期": SEMANTIC_DATETIME,
+            "销售额": SEMANTIC_NUMBER,
+            "占比": SEMANTIC_PERCENT,
+        }
+
+    def test_convert(self, df):
+        """测试转换结果与类型"""
+        converted = convert_semantic_types(df)
+
+        assert converted["日期"].dtype == "datetime64[ns]"
+        assert converted["销售额"].tolist()[:2] == [1234.5, 2000.0]
+        assert np.isnan(converted["销售额"].iloc[2])
+        assert converted["占比"].tolist()[:2] == pytest.approx([0.125, 0.07])
+        assert converted["编码"].tolist() == ["00123", "00124", "00125"]
+        assert set(converted.attrs["semantic_types"]) == {"日期", "销售额", "占比"}
+        assert converted.attrs["datetime_formats"] == {"日期": "%Y-%m-%d"}
+
+    def test_skip_lossy_conversion(self):
+        """测试抽样未覆盖到的异常值导致转换有损时保留原列"""
+        values = ["1,000"] * 20 + ["不详"]
+        df = pd.DataFrame({"金额": values})
+
+        converted = convert_semantic_types(df, sample_size=5)
+
+        assert converted["金额"].dtype == object
+        assert converted.attrs["semantic_types"] == {}
+
+    def test_attrs_survive_copy(self, df):
+        """测试转换记录随副本保留（缓存返回的是副本）"""
+        converted = convert_semantic_types(df)
+        assert converted.copy().attrs["semantic_types"] == converted.attrs["semantic_types"]
+
+    def test_infer_datetime_format(self):
+        """测试推断日期列的固定格式，格式不统一时返回 None"""
+        assert infer_datetime_format(pd.Series(["2024/1/5 08:30", "2024/12/31 23:59", None])) == "%Y/%m/%d %H:%M"
+        assert infer_datetime_format(pd.Series(["2024-01-05", "2024/01/06"])) is None
+
+    def test_mixed_datetime_formats_fallback(self):
+        """测试抽样外存在其他格式的日期时，退回逐个推断且不记录格式"""
+        df = pd.DataFrame({"日期": ["2024-01-05"] * 20 + ["2024/01/06"]})
+
+        converted = convert_semantic_types(df, sample_size=5)
+
+        assert converted["日期"].dtype == "datetime64[ns]"
+        assert converted["日期"].iloc[-1] == pd.Timestamp("2024-01-06")
+        assert converted.attrs["datetime_formats"] == {}
+
+    def test_sample_before_normalize(self):
+        """测试大列先抽样再去除空白、剔除空值占位符，结果与整列处理一致"""
+        values = [f" {i % 28 + 1:02d}.5% " for i in range(50_000)] + ["--", "n/a", None] * 100
+        series = pd.Series(values, dtype=object)
+
+        assert detect_column_semantic_type(series, sample_size=200) == SEMANTIC_PERCENT
+        assert detect_column_semantic_type(pd.Series(["--", " n/a ", None] * 1000), sample_size=200) is None
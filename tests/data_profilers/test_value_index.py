@@ -0,0 +1,54 @@
+"""
+取值倒排索引单元测试
+"""
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from data_profilers.value_index import ValueIndex, describe_value_mentions
+
+
+@pytest.fixture
+def index():
+    """城市、产品两个文本列，外加一个数值列"""
+    df = pd.DataFrame({
+        "城市": ["北京", "北京", "上海", "Ｂeijing "],
+        "产品": ["iPhone 15", "iPhone 15 Pro", "iPhone 15", "Mate 60"],
+        "发货城市": ["北京", "广州", "广州", "广州"],
+        "销量": [1, 2, 3, 4],
+    })
+    return ValueIndex.build(df)
+
+
+class TestValueIndex:
+    """ValueIndex 测试"""
+
+    def test_lookup_normalized(self, index):
+        """测试按归一化后的取值查找，全角、大小写、空白不影响"""
+        locations = index.lookup("beijing")
+        assert [(l.column, l.frequency) for l in locations] == [("城市", 1)]
+
+    def test_value_in_multiple_columns(self, index):
+        """测试同一取值出现在多列时按出现次数排序"""
+        locations = index.lookup("北京")
+        assert [(l.column, l.frequency) for l in locations] == [("城市", 2), ("发货城市", 1)]
+
+    def test_find_mentions_prefers_longest(self, index):
+        """测试优先匹配较长的取值"""
+        mentions = index.find_mentions("上海的iPhone 15 Pro销量")
+        assert [value for value, _ in mentions] == ["上海", "iphone 15 pro"]
+
+    def test_numeric_columns_not_indexed(self, index):
+        """测试数值列不参与索引"""
+        assert index.lookup("1") == []
+
+    def test_describe_mentions(self, index):
+        """测试生成 Prompt 说明"""
+        text = describe_value_mentions(index, "北京卖了多少台Mate 60")
+        assert "“北京”：位于列「城市」（出现2次），列「发货城市」（出现1次）" in text
+        assert "“Mate 60”：位于列「产品」" in text
+        assert describe_value_mentions(index, "总销量是多少") == ""
@@ -0,0 +1 @@
+# LLM模块测试
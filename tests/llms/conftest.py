@@ -0,0 +1,125 @@
+"""
+LLM模块测试公共fixture：本地 OpenAI 兼容的模拟服务
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class MockOpenAIServer:
+    """
+    本地 OpenAI 兼容服务，/v1/chat/completions 返回固定回复，支持流式返回，
+    可设置响应延迟、流式输出每段之间的间隔和前若干次请求的错误状态码，并记录收到的请求和已发送的流式片段数
+    """
+
+    def __init__(self, reply: str = "```python\ndef analyze(df):\n    return df\n```"):
+        self.reply = reply
+        self.delay = 0.0
+        self.fail_times = 0
+        self.fail_status = 500
+        self.fail_headers = {}
+        self.stream_interval = 0.0
+        self.stream_sent_pieces = 0
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                server.requests.append(body)
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.fail_times > 0:
+                    server.fail_times -= 1
+                    self._send_json(server.fail_status, {"error": {"message": "mock error", "type": "server_error"}},
+                                    server.fail_headers)
+                    return
+                if body.get('stream'):
+                    self._send_stream(body)
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-mock", "object": "chat.completion", "created": 0, "model": body.get('model'),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": server.reply}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                    })
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                pieces = [server.reply[i:i + 8] for i in range(0, len(server.reply), 8)]
+                for piece in pieces:
+                    chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": body.get('model'),
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    try:
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # 客户端提前关闭了连接
+                        self.close_connection = True
+                        return
+                    server.stream_sent_pieces += 1
+                    if server.stream_interval:
+                        time.sleep(server.stream_interval)
+                usage = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": body.get('model'),
+                         "choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": len(pieces), "total_tokens": 10 + len(pieces)}}
+                self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}/v1'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def mock_openai_server(monkeypatch):
+    server = MockOpenAIServer()
+    monkeypatch.setenv('OPENAI_BASE_URL', server.base_url)
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENAI_MODEL_NAME', 'mock-model')
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def mock_openai_servers():
+    """
+    按需创建多个模拟服务，用于多后端路由测试
+    """
+    servers = []
+
+    def create(reply: str = "ok") -> MockOpenAIServer:
+        server = MockOpenAIServer(reply)
+        servers.append(server)
+        return server
+
+    yield create
+    for server in servers:
+        server.close()
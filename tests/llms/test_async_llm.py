@@ -0,0 +1,119 @@
+"""
+异步LLM调用单元测试
+"""
+
+import asyncio
+import time
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from code_executor import CodeExecutor
+from data_accessors.csv_accessor import CSVAccessor
+from llms.base_llm import BaseLLM
+from llms.chat_openai import ChatOpenAI
+
+
+class FlakyLLM(BaseLLM):
+    """前若干次调用失败的同步LLM"""
+
+    def __init__(self, replies, fail_times=0):
+        super().__init__(model_name='fake')
+        self.replies = list(replies)
+        self.fail_times = fail_times
+        self.prompts = []
+
+    def chat(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("temporary error")
+        time.sleep(0.05)
+        return self.replies.pop(0)
+
+
+async def count_ticks(stop: asyncio.Event) -> int:
+    ticks = 0
+    while not stop.is_set():
+        await asyncio.sleep(0.01)
+        ticks += 1
+    return ticks
+
+
+class TestAsyncLLM:
+    """异步LLM调用测试"""
+
+    @pytest.mark.asyncio
+    async def test_retry_does_not_block_event_loop(self):
+        """测试重试等待和同步 chat 调用期间，事件循环中的其他任务照常运行"""
+        llm = FlakyLLM(["ok"], fail_times=1)
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(count_ticks(stop))
+
+        result = await llm.achat_with_retry("question", error_sleeping_seconds=0.2)
+        stop.set()
+
+        assert result == "ok"
+        assert len(llm.prompts) == 2
+        assert await ticker >= 10
+
+    @pytest.mark.asyncio
+    async def test_retry_exhausted(self):
+        """测试重试次数用尽后抛出异常"""
+        llm = FlakyLLM([], fail_times=5)
+        with pytest.raises(ValueError):
+            await llm.achat_with_retry("question", max_retry=2, error_sleeping_seconds=0)
+
+    @pytest.mark.asyncio
+    async def test_openai_async_client(self, mock_openai_server):
+        """测试基于 AsyncOpenAI 的 achat 和 astream_chat，且调用参数不在请求之间残留"""
+        mock_openai_server.reply = "你好，世界"
+        llm = ChatOpenAI()
+
+        assert await llm.achat("你是谁", temperature=0.1) == "你好，世界"
+        assert "".join([piece async for piece in llm.astream_chat("你是谁")]) == "你好，世界"
+        assert mock_openai_server.requests[0]["temperature"] == 0.1
+        assert "temperature" not in mock_openai_server.requests[1]
+
+    @pytest.mark.asyncio
+    async def test_aexecute_with_correction(self, tmp_path):
+        """测试异步执行失败后异步纠错并重新执行"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"地区": ["华东", "华北"], "销售额": [1, 2]}).to_csv(path, index=False)
+        fixed_code = "```python\ndef analyze(df):\n    return df[['地区']]\n```"
+        llm = FlakyLLM([fixed_code])
+
+        ans_df = await CodeExecutor(CSVAccessor(str(path)), llm).aexecute(
+            "列出地区", "def analyze(df):\n    return df[['不存在的列']]\n"
+        )
+
+        assert ans_df["地区"].tolist() == ["华东", "华北"]
+        assert "不存在的列" in llm.prompts[0]
+
+    @pytest.mark.asyncio
+    async def test_execute_and_aexecute_exhaust_corrections_alike(self, tmp_path, monkeypatch):
+        """测试同步和异步执行共用纠错流程：纠错次数用完后都返回空结果并记录失败"""
+        monkeypatch.setitem(config.get_config(), 'max_retry_execution_count', 2)
+        monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"地区": ["华东"], "销售额": [1]}).to_csv(path, index=False)
+        bad_code = "def analyze(df):\n    return df[['不存在的列']]\n"
+        bad_reply = f"```python\n{bad_code}```"
+
+        executors = []
+        for run_async in (False, True):
+            executor = CodeExecutor(CSVAccessor(str(path)), FlakyLLM([bad_reply] * 2))
+            if run_async:
+                ans_df = await executor.aexecute("列出地区", bad_code)
+            else:
+                ans_df = executor.execute("列出地区", bad_code)
+            assert ans_df.empty
+            executors.append(executor)
+
+        assert [(e.succeeded, e.correction_count, e.final_code) for e in executors] == [(False, 2, None)] * 2
+        assert all(len(e.llm.prompts) == 2 for e in executors)
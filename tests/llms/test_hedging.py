@@ -0,0 +1,131 @@
+"""
+对冲请求单元测试
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from llms.base_llm import BaseLLM
+from llms.chat_openai import ChatOpenAI
+from llms.hedging import HedgedLLM, LatencyTracker
+from llms.llm_router import Backend, LLMRouter
+from utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+class SlowFirstLLM(BaseLLM):
+    """第一次调用很慢，之后的调用很快的异步LLM，记录被取消的调用"""
+
+    def __init__(self, first_delay=1.0, delay=0.05):
+        super().__init__(model_name='fake')
+        self.first_delay = first_delay
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    def chat(self, prompt, **kwargs):
+        raise NotImplementedError
+
+    async def achat(self, prompt, **kwargs):
+        self.calls += 1
+        call = self.calls
+        try:
+            await asyncio.sleep(self.first_delay if call == 1 else self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"reply {call}"
+
+
+class TestLatencyTracker:
+    """延迟统计测试"""
+
+    def test_quantile(self):
+        """测试分位数按最近的请求计算"""
+        tracker = LatencyTracker(window_size=10)
+        assert tracker.quantile(0.9) is None
+        for latency in range(100):
+            tracker.record(latency)
+        assert len(tracker) == 10
+        assert tracker.quantile(0.9) == 99
+        assert tracker.quantile(0) == 90
+
+
+class TestHedgedLLM:
+    """对冲请求测试"""
+
+    @pytest.mark.asyncio
+    async def test_hedge_slow_request(self):
+        """测试超过阈值时发送对冲请求，取先完成的结果并取消落后的请求"""
+        metrics.reset()
+        inner = SlowFirstLLM()
+        llm = HedgedLLM(inner, initial_delay_seconds=0.1)
+
+        start = time.time()
+        assert await llm.achat_with_retry("问题") == "reply 2"
+        assert time.time() - start < 0.5
+        assert inner.calls == 2
+        assert inner.cancelled == 1
+        assert metrics.get('llm.hedge.hedged') == 1
+        assert metrics.get('llm.hedge.wins') == 1
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_for_fast_request(self):
+        """测试阈值内完成的请求不对冲"""
+        inner = SlowFirstLLM(first_delay=0.05)
+        llm = HedgedLLM(inner, initial_delay_seconds=0.2)
+
+        assert await llm.achat("问题") == "reply 1"
+        assert inner.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_budget(self):
+        """测试对冲额度用完后不再对冲"""
+        metrics.reset()
+        inner = SlowFirstLLM(first_delay=0.3)
+        llm = HedgedLLM(inner, initial_delay_seconds=0.05, max_hedge_ratio=0)
+        llm.budget._tokens = 0
+
+        assert await llm.achat("问题") == "reply 1"
+        assert inner.calls == 1
+        assert metrics.get('llm.hedge.budget_exhausted') == 1
+
+    @pytest.mark.asyncio
+    async def test_adaptive_delay(self):
+        """测试样本足够后阈值取延迟分位数，且不低于下限"""
+        llm = HedgedLLM(SlowFirstLLM(first_delay=0.01, delay=0.01), min_samples=5, initial_delay_seconds=10,
+                        min_delay_seconds=0.001)
+        assert llm.hedge_delay(llm.chat_latency) == 10
+        for _ in range(5):
+            await llm.achat("问题")
+        assert 0.001 <= llm.hedge_delay(llm.chat_latency) < 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_stream_to_alternate_backend(self, mock_openai_servers):
+        """测试流式调用的对冲请求经路由发往另一个后端，取先输出的流"""
+        code = "```python\nx = 1\n```"
+        slow, fast = mock_openai_servers(code), mock_openai_servers(code)
+        slow.delay = 1.0
+        router = LLMRouter([
+            Backend(f'backend{i}', ChatOpenAI(model_name='mock-model', base_url=server.base_url, api_key='test-key'))
+            for i, server in enumerate([slow, fast])
+        ])
+        llm = HedgedLLM(router, initial_delay_seconds=0.1)
+
+        start = time.time()
+        resp = await llm.astream_until("问题", until=lambda text: text.endswith("```"))
+        assert resp == code
+        assert time.time() - start < 0.8
+        assert len(slow.requests) == 1 and len(fast.requests) == 1
+        assert all(backend.in_flight == 0 for backend in router.backends)
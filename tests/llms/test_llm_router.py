@@ -0,0 +1,149 @@
+"""
+多后端LLM路由单元测试
+"""
+
+import time
+
+import openai
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from llms.chat_openai import ChatOpenAI
+from llms.llm_router import Backend, CircuitBreaker, LLMRouter
+from utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+def make_router(*servers, **backend_kwargs) -> LLMRouter:
+    return LLMRouter([
+        Backend(f'backend{i}', ChatOpenAI(model_name='mock-model', base_url=server.base_url, api_key='test-key'),
+                **backend_kwargs)
+        for i, server in enumerate(servers)
+    ])
+
+
+class TestCircuitBreaker:
+    """熔断器测试"""
+
+    def test_open_and_recover(self):
+        """测试连续失败后熔断，冷却期过后放行一个探测请求，成功后恢复"""
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=0.1)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert not breaker.allow()
+
+        time.sleep(0.1)
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.allow()
+
+    def test_probe_failure_reopens(self):
+        """测试探测请求失败后重新熔断"""
+        breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=0.1)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.1)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+
+class TestLLMRouter:
+    """路由测试"""
+
+    def test_prefer_fast_backend(self, mock_openai_servers):
+        """测试每个后端先尝试一次，之后优先选择延迟低的后端"""
+        slow, fast = mock_openai_servers("slow"), mock_openai_servers("fast")
+        slow.delay = 0.2
+        router = make_router(slow, fast)
+
+        assert router.chat_with_retry("问题") == "slow"
+        replies = [router.chat_with_retry("问题") for _ in range(5)]
+
+        assert replies == ["fast"] * 5
+        assert len(slow.requests) == 1
+
+    def test_failover(self, mock_openai_servers):
+        """测试后端失败时在同一次调用中换下一个后端，不经过退避等待"""
+        broken, healthy = mock_openai_servers("broken"), mock_openai_servers("healthy")
+        broken.fail_times = 10
+        router = make_router(broken, healthy)
+
+        start = time.time()
+        assert router.chat_with_retry("问题", error_sleeping_seconds=5) == "healthy"
+        assert time.time() - start < 1
+        assert router.backends[0].error_rate > 0
+
+    def test_circuit_breaker_ejects_backend(self, mock_openai_servers):
+        """测试连续失败的后端被熔断，之后的请求不再发往该后端"""
+        metrics.reset()
+        broken, healthy = mock_openai_servers("broken"), mock_openai_servers("healthy")
+        broken.fail_times = 100
+        # 使故障后端的延迟打分更低，没有熔断时会一直被优先尝试
+        healthy.delay = 0.05
+        router = make_router(broken, healthy, failure_threshold=2, cooldown_seconds=60)
+
+        for _ in range(5):
+            assert router.chat_with_retry("问题") == "healthy"
+
+        assert len(broken.requests) == 2
+        assert router.backends[0].breaker.state == CircuitBreaker.OPEN
+        assert metrics.get('llm.router.circuit_open', backend='backend0') == 1
+
+    def test_request_error_not_failed_over(self, mock_openai_servers):
+        """测试参数错误等请求本身的错误直接抛出，不换后端"""
+        first, second = mock_openai_servers(), mock_openai_servers()
+        first.fail_times = 1
+        first.fail_status = 400
+        router = make_router(first, second)
+
+        with pytest.raises(openai.BadRequestError):
+            router.chat_with_retry("问题")
+        assert len(second.requests) == 0
+
+    def test_all_backends_down(self, mock_openai_servers):
+        """测试全部后端失败时交给退避重试，后端恢复后成功"""
+        first, second = mock_openai_servers("first"), mock_openai_servers("second")
+        first.fail_times = second.fail_times = 1
+        router = make_router(first, second)
+
+        assert router.chat_with_retry("问题", error_sleeping_seconds=0) in ("first", "second")
+        assert len(first.requests) + len(second.requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_async_stream_failover(self, mock_openai_servers):
+        """测试流式调用在输出前失败时换后端"""
+        broken, healthy = mock_openai_servers("broken"), mock_openai_servers("```python\nx = 1\n```")
+        broken.fail_times = 10
+        router = make_router(broken, healthy)
+
+        resp = await router.astream_until("问题", until=lambda text: text.endswith("```"), error_sleeping_seconds=0)
+        assert resp == "```python\nx = 1\n```"
+        assert router.backends[1].latency_ewma is not None
+
+    def test_from_config(self, monkeypatch, mock_openai_servers):
+        """测试按配置创建后端，未开启时返回 None"""
+        server = mock_openai_servers("configured")
+        monkeypatch.setenv('VLLM_API_KEY', 'test-key')
+        monkeypatch.setitem(config.get_config(), 'llm_router', {'enabled': False})
+        assert LLMRouter.from_config() is None
+
+        monkeypatch.setitem(config.get_config(), 'llm_router', {
+            'enabled': True,
+            'backends': [{'name': 'vllm', 'type': 'openai', 'base_url': server.base_url,
+                          'api_key_env': 'VLLM_API_KEY', 'model_name': 'qwen'}],
+        })
+        router = LLMRouter.from_config()
+        assert router.chat("问题") == "configured"
+        assert server.requests[0]['model'] == 'qwen'
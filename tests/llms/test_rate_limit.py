@@ -0,0 +1,108 @@
+"""
+LLM调用重试退避与限流单元测试
+"""
+
+import asyncio
+import random
+import time
+
+import openai
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from llms.chat_openai import ChatOpenAI
+from llms.rate_limiter import LLMRateLimiter, TokenBucket
+from llms.retry_policy import backoff_delay
+from utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+class TestRetryPolicy:
+    """重试策略测试"""
+
+    def test_backoff_delay(self):
+        """测试退避时长随失败次数指数增长、不超过上限，且随机分散"""
+        random.seed(0)
+        delays = [backoff_delay(attempt, 1, 5) for attempt in range(6) for _ in range(50)]
+        assert all(0 <= delay <= 5 for delay in delays)
+        assert all(0.5 <= backoff_delay(0, 1, 5) <= 1 for _ in range(50))
+        assert len(set(delays)) == len(delays)
+        assert backoff_delay(0, 1, 5, retry_after=10) >= 10
+
+    @pytest.mark.asyncio
+    async def test_honour_retry_after(self, mock_openai_server):
+        """测试429时按 retry-after-ms 等待后重试成功"""
+        mock_openai_server.reply = "ok"
+        mock_openai_server.fail_times = 1
+        mock_openai_server.fail_status = 429
+        mock_openai_server.fail_headers = {'retry-after-ms': '300'}
+
+        start = time.time()
+        assert await ChatOpenAI().achat_with_retry("问题", error_sleeping_seconds=0) == "ok"
+        assert time.time() - start >= 0.3
+        assert len(mock_openai_server.requests) == 2
+
+    def test_fail_fast(self, mock_openai_server):
+        """测试参数错误等不可重试的错误直接抛出"""
+        mock_openai_server.fail_times = 3
+        mock_openai_server.fail_status = 400
+
+        with pytest.raises(openai.BadRequestError):
+            ChatOpenAI().chat_with_retry("问题", error_sleeping_seconds=0)
+        assert len(mock_openai_server.requests) == 1
+
+
+class TestRateLimiter:
+    """限流测试"""
+
+    def test_token_bucket(self):
+        """测试令牌用完后按补充速率计算等待时长，且后到的请求等待更久"""
+        bucket = TokenBucket(rate_per_minute=60, capacity=2)
+        assert bucket.reserve(1) == 0
+        assert bucket.reserve(1) == 0
+        assert bucket.reserve(1) == pytest.approx(1, abs=0.05)
+        assert bucket.reserve(1) == pytest.approx(2, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_max_concurrency(self):
+        """测试并发数不超过上限，排队数和等待时长记录到指标"""
+        metrics.reset()
+        limiter = LLMRateLimiter(max_concurrency=2)
+        running, max_running = 0, 0
+
+        async def call():
+            nonlocal running, max_running
+            async with limiter.aacquire(100):
+                running += 1
+                max_running = max(max_running, running)
+                await asyncio.sleep(0.1)
+                running -= 1
+
+        await asyncio.gather(*[call() for _ in range(5)])
+
+        assert max_running == 2
+        assert limiter.queue_depth == 0
+        assert metrics.get('llm.rate_limit.requests') == 5
+        assert metrics.get('llm.rate_limit.wait_seconds') >= 0.2
+
+    def test_requests_per_minute(self, mock_openai_server, monkeypatch):
+        """测试LLM调用经过共享的限流器，超出每分钟请求数时等待"""
+        import llms.rate_limiter as rate_limiter
+        monkeypatch.setattr(rate_limiter, '_rate_limiter', None)
+        monkeypatch.setitem(config.get_config(), 'llm_rate_limit', {'enabled': True, 'requests_per_minute': 120})
+        limiter = rate_limiter.get_rate_limiter()
+        limiter.request_bucket = TokenBucket(rate_per_minute=120, capacity=1)
+        llm = ChatOpenAI()
+
+        start = time.time()
+        llm.chat_with_retry("问题")
+        llm.chat_with_retry("问题")
+        assert time.time() - start >= 0.45
@@ -0,0 +1,106 @@
+"""
+LLM响应缓存单元测试
+"""
+
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from code_generators.python_generator import PythonGenerator
+from data_accessors.csv_accessor import CSVAccessor
+from llms.base_llm import BaseLLM
+from llms.response_cache import LLMResponseCache, make_cache_key
+
+
+class CountingLLM(BaseLLM):
+    """记录调用次数的LLM"""
+
+    def __init__(self):
+        super().__init__(model_name='fake')
+        self.calls = 0
+
+    def chat(self, prompt, **kwargs):
+        self.calls += 1
+        return f"response {self.calls}"
+
+
+@pytest.fixture
+def cache_config(tmp_path, monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {
+        'enabled': True,
+        'path': str(tmp_path / 'llm_responses.sqlite3'),
+        'ttl_seconds': 3600,
+        'max_entries': 100,
+    })
+
+
+class TestResponseCache:
+    """LLM响应缓存测试"""
+
+    def test_key_keeps_timestamps_in_question(self):
+        """测试问题中的时间原样计入缓存key，只有时刻不同的两个问题不共用缓存"""
+        key = make_cache_key('m', '统计 2024-01-01 08:00:00 之后的订单数', {})
+        assert make_cache_key('m', '统计 2024-01-01 17:30:00 之后的订单数', {}) != key
+        assert make_cache_key('m', '统计 2024-01-01 08:00:00 之后的订单数', {}) == key
+        assert make_cache_key('m', '统计 2024-01-01 08:00:00 之后的订单数', {'temperature': 0.5}) != key
+
+    def test_prompt_current_time_is_date(self, tmp_path):
+        """测试代码生成Prompt中的当前时间只精确到日期，同一天内相同的问题得到相同的Prompt"""
+        path = tmp_path / 'sales.csv'
+        pd.DataFrame({'地区': ['华东', '华北'], '销售额': [1, 2]}).to_csv(path, index=False)
+        generator = PythonGenerator(CSVAccessor(str(path)), CountingLLM())
+        prompt = generator.build_prompt('统计 2024-01-01 08:00:00 之后的订单数')
+        assert datetime.now().strftime('%Y-%m-%d') in prompt
+        assert re.search(r'## 当前时间\s+\d{4}-\d{2}-\d{2}\s*\n', prompt)
+        assert '2024-01-01 08:00:00' in prompt
+
+    def test_disabled_by_default(self):
+        """测试默认不开启，不在项目目录下创建缓存文件"""
+        assert LLMResponseCache.from_config() is None
+
+    def test_ttl_and_eviction(self, tmp_path):
+        """测试过期条目不再返回，超出最大条数时淘汰最久未访问的条目"""
+        cache = LLMResponseCache(str(tmp_path / 'cache.sqlite3'), ttl_seconds=0.2, max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        assert cache.get('a') == '1'
+        cache.set('c', '3')
+
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        time.sleep(0.3)
+        assert cache.get('a') is None
+
+    def test_chat_with_cache(self, cache_config):
+        """测试开启缓存的调用命中后不再请求LLM，未开启缓存的调用不受影响，且缓存跨实例有效"""
+        llm = CountingLLM()
+        assert llm.chat_with_retry('问题', use_cache=True) == 'response 1'
+        assert llm.chat_with_retry('问题', use_cache=True) == 'response 1'
+        assert llm.chat_with_retry('问题') == 'response 2'
+        assert CountingLLM().chat_with_retry('问题', use_cache=True) == 'response 1'
+
+        llm.discard_cached_response('问题')
+        assert llm.chat_with_retry('问题', use_cache=True) == 'response 3'
+
+    @pytest.mark.asyncio
+    async def test_achat_with_cache(self, cache_config):
+        """测试异步调用同样使用缓存"""
+        llm = CountingLLM()
+        assert await llm.achat_with_retry('问题', use_cache=True) == 'response 1'
+        assert await llm.achat_with_retry('问题', use_cache=True) == 'response 1'
+        assert llm.calls == 1
+
+    def test_disabled(self, monkeypatch):
+        """测试未开启缓存时 use_cache 不生效"""
+        monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+        llm = CountingLLM()
+        llm.chat_with_retry('问题', use_cache=True)
+        assert llm.chat_with_retry('问题', use_cache=True) == 'response 2'
@@ -0,0 +1,90 @@
+"""
+流式代码生成单元测试
+"""
+
+import time
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+import utils
+from code_generators.python_generator import PythonGenerator
+from data_accessors.csv_accessor import CSVAccessor
+from llms.base_llm import BaseLLM
+from llms.chat_openai import ChatOpenAI
+
+CODE = "def analyze(df):\n    return df"
+REPLY = f"```python\n{CODE}\n```\n\n" + "以上代码按地区分组后汇总销售额，" * 20
+
+
+class ChatOnlyLLM(BaseLLM):
+    """不支持流式输出的LLM"""
+
+    def __init__(self):
+        super().__init__(model_name='fake')
+        self.calls = 0
+
+    def chat(self, prompt, **kwargs):
+        self.calls += 1
+        return REPLY
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+class TestStreamingCode:
+    """流式代码生成测试"""
+
+    def test_find_code_block(self):
+        """测试只在代码块闭合后返回代码，代码块前可以有说明文字，跳过其他语言的代码块"""
+        assert utils.find_code_block("```python\nx = 1\n``") is None
+        assert utils.find_code_block("```python\nx = 1\n```") == "x = 1"
+        assert utils.find_code_block("好的：\n```python\nx = 1\n```\n说明") == "x = 1"
+        assert utils.find_code_block("```json\n{}\n```\n```\ny = 2\n```") == "y = 2"
+        assert utils.find_code_block("```sql\nselect 1\n```", lang='sql') == "select 1"
+
+    @pytest.mark.asyncio
+    async def test_stop_stream_when_code_closes(self, mock_openai_server):
+        """测试代码块闭合后立即返回并关闭流，不等待其后的说明文字"""
+        mock_openai_server.reply = REPLY
+        mock_openai_server.stream_interval = 0.05
+        total_pieces = len(range(0, len(REPLY), 8))
+        llm = ChatOpenAI()
+
+        start = time.time()
+        resp = await llm.astream_until("问题", lambda text: utils.find_code_block(text) is not None)
+        elapsed = time.time() - start
+        time.sleep(0.2)
+
+        assert utils.find_code_block(resp) == CODE
+        assert elapsed < total_pieces * 0.05 / 2
+        assert mock_openai_server.stream_sent_pieces < total_pieces
+
+    def test_sync_stream_until(self, mock_openai_server):
+        """测试同步流式调用同样在代码块闭合后返回"""
+        mock_openai_server.reply = REPLY
+        resp = ChatOpenAI().stream_until("问题", lambda text: utils.find_code_block(text) is not None)
+        assert len(resp) < len(REPLY)
+        assert utils.find_code_block(resp) == CODE
+
+    @pytest.mark.asyncio
+    async def test_fallback_without_streaming(self, tmp_path):
+        """测试不支持流式输出的LLM退化为普通调用"""
+        path = tmp_path / "data.csv"
+        pd.DataFrame({"地区": ["华东"], "销售额": [1]}).to_csv(path, index=False)
+        llm = ChatOnlyLLM()
+        generator = PythonGenerator(CSVAccessor(str(path)), llm)
+        assert not llm.supports_stream and not llm.supports_astream
+        with pytest.raises(NotImplementedError):
+            llm.astream_chat("各地区销售额")
+
+        assert await generator.agenerate_code("各地区销售额") == CODE
+        assert generator.generate_code("各地区销售额") == CODE
+        assert llm.calls == 2
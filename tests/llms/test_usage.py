@@ -0,0 +1,103 @@
+"""
+LLM用量统计单元测试
+"""
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from llms.chat_openai import ChatOpenAI
+from llms.usage import llm_caller, track_request_usage
+from utils.metrics import TOKEN_BUCKETS, metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+    metrics.reset()
+
+
+class TestHistogram:
+    """直方图测试"""
+
+    def test_observe(self):
+        """测试分桶计数和按桶估算的分位数"""
+        for value in [100, 300, 300, 5000, 100000]:
+            metrics.observe('tokens', value, buckets=TOKEN_BUCKETS, caller='a')
+        histogram = metrics.get_histogram('tokens', caller='a')
+
+        assert histogram['count'] == 5
+        assert histogram['max'] == 100000
+        assert histogram['p50'] == 512
+        assert histogram['p99'] == 100000
+        assert histogram['buckets']['<=512'] == 2
+        assert histogram['buckets']['+Inf'] == 1
+        assert metrics.get_histogram('tokens', caller='b') is None
+        assert metrics.snapshot()['tokens']['caller=a']['count'] == 5
+
+
+class TestUsage:
+    """用量统计测试"""
+
+    def test_chat_usage(self, mock_openai_server):
+        """测试非流式调用记录服务端返回的用量和耗时，按调用方区分"""
+        llm = ChatOpenAI()
+        with llm_caller('PythonGenerator'):
+            llm.chat_with_retry("问题")
+
+        assert metrics.get('llm.calls', caller='PythonGenerator', succeeded=True) == 1
+        assert metrics.get_histogram('llm.prompt_tokens', caller='PythonGenerator')['sum'] == 10
+        assert metrics.get_histogram('llm.completion_tokens', caller='PythonGenerator')['sum'] == 5
+        assert metrics.get_histogram('llm.latency_seconds', caller='PythonGenerator')['count'] == 1
+        assert metrics.get_histogram('llm.ttft_seconds', caller='PythonGenerator') is None
+
+    @pytest.mark.asyncio
+    async def test_stream_usage(self, mock_openai_server):
+        """测试流式调用记录首token时间；完整接收时使用服务端返回的用量，提前停止时按本地估算"""
+        mock_openai_server.reply = "```python\nx = 1\n```\n以上代码计算x。" * 3
+        llm = ChatOpenAI()
+        with track_request_usage('test') as request_usage, llm_caller('CodeErrorCorrector'):
+            await llm.astream_until("问题", until=lambda text: False)
+            await llm.astream_until("问题", until=lambda text: '```\n' in text)
+
+        full_call, early_call = request_usage.calls
+        assert not full_call.estimated
+        assert full_call.prompt_tokens == 10
+        assert early_call.estimated
+        assert 0 < early_call.completion_tokens < len(mock_openai_server.reply) // 4
+        assert full_call.ttft_seconds is not None and full_call.ttft_seconds <= full_call.latency_seconds
+        assert metrics.get_histogram('llm.ttft_seconds', caller='CodeErrorCorrector')['count'] == 2
+
+    def test_failed_call(self, mock_openai_server):
+        """测试失败的调用同样记录"""
+        mock_openai_server.fail_times = 1
+        with llm_caller('TableOperationGenerator'):
+            ChatOpenAI().chat_with_retry("问题", error_sleeping_seconds=0)
+
+        assert metrics.get('llm.calls', caller='TableOperationGenerator', succeeded=False) == 1
+        assert metrics.get('llm.calls', caller='TableOperationGenerator', succeeded=True) == 1
+
+    def test_request_summary(self, mock_openai_server, monkeypatch):
+        """测试单次请求内的用量按调用方汇总，并按单价估算费用"""
+        monkeypatch.setitem(config.get_config(), 'llm_usage', {
+            'prices': {'mock-model': {'prompt_per_1k_tokens': 1, 'completion_per_1k_tokens': 2}}
+        })
+        llm = ChatOpenAI()
+        with track_request_usage('test') as request_usage:
+            with llm_caller('PythonGenerator'):
+                llm.chat_with_retry("问题")
+            with llm_caller('CodeErrorCorrector'):
+                llm.chat_with_retry("问题")
+                llm.chat_with_retry("问题")
+        llm.chat_with_retry("问题")
+
+        summary = request_usage.summary()
+        assert summary['calls'] == 3
+        assert summary['prompt_tokens'] == 30
+        assert summary['cost'] == pytest.approx(3 * (10 + 5 * 2) / 1000)
+        assert summary['by_caller']['CodeErrorCorrector']['calls'] == 2
+        assert summary['by_caller']['PythonGenerator']['completion_tokens'] == 5
+        assert metrics.get('llm.calls', caller='unknown', succeeded=True) == 1
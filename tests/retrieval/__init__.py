@@ -0,0 +1 @@
+# 检索模块测试
@@ -0,0 +1,24 @@
+"""
+检索模块测试公共fixture：代码存储和LLM响应缓存都放在临时目录，不写入项目目录
+"""
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_paths(tmp_path, monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'code_reuse', {
+        **config.get_config().get('code_reuse', {}),
+        'path': str(tmp_path / 'code_examples.sqlite3'),
+    })
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {
+        **config.get_config().get('llm_cache', {}),
+        'enabled': False,
+        'path': str(tmp_path / 'llm_responses.sqlite3'),
+    })
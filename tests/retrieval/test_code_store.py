@@ -0,0 +1,151 @@
+"""
+已验证代码复用单元测试
+"""
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from data_accessors.csv_accessor import CSVAccessor
+from retrieval.code_store import CodeStore, schema_fingerprint
+from retrieval.similarity import NgramIndex, normalize_question, question_literals, question_ngrams
+
+CODE = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()\n"
+
+
+@pytest.fixture
+def accessor(tmp_path):
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"地区": ["华东", "华北", "华东"], "销售额": [1, 2, 3]}).to_csv(path, index=False)
+    return CSVAccessor(str(path))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CodeStore(str(tmp_path / "code_examples.sqlite3"), max_examples_per_schema=3)
+
+
+class TestSimilarity:
+    """问题相似度测试"""
+
+    def test_normalize_question(self):
+        """测试不同说法的同一问题归一化后相同"""
+        assert normalize_question("各地区销售额") == normalize_question("按地区统计销售总额")
+        assert normalize_question("每个月的订单数是多少？") == normalize_question("统计每月订单总数")
+
+    def test_question_literals(self, accessor):
+        """测试数字、关键词和数据中的取值作为字面量"""
+        value_index = accessor.get_value_index()
+        assert question_literals("华东地区销售额最高的前3天", value_index) == {"华东", "最高", "前", "3"}
+        assert question_literals("各地区销售额", value_index) == frozenset()
+
+    def test_ngram_index(self):
+        """测试检索结果按相似度排序"""
+        index = NgramIndex()
+        for doc_id, question in enumerate(["地区销售额", "产品利润", "地区利润"]):
+            index.add(doc_id, question_ngrams(question))
+        results = index.search(question_ngrams("地区销售"))
+        assert results[0][0] == 0
+        assert 1 not in [doc_id for doc_id, _ in results]
+
+        index.remove(0)
+        assert 0 not in [doc_id for doc_id, _ in index.search(question_ngrams("地区销售"))]
+        assert len(index) == 2
+
+
+class TestCodeStore:
+    """已验证代码存储测试"""
+
+    def test_reuse_reworded_question(self, accessor, store):
+        """测试说法不同的相同问题复用已保存的代码，且代码可直接执行"""
+        schema_fp = schema_fingerprint(accessor.get_schema_summary())
+        store.add(schema_fp, "各地区销售额", frozenset(), CODE)
+
+        example, score = store.find_reusable(schema_fp, "按地区统计销售总额", frozenset())
+        assert score == 1.0
+        assert accessor.execute(example.code)["销售额"].tolist() == [4, 2]
+
+    def test_reject_different_question(self, accessor, store, tmp_path):
+        """测试扩展的问题、字面量不同的问题和表结构不同时不复用"""
+        schema_fp = schema_fingerprint(accessor.get_schema_summary())
+        store.add(schema_fp, "各地区销售额", frozenset(), CODE)
+        store.add(schema_fp, "华东地区销售额", frozenset({"华东"}), CODE)
+
+        assert store.find_reusable(schema_fp, "各地区销售额占比", frozenset({"占比"})) is None
+        assert store.find_reusable(schema_fp, "各地区平均销售额", frozenset({"平均"})) is None
+        assert store.find_reusable(schema_fp, "华北地区销售额", frozenset({"华北"})) is None
+        other_path = tmp_path / "profit.csv"
+        pd.DataFrame({"地区": ["华东"], "利润": [1.5]}).to_csv(other_path, index=False)
+        other_fp = schema_fingerprint(CSVAccessor(str(other_path)).get_schema_summary())
+        assert store.find_reusable(other_fp, "各地区销售额", frozenset()) is None
+
+    def test_replace_remove_and_evict(self, store):
+        """测试相同问题只保留最新代码，删除后不再命中，超出条数时淘汰最久未使用的条目"""
+        store.add("fp", "各地区销售额", frozenset(), "old")
+        store.add("fp", "按地区统计销售总额", frozenset(), CODE)
+        assert len(store) == 1
+        example, _ = store.find_reusable("fp", "各地区销售额", frozenset())
+        assert example.code == CODE
+
+        store.remove(example)
+        assert store.find_reusable("fp", "各地区销售额", frozenset()) is None
+
+        for question in ["地区销售额", "产品销售额", "月份销售额"]:
+            store.add("fp", question, frozenset(), CODE)
+        store.mark_used(store.find_reusable("fp", "地区销售额", frozenset())[0])
+        store.add("fp", "客户销售额", frozenset(), CODE)
+        assert len(store) == 3
+        assert store.find_reusable("fp", "产品销售额", frozenset()) is None
+        assert store.find_reusable("fp", "地区销售额", frozenset()) is not None
+
+    def test_indexes_updated_incrementally(self, store):
+        """测试增删、替换和淘汰同步更新已加载的索引，不重新读取整张表"""
+        store.add("fp1", "各地区销售额", frozenset(), "code1", columns=["地区", "销售额"])
+        assert [e.code for e, _ in store.search_examples("各地区销售额", ["地区", "销售额"])] == ["code1"]
+        assert store.find_reusable("fp1", "各地区销售额", frozenset()) is not None
+        loaded = {key: value for key, value in store._indexes.items()}
+
+        store.add("fp2", "各地区的销售额", frozenset(), "code2", columns=["地区", "销售额"])
+        store.add("fp1", "按地区统计销售总额", frozenset(), "code1-new", columns=["地区", "销售额"])
+        example, _ = store.find_reusable("fp1", "各地区销售额", frozenset())
+        assert example.code == "code1-new"
+        assert sorted(e.code for e, _ in store.search_examples("各地区销售额", ["地区", "销售额"])) == ["code1-new", "code2"]
+
+        store.remove(example)
+        assert [e.code for e, _ in store.search_examples("各地区销售额", ["地区", "销售额"])] == ["code2"]
+        assert store.find_reusable("fp1", "各地区销售额", frozenset()) is None
+        assert all(store._indexes[key] is value for key, value in loaded.items())
+
+    def test_total_limit(self, tmp_path):
+        """测试所有表结构合计超出条数时淘汰最久未使用的条目，索引同步移除"""
+        store = CodeStore(str(tmp_path / "limited.sqlite3"), max_examples=2)
+        store.add("fp1", "各地区销售额", frozenset(), "code1")
+        assert len(store.search_examples("各地区销售额", [], min_similarity=0)) == 1
+        store.add("fp2", "各产品销售额", frozenset(), "code2")
+        store.add("fp3", "各月份销售额", frozenset(), "code3")
+
+        assert len(store) == 2
+        assert sorted(e.code for e, _ in store.search_examples("销售额", [], min_similarity=0)) == ["code2", "code3"]
+        assert store.find_reusable("fp1", "各地区销售额", frozenset()) is None
+
+
+class TestCodeStoreConfig:
+    """按配置创建存储的测试"""
+
+    def test_disabled_by_default(self):
+        """测试默认不开启，不在项目目录下创建存储文件"""
+        assert CodeStore.from_config() is None
+
+    def test_enabled_with_path(self, tmp_path, monkeypatch):
+        """测试开启后存储文件创建在配置的路径"""
+        monkeypatch.setitem(config.get_config()['code_reuse'], 'enabled', True)
+
+        store = CodeStore.from_config()
+
+        assert store.path == str(tmp_path / "code_examples.sqlite3")
+        store.add("fp", "各地区销售额", frozenset(), CODE)
+        assert os.path.exists(store.path)
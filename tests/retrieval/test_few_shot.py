@@ -0,0 +1,106 @@
+"""
+代码生成参考示例单元测试
+"""
+
+import sqlite3
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import config
+from code_generators.python_generator import PythonGenerator
+from data_accessors.csv_accessor import CSVAccessor
+from llms.base_llm import BaseLLM
+from retrieval.code_store import CodeStore
+from retrieval.few_shot import estimate_retries_avoided, record_generation
+from utils.metrics import metrics
+
+CODE = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()\n"
+
+
+class FixedLLM(BaseLLM):
+    """返回固定代码并记录Prompt的LLM"""
+
+    def __init__(self):
+        super().__init__(model_name='fake')
+        self.prompts = []
+
+    def chat(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return f"```python\n{CODE}```"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CodeStore(str(tmp_path / "code_examples.sqlite3"))
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestFewShot:
+    """参考示例测试"""
+
+    def test_search_examples(self, store):
+        """测试跨表结构检索，问题相似度相同时列名重合度高的示例排在前面，无关问题和得分过低的示例不返回"""
+        store.add("fp1", "各产品销售额", frozenset(), "code1", columns=["产品", "销售额"])
+        store.add("fp2", "各地区销售额", frozenset(), "code2", columns=["地区", "销售额"])
+        store.add("fp2", "员工人数", frozenset(), "code3", columns=["地区", "员工"])
+
+        results = store.search_examples("华东各城市的销售额", ["城市", "地区", "销售额"], min_similarity=0)
+        assert [example.code for example, _ in results] == ["code2", "code1"]
+        assert [example.code for example, _ in store.search_examples("华东各城市的销售额", ["城市"])] == []
+
+    def test_examples_in_prompt(self, tmp_path, store, monkeypatch):
+        """测试检索到的示例放入代码生成的Prompt，没有示例时Prompt中不残留占位符"""
+        monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+        path = tmp_path / "sales.csv"
+        pd.DataFrame({"地区": ["华东", "华北"], "销售额": [1, 2]}).to_csv(path, index=False)
+        accessor = CSVAccessor(str(path))
+        llm = FixedLLM()
+
+        generator = PythonGenerator(accessor, llm, store)
+        generator.generate_code("各地区的销售额")
+        assert generator.example_count == 0
+        assert "{{examples}}" not in llm.prompts[0] and "参考示例" not in llm.prompts[0]
+
+        store.add("fp", "按地区统计销售总额", frozenset(), CODE, columns=["地区", "销售额"])
+        generator.generate_code("各地区的销售额")
+        assert generator.example_count == 1
+        assert "问题：按地区统计销售总额" in llm.prompts[1]
+        assert "groupby('地区'" in llm.prompts[1]
+
+    def test_retries_avoided(self):
+        """测试按带示例与不带示例的平均纠错次数估算避免的重试次数"""
+        record_generation(0, True, 2)
+        record_generation(0, True, 0)
+        record_generation(2, True, 0)
+        record_generation(3, True, 1)
+
+        assert metrics.get('code_gen.requests', few_shot='with') == 2
+        assert metrics.get('code_gen.first_shot_success', few_shot='without') == 1
+        assert estimate_retries_avoided() == pytest.approx(1.0)
+
+    def test_upgrade_existing_store(self, tmp_path):
+        """测试旧版本的存储文件（没有列名字段）自动升级"""
+        path = str(tmp_path / "old.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                'CREATE TABLE code_examples (id INTEGER PRIMARY KEY AUTOINCREMENT, schema_fingerprint TEXT NOT NULL, '
+                'question TEXT NOT NULL, normalized_question TEXT NOT NULL, literals TEXT NOT NULL, code TEXT NOT NULL, '
+                'created_at REAL NOT NULL, used_at REAL NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0)'
+            )
+            conn.execute("INSERT INTO code_examples VALUES (1, 'fp', '地区销售额', '地区销售额', '[]', 'code', 0, 0, 0)")
+        conn.close()
+
+        store = CodeStore(path)
+        example, _ = store.find_reusable('fp', '地区销售额', frozenset())
+        assert example.columns == ()
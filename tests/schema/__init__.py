@@ -0,0 +1 @@
+# 数据摘要模块测试
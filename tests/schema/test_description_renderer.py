@@ -0,0 +1,95 @@
+"""
+数据描述渲染单元测试
+"""
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import utils
+from schema.data_summary import DataSummary
+from schema.description_renderer import DescriptionRenderer
+
+
+@pytest.fixture
+def summary():
+    """50 列、每列 25 个典型取值的摘要"""
+    columns = [f"城市名称{i}" for i in range(50)]
+    return DataSummary(
+        columns=columns,
+        dtypes={col: "string" for col in columns},
+        column_values={col: [f"取值{col}_{j}" for j in range(25)] for col in columns},
+        column_descriptions={},
+        table_description="销售明细",
+        column_min_values={},
+        column_max_values={},
+    )
+
+
+class TestDescriptionRenderer:
+    """DescriptionRenderer 测试"""
+
+    def test_unbounded_render(self, summary):
+        """测试不限预算时输出全部列及 15 个典型取值"""
+        description = DescriptionRenderer().render(summary)
+
+        assert description.startswith("表格描述：销售明细\n")
+        assert description.count("列名：") == 50
+        assert "取值城市名称0_14" in description
+        assert "取值城市名称0_15" not in description
+
+    def test_trim_values_before_collapsing(self, summary):
+        """测试超出预算时先减少典型取值，列仍全部保留"""
+        renderer = DescriptionRenderer()
+        full_tokens = utils.estimate_tokens(renderer.render(summary))
+        description = renderer.render(summary, token_budget=full_tokens // 2)
+
+        assert utils.estimate_tokens(description) <= full_tokens // 2
+        assert description.count("列名：") == 50
+        assert "取值城市名称0_14" not in description
+
+    def test_collapse_low_priority_columns(self, summary):
+        """测试预算很紧时折叠优先级低的列"""
+        detail_columns = ["城市名称3", "城市名称1"] + [c for c in summary.columns if c not in ("城市名称3", "城市名称1")]
+        description = DescriptionRenderer().render(summary, detail_columns=detail_columns, token_budget=600)
+
+        assert utils.estimate_tokens(description) <= 600
+        assert "列名：城市名称3" in description
+        assert "列名：城市名称1" in description
+        assert "城市名称49:string" in description
+
+    def test_truncate_compact_list(self, summary):
+        """测试仅列出列名仍超出预算时截断列清单"""
+        description = DescriptionRenderer().render(summary, token_budget=50)
+        assert "等共50列" in description
+
+    def test_memoized_per_version(self, summary):
+        """测试按版本缓存，更新后重新渲染"""
+        renderer = DescriptionRenderer()
+        first = renderer.render(summary, token_budget=1000)
+        assert renderer.render(summary, token_budget=1000) is first
+
+        summary.table_description = "新的描述"
+        summary.mark_updated()
+        assert "新的描述" in renderer.render(summary, token_budget=1000)
+
+    def test_datetime_notes(self):
+        """测试已解析的日期列提示无需再调用 pd.to_datetime，并给出原始文本格式"""
+        summary = DataSummary(
+            columns=["下单日期", "发货时间"],
+            dtypes={"下单日期": "datetime64[ns]", "发货时间": "datetime64[ns]"},
+            column_values={"下单日期": [], "发货时间": []},
+            column_descriptions={},
+            table_description="",
+            column_min_values={},
+            column_max_values={},
+            semantic_types={"下单日期": "datetime"},
+            datetime_formats={"下单日期": "%Y/%m/%d"},
+        )
+
+        description = DescriptionRenderer().render(summary)
+
+        assert "已由日期文本解析为日期时间类型，无需再调用 pd.to_datetime，原始文本格式为 %Y/%m/%d" in description
+        assert "字段类型：datetime64[ns]（日期时间类型，无需再调用 pd.to_datetime）" in description
@@ -0,0 +1,91 @@
+"""
+MCP服务中输入文件并行加载的单元测试
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import config
+
+
+class FakeContext:
+    """只记录进度汇报的 MCP Context"""
+
+    def __init__(self):
+        self.progress = []
+
+    async def report_progress(self, progress, total=None, message=None):
+        self.progress.append((progress, message))
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # 模块导入时创建LLM实例和代码存储
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENAI_MODEL_NAME', 'test-model')
+    monkeypatch.setitem(config.get_config(), 'code_reuse', {'enabled': False})
+    import pandas_mcp_server
+    return pandas_mcp_server
+
+
+@pytest.fixture
+def tracked_loads(server, monkeypatch):
+    """
+    将加载替换为在 state['barrier'] 处等待其余加载，记录同时进行的加载数；
+    屏障要求的加载没有同时进行时等待超时，抛出 BrokenBarrierError
+    """
+    state = {'running': 0, 'max_running': 0, 'profile_join_keys': [], 'barrier': threading.Barrier(1)}
+    lock = threading.Lock()
+
+    def load_and_profile(path, profile_join_keys=False):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            state['profile_join_keys'].append(profile_join_keys)
+        state['barrier'].wait(timeout=10)
+        with lock:
+            state['running'] -= 1
+        return f"accessor:{path}"
+
+    monkeypatch.setattr(server, 'load_and_profile', load_and_profile)
+    return state
+
+
+class TestLoadDataAccessors:
+    """多个输入文件并行加载测试"""
+
+    def test_inputs_load_in_parallel(self, server, tracked_loads, monkeypatch):
+        """测试多个输入并行加载（4个加载都到达屏障后才能完成），结果顺序与输入一致，每完成一个汇报一次进度"""
+        monkeypatch.setitem(config.get_config(), 'data_load', {'max_parallel_inputs': 4})
+        tracked_loads['barrier'] = threading.Barrier(4)
+        paths = [f"/data/{i}.csv" for i in range(4)]
+        context = FakeContext()
+
+        accessors = asyncio.run(server.load_data_accessors(paths, context, progress_end=0.2))
+
+        assert accessors == [f"accessor:{path}" for path in paths]
+        assert tracked_loads['max_running'] == 4
+        assert tracked_loads['profile_join_keys'] == [True] * 4
+        assert [progress for progress, _ in context.progress] == pytest.approx([0.05, 0.1, 0.15, 0.2])
+        assert context.progress[-1][1].startswith("完成数据加载（4/4）")
+
+    def test_parallelism_is_bounded(self, server, tracked_loads, monkeypatch):
+        """测试同时加载的输入数不超过配置的上限：每2个加载同时进行后一起完成"""
+        monkeypatch.setitem(config.get_config(), 'data_load', {'max_parallel_inputs': 2})
+        tracked_loads['barrier'] = threading.Barrier(2)
+
+        asyncio.run(server.load_data_accessors([f"/data/{i}.csv" for i in range(4)], FakeContext()))
+
+        assert tracked_loads['max_running'] == 2
+
+    def test_single_input_skips_join_keys(self, server, tracked_loads):
+        """测试单个输入不计算关联键签名"""
+        asyncio.run(server.load_data_accessors(["/data/0.csv"], FakeContext()))
+
+        assert tracked_loads['profile_join_keys'] == [False]
@@ -0,0 +1,143 @@
+"""
+多候选并行生成与执行单元测试
+"""
+
+import asyncio
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import config
+from data_accessors.csv_accessor import CSVAccessor
+from llms.base_llm import BaseLLM
+from speculative_executor import SpeculativeExecutor, check_result
+
+GOOD_CODE = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()"
+EMPTY_CODE = "def analyze(df):\n    return df[df['销售额'] > 100]"
+BAD_CODE = "def analyze(df):\n    return df['金额'].sum()"
+# 原地改写数据后仍在执行中，最终报错
+WRITE_CODE = ("def analyze(df):\n    import time\n    df.loc[:, '销售额'] = 0\n"
+              "    time.sleep(0.3)\n    raise ValueError('写入后失败')")
+
+
+class CandidateLLM(BaseLLM):
+    """按 temperature 返回不同代码的流式LLM，可设置每份代码的输出延迟；纠错请求返回 fixed_code"""
+
+    def __init__(self, codes, delays=None, fixed_code=GOOD_CODE):
+        super().__init__(model_name='fake')
+        # {temperature: code}，默认生成参数对应的键为 None
+        self.codes = codes
+        self.delays = delays or {}
+        self.fixed_code = fixed_code
+        self.prompts = []
+        self.cancelled = []
+
+    def chat(self, prompt, **kwargs):
+        raise NotImplementedError
+
+    async def astream_chat(self, prompt, **kwargs):
+        temperature = kwargs.get('temperature')
+        self.prompts.append((prompt, temperature))
+        code = self.fixed_code if '报错' in prompt and temperature is None else self.codes[temperature]
+        try:
+            await asyncio.sleep(self.delays.get(temperature, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(temperature)
+            raise
+        yield f"```python\n{code}\n```"
+
+
+@pytest.fixture
+def accessor(tmp_path):
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"地区": ["华东", "华北", "华东"], "销售额": [1, 2, 3]}).to_csv(path, index=False)
+    return CSVAccessor(str(path))
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+class TestCheckResult:
+    """结果检查测试"""
+
+    def test_check_result(self):
+        assert check_result(pd.DataFrame({'a': [1]})) is None
+        assert check_result(pd.DataFrame({'a': []})) == "结果为空"
+        assert check_result(pd.DataFrame({'a': [None]})) == "结果全为缺失值"
+        assert check_result(pd.DataFrame([[1, 2]], columns=['a', 'a'])) == "结果存在重复的列名：a"
+        assert check_result(pd.DataFrame({'Unnamed: 0': [1], 'a': [2]})) == "结果存在没有列名的列"
+        assert check_result(pd.DataFrame({'': [1]})) == "结果存在没有列名的列"
+        assert check_result(3) is not None
+
+
+class TestSpeculativeExecutor:
+    """多候选执行测试"""
+
+    @pytest.mark.asyncio
+    async def test_first_success_wins(self, accessor):
+        """测试返回最先执行成功的候选，取消仍在生成的候选，不进入纠错"""
+        llm = CandidateLLM({None: BAD_CODE, 0.7: GOOD_CODE, 1.0: GOOD_CODE}, delays={1.0: 2})
+        executor = SpeculativeExecutor(accessor, llm, candidate_count=3, temperatures=[0.7, 1.0])
+
+        ans_df = await asyncio.wait_for(executor.arun("各地区销售额"), timeout=1)
+
+        assert ans_df.set_index('地区')['销售额'].to_dict() == {'华东': 4, '华北': 2}
+        assert executor.winner.index == 1
+        assert executor.succeeded and executor.correction_count == 0
+        assert executor.final_code == GOOD_CODE
+        assert llm.cancelled == [1.0]
+        assert len(llm.prompts) == 3
+
+    @pytest.mark.asyncio
+    async def test_candidates_isolated(self, accessor):
+        """测试候选各自使用数据的副本：一份候选原地改写数值时，同时执行的其他候选和缓存的数据不受影响"""
+        original = accessor.dataframe.copy()
+        llm = CandidateLLM({None: WRITE_CODE, 0.7: GOOD_CODE}, delays={0.7: 0.1})
+        executor = SpeculativeExecutor(accessor, llm, candidate_count=2, temperatures=[0.7])
+
+        ans_df = await executor.arun("各地区销售额")
+
+        assert executor.winner.index == 1
+        assert ans_df.set_index('地区')['销售额'].to_dict() == {'华东': 4, '华北': 2}
+        # 等待改写数据的候选执行结束
+        await asyncio.sleep(0.4)
+        pd.testing.assert_frame_equal(accessor.dataframe, original)
+
+    @pytest.mark.asyncio
+    async def test_prefer_non_empty_result(self, accessor):
+        """测试结果为空的候选不优先采用；所有候选结果都为空时仍返回空结果，不进入纠错"""
+        llm = CandidateLLM({None: EMPTY_CODE, 0.7: GOOD_CODE}, delays={0.7: 0.1})
+        executor = SpeculativeExecutor(accessor, llm, candidate_count=2, temperatures=[0.7])
+        ans_df = await executor.arun("各地区销售额")
+        assert executor.winner.index == 1
+        assert len(ans_df) == 2
+
+        llm = CandidateLLM({None: EMPTY_CODE, 0.7: EMPTY_CODE})
+        executor = SpeculativeExecutor(accessor, llm, candidate_count=2, temperatures=[0.7])
+        ans_df = await executor.arun("销售额大于100的订单")
+        assert executor.succeeded
+        assert ans_df.empty
+        assert len(llm.prompts) == 2
+
+    @pytest.mark.asyncio
+    async def test_all_failed_then_correct(self, accessor, monkeypatch):
+        """测试全部候选失败时带着第一份候选的报错进入纠错"""
+        monkeypatch.setitem(config.get_config(), 'max_retry_execution_count', 3)
+        llm = CandidateLLM({None: BAD_CODE, 0.7: BAD_CODE})
+        executor = SpeculativeExecutor(accessor, llm, candidate_count=2, temperatures=[0.7])
+
+        ans_df = await executor.arun("各地区销售额")
+
+        assert executor.succeeded
+        assert executor.correction_count == 1
+        assert executor.final_code == GOOD_CODE
+        assert len(ans_df) == 2
+        # 两份候选加一次纠错，失败的代码不重复执行
+        assert len(llm.prompts) == 3
+        assert "金额" in llm.prompts[-1][0]
@@ -0,0 +1,223 @@
+"""
+分步流式执行单元测试
+"""
+
+import asyncio
+
+import pytest
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import config
+from data_accessors.csv_accessor import CSVAccessor
+from data_profilers.compaction import compact_dataframe
+from llms.base_llm import BaseLLM
+from stepwise_executor import StepCodeParser, StepwiseExecutor, to_function_code
+
+STEPWISE_REPLY = """```python
+import pandas as pd
+
+# @step: 筛选销售额大于1的订单
+orders = df[df['销售额'] > 1]
+
+# @step: 按地区汇总销售额
+result = orders.groupby('地区', as_index=False)['销售额'].sum()
+```
+以上代码先筛选再汇总。"""
+
+
+class StreamingLLM(BaseLLM):
+    """逐字符流式输出的LLM，第一次调用输出分步代码，之后的调用（纠错）输出纠错后的代码"""
+
+    def __init__(self, reply, fixed_code=None, interval=0.002):
+        super().__init__(model_name='fake')
+        self.reply = reply
+        self.fixed_code = fixed_code
+        self.interval = interval
+        self.sent_chars = 0
+        self.prompts = []
+
+    def chat(self, prompt, **kwargs):
+        raise NotImplementedError
+
+    async def astream_chat(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if len(self.prompts) > 1:
+            yield f"```python\n{self.fixed_code}\n```"
+            return
+        for char in self.reply:
+            await asyncio.sleep(self.interval)
+            self.sent_chars += 1
+            yield char
+
+
+class BrokenStreamLLM(StreamingLLM):
+    """第一次流式调用输出 fail_after 个字符后连接中断，之后的调用输出完整的 analyze 函数"""
+
+    def __init__(self, reply, fixed_code, fail_after=0):
+        super().__init__(reply, fixed_code=fixed_code)
+        self.fail_after = fail_after
+
+    async def astream_chat(self, prompt, **kwargs):
+        if self.prompts:
+            async for piece in super().astream_chat(prompt, **kwargs):
+                yield piece
+            return
+        self.prompts.append(prompt)
+        for char in self.reply[:self.fail_after]:
+            self.sent_chars += 1
+            yield char
+        raise ConnectionError("connection reset")
+
+
+@pytest.fixture
+def accessor(tmp_path):
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"地区": ["华东", "华北", "华东"], "销售额": [1, 2, 3]}).to_csv(path, index=False)
+    return CSVAccessor(str(path))
+
+
+@pytest.fixture(autouse=True)
+def disable_cache(monkeypatch):
+    monkeypatch.setitem(config.get_config(), 'llm_cache', {'enabled': False})
+
+
+class TestStepCodeParser:
+    """步骤解析测试"""
+
+    def test_incremental_parse(self):
+        """测试逐字符接收时，每个步骤在下一个步骤开始或代码块闭合后才返回，且只返回一次"""
+        parser = StepCodeParser()
+        emitted = []
+        for end in range(1, len(STEPWISE_REPLY) + 1):
+            for step in parser.parse(STEPWISE_REPLY[:end]):
+                emitted.append((end, step))
+
+        assert [step.name for _, step in emitted] == ["准备", "筛选销售额大于1的订单", "按地区汇总销售额"]
+        assert emitted[0][1].code == "import pandas as pd"
+        assert emitted[1][0] == STEPWISE_REPLY.index("# @step: 按地区") + len("# @step: 按地区汇总销售额\n")
+        assert emitted[2][0] == STEPWISE_REPLY.index("```\n以上") + 3
+        assert parser.closed
+
+    def test_function_code(self):
+        """测试分步代码包装为 analyze 函数后可由 DataFrameAccessor 执行"""
+        steps = StepCodeParser().parse(STEPWISE_REPLY, final=True)
+        code = to_function_code(steps)
+        assert code.startswith("def analyze(df):\n    import pandas as pd")
+        assert code.endswith("    return result\n")
+
+
+class TestStepwiseExecutor:
+    """分步流式执行测试"""
+
+    @pytest.mark.asyncio
+    async def test_steps_run_while_generating(self, accessor):
+        """测试前面的步骤在LLM输出结束前就已执行，并逐步通知"""
+        llm = StreamingLLM(STEPWISE_REPLY)
+        notified = []
+
+        async def on_step(step):
+            notified.append((step.name, llm.sent_chars))
+
+        executor = StepwiseExecutor(accessor, llm)
+        ans_df = await executor.arun("销售额大于1的订单各地区销售额", on_step=on_step)
+
+        assert executor.succeeded and executor.correction_count == 0
+        assert ans_df.set_index("地区")["销售额"].to_dict() == {"华东": 3, "华北": 2}
+        assert [name for name, _ in notified] == ["准备", "筛选销售额大于1的订单", "按地区汇总销售额"]
+        assert notified[1][1] < len(STEPWISE_REPLY)
+        # 代码块闭合后不再接收其后的说明文字
+        assert llm.sent_chars < len(STEPWISE_REPLY)
+        assert "return result" in executor.final_code
+
+    @pytest.mark.asyncio
+    async def test_failed_step_stops_generation(self, accessor):
+        """测试某一步失败后停止生成，带着报错进入纠错流程"""
+        reply = STEPWISE_REPLY.replace("df['销售额'] > 1", "df['金额'] > 1") + "\n" + "说明" * 200
+        fixed_code = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()"
+        llm = StreamingLLM(reply, fixed_code=fixed_code, interval=0.01)
+
+        executor = StepwiseExecutor(accessor, llm)
+        ans_df = await executor.arun("各地区销售额")
+
+        assert executor.failed_step.name == "筛选销售额大于1的订单"
+        assert llm.sent_chars < reply.index("```\n以上")
+        assert executor.succeeded and executor.correction_count == 1
+        assert executor.final_code == fixed_code
+        assert "金额" in llm.prompts[-1]
+        assert ans_df["销售额"].tolist() == [4, 2]
+
+    @pytest.mark.asyncio
+    async def test_failed_step_after_value_write(self, accessor):
+        """测试前一步原地改写数值、后一步失败时，纠错在未被改写的数据上执行，缓存的数据不受影响"""
+        original = accessor.dataframe.copy()
+        reply = """```python
+# @step: 销售额换算为元
+df.loc[:, '销售额'] = df['销售额'] * 10
+
+# @step: 按地区汇总销售额
+result = df.groupby('地区', as_index=False)['金额'].sum()
+```"""
+        fixed_code = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()"
+        llm = StreamingLLM(reply, fixed_code=fixed_code)
+
+        executor = StepwiseExecutor(accessor, llm)
+        ans_df = await executor.arun("各地区销售额")
+
+        assert executor.failed_step.name == "按地区汇总销售额"
+        assert executor.succeeded and executor.correction_count == 1
+        assert ans_df["销售额"].tolist() == [4, 2]
+        pd.testing.assert_frame_equal(accessor.dataframe, original)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fail_after, notified_steps", [
+        (0, []),
+        (STEPWISE_REPLY.index("# @step: 按地区") + len("# @step: 按地区汇总销售额\n"), ["准备", "筛选销售额大于1的订单"]),
+    ])
+    async def test_stream_failure_falls_back(self, accessor, fail_after, notified_steps):
+        """测试流式调用失败时（无论是否已开始执行步骤）改为一次性生成完整代码后执行，不使请求失败"""
+        fixed_code = "def analyze(df):\n    return df.groupby('地区', as_index=False)['销售额'].sum()"
+        llm = BrokenStreamLLM(STEPWISE_REPLY, fixed_code, fail_after=fail_after)
+        notified = []
+
+        async def on_step(step):
+            notified.append(step.name)
+
+        executor = StepwiseExecutor(accessor, llm)
+        ans_df = await executor.arun("各地区销售额", on_step=on_step)
+
+        assert notified == notified_steps
+        assert executor.succeeded and executor.correction_count == 0
+        assert executor.final_code == fixed_code
+        assert ans_df["销售额"].tolist() == [4, 2]
+        # 退化后使用普通的代码生成Prompt
+        assert llm.prompts[1] != llm.prompts[0]
+
+    @pytest.mark.asyncio
+    async def test_restore_dtypes_on_compacted_data(self, tmp_path):
+        """测试步骤在紧凑类型数据上因类型不兼容失败时，还原原始类型重新执行已执行的步骤后继续"""
+        path = tmp_path / "sales.csv"
+        df = pd.DataFrame({"地区": ["华东", "华北", "华东"] * 20, "销售额": range(60)})
+        df.to_csv(path, index=False)
+        compacted, _ = compact_dataframe(df)
+        assert compacted["地区"].dtype == "category"
+        reply = """```python
+# @step: 地区加上后缀
+df['地区'] = df['地区'] + '区'
+
+# @step: 按地区汇总销售额
+result = df.groupby('地区', as_index=False)['销售额'].sum()
+```"""
+        llm = StreamingLLM(reply)
+
+        executor = StepwiseExecutor(CSVAccessor(str(path), df=compacted), llm)
+        ans_df = await executor.arun("各地区销售额")
+
+        assert executor.dtypes_restored
+        assert executor.succeeded and executor.correction_count == 0
+        assert ans_df.set_index("地区")["销售额"].to_dict() == {"华东区": df[df["地区"] == "华东"]["销售额"].sum(),
+                                                              "华北区": df[df["地区"] == "华北"]["销售额"].sum()}
+        assert len(llm.prompts) == 1
@@ -0,0 +1,50 @@
+"""
+表格转换代码执行单元测试
+"""
+
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_accessors.csv_accessor import CSVAccessor
+from data_profilers.compaction import compact_dataframe
+from table_operation_executor import TableOperationExecutor
+
+
+class TestExecuteCode:
+    """转换代码执行测试"""
+
+    def test_compacted_input_restored(self, tmp_path):
+        """测试转换代码在紧凑类型的输入上直接使用原始类型执行，写出文件等副作用只执行一次，输出不带紧凑类型"""
+        path = tmp_path / "data.csv"
+        df = pd.DataFrame({"地区": ["北京", "上海"] * 50, "销售额": range(100)})
+        df.to_csv(path, index=False)
+        compacted, _ = compact_dataframe(df)
+        assert compacted["地区"].dtype == "category"
+        accessor = CSVAccessor(str(path), df=compacted)
+        executor = TableOperationExecutor([accessor])
+        log_path = tmp_path / "calls.log"
+        output_path = tmp_path / "out.csv"
+        code = f"""
+def operation(dfs, input_paths, output_path):
+    with open({str(log_path)!r}, 'a') as f:
+        f.write('x')
+    df = dfs[0]
+    df['地区'] = df['地区'] + '市'
+    df.to_csv(output_path, index=False)
+    return df, '地区加上市'
+"""
+        result_df, operation_desc = executor._execute_code(code, [str(path)], str(output_path))
+
+        assert log_path.read_text() == "x"
+        assert operation_desc == "地区加上市"
+        assert result_df["地区"].dtype == object
+        assert result_df["销售额"].dtype == "int64"
+        written = pd.read_csv(output_path)
+        assert written["地区"].tolist()[:2] == ["北京市", "上海市"]
+        assert written["销售额"].tolist() == list(range(100))
+        # 缓存的数据不受转换代码修改的影响
+        assert accessor.dataframe["地区"].dtype == "category"
+        assert accessor.dataframe["地区"].tolist()[:2] == ["北京", "上海"]